@@ -0,0 +1,303 @@
+"""
+Pre-aggregated order analytics for the admin dashboard.
+
+One rollup document per calendar day (in ANALYTICS_TIMEZONE) lives in `analytics_daily`:
+
+    orders, status.<status>           orders created that day, by their current status
+    paid_orders, revenue, discount,   payments received that day (paid_at, else created_at)
+    items_sold, products.<id>, coupons.<code>
+    cancelled_orders, cancelled_revenue   of those paid orders, the ones later cancelled
+
+Checkout, the payment webhook and status updates apply small $inc deltas as they happen,
+so dashboard reads touch one document per day instead of every order. backfill()
+rebuilds the documents from the orders collection with aggregation pipelines.
+"""
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from pymongo import DeleteMany, ReplaceOne
+
+PAID = "Paid"
+CANCELLED = "Cancelled"
+
+
+def field_key(value):
+    """Makes a status/coupon/product value safe to use as a Mongo field name."""
+    return str(value).replace(".", "_").replace("$", "_") or "_"
+
+
+def order_items_revenue(item):
+    return float(item.get("price", 0) or 0) * int(item.get("quantity", 0) or 0)
+
+
+class OrderAnalytics:
+    def __init__(self, collection, orders_collection, tz_name="UTC"):
+        self.collection = collection
+        self.orders_collection = orders_collection
+        self.tz_name = tz_name
+        self.tz = ZoneInfo(tz_name)
+
+    # --- Day buckets ---
+
+    def day_of(self, moment):
+        if moment is None:
+            moment = datetime.now(timezone.utc)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.astimezone(self.tz).strftime("%Y-%m-%d")
+
+    def _paid_day(self, order):
+        return self.day_of(order.get("paid_at") or order.get("created_at"))
+
+    def _inc(self, day, deltas, labels=None):
+        update = {}
+        deltas = {field: value for field, value in deltas.items() if value}
+        if deltas:
+            update["$inc"] = deltas
+        if labels:
+            update["$set"] = labels
+        if update:
+            self.collection.update_one({"_id": day}, update, upsert=True)
+
+    # --- Incremental updates ---
+
+    def order_created(self, order):
+        """Counts a new order under its creation day and current status."""
+        self._inc(self.day_of(order.get("created_at")), {
+            "orders": 1,
+            f"status.{field_key(order.get('status') or 'Pending')}": 1,
+        })
+
+    def order_paid(self, order):
+        """Adds a paid order's revenue, items and coupon use to its payment day. Call once per order."""
+        deltas = {
+            "paid_orders": 1,
+            "revenue": float(order.get("total_amount", 0) or 0),
+            "discount": float(order.get("discount_amount", 0) or 0),
+        }
+        for item in order.get("items") or []:
+            quantity = int(item.get("quantity", 0) or 0)
+            key = f"products.{field_key(item.get('_id'))}"
+            deltas["items_sold"] = deltas.get("items_sold", 0) + quantity
+            deltas[f"{key}.quantity"] = deltas.get(f"{key}.quantity", 0) + quantity
+            deltas[f"{key}.revenue"] = deltas.get(f"{key}.revenue", 0) + order_items_revenue(item)
+        if order.get("coupon_code"):
+            key = f"coupons.{field_key(order['coupon_code'])}"
+            deltas[f"{key}.redemptions"] = 1
+            deltas[f"{key}.discount"] = float(order.get("discount_amount", 0) or 0)
+        # Product names are kept alongside the counters for the top-products view.
+        names = {
+            f"products.{field_key(item.get('_id'))}.name": item.get("name")
+            for item in order.get("items") or [] if item.get("name")
+        }
+        self._inc(self._paid_day(order), deltas, labels=names)
+
+    def cancelled_order_paid(self, order):
+        """
+        Books a payment that arrived after the order was cancelled: it counts as paid and, as
+        backfill() would count it, as cancelled revenue. The status counters do not change.
+        """
+        self.order_paid(order)
+        total = float(order.get("total_amount", 0) or 0)
+        self._inc(self._paid_day(order), {"cancelled_orders": 1, "cancelled_revenue": total})
+
+    def status_changed(self, order, old_status, new_status):
+        """Moves an order between status counters; cancelling a paid order also books it as cancelled revenue."""
+        self.statuses_changed([(order, old_status, new_status)])
+
+    def statuses_changed(self, changes):
+        """Batch form of status_changed for (order, old_status, new_status) tuples: one update per affected day."""
+        per_day = {}
+
+        def add(day, field, value):
+            deltas = per_day.setdefault(day, {})
+            deltas[field] = deltas.get(field, 0) + value
+
+        for order, old_status, new_status in changes:
+            if not old_status or old_status == new_status:
+                continue
+            created_day = self.day_of(order.get("created_at"))
+            add(created_day, f"status.{field_key(old_status)}", -1)
+            add(created_day, f"status.{field_key(new_status)}", 1)
+            if order.get("payment_status") != PAID or CANCELLED not in (old_status, new_status):
+                continue
+            sign = 1 if new_status == CANCELLED else -1
+            add(self._paid_day(order), "cancelled_orders", sign)
+            add(self._paid_day(order), "cancelled_revenue", sign * float(order.get("total_amount", 0) or 0))
+
+        for day, deltas in per_day.items():
+            self._inc(day, deltas)
+
+    # --- Reads ---
+
+    def days(self, start, end):
+        """Rollup documents for start..end (YYYY-MM-DD strings, inclusive), oldest first."""
+        return list(self.collection.find({"_id": {"$gte": start, "$lte": end}}).sort("_id", 1))
+
+    def summary(self, start, end):
+        totals = {"orders": 0, "paid_orders": 0, "revenue": 0.0, "discount": 0.0, "items_sold": 0,
+                  "cancelled_orders": 0, "cancelled_revenue": 0.0}
+        statuses = {}
+        for day in self.days(start, end):
+            for field in totals:
+                totals[field] += day.get(field, 0) or 0
+            for status, count in (day.get("status") or {}).items():
+                statuses[status] = statuses.get(status, 0) + count
+        kept_orders = totals["paid_orders"] - totals["cancelled_orders"]
+        net_revenue = totals["revenue"] - totals["cancelled_revenue"]
+        return {
+            "start": start,
+            "end": end,
+            **{field: round(value, 2) if isinstance(value, float) else value for field, value in totals.items()},
+            "net_revenue": round(net_revenue, 2),
+            "average_order_value": round(net_revenue / kept_orders, 2) if kept_orders > 0 else 0.0,
+            "orders_by_status": {status: count for status, count in statuses.items() if count},
+        }
+
+    def revenue_by_day(self, start, end):
+        """One entry per day in the range, including days without orders."""
+        by_day = {day["_id"]: day for day in self.days(start, end)}
+        series = []
+        current, last = datetime.strptime(start, "%Y-%m-%d"), datetime.strptime(end, "%Y-%m-%d")
+        while current <= last:
+            key = current.strftime("%Y-%m-%d")
+            day = by_day.get(key, {})
+            paid = day.get("paid_orders", 0)
+            net = day.get("revenue", 0) - day.get("cancelled_revenue", 0)
+            kept = paid - day.get("cancelled_orders", 0)
+            series.append({
+                "date": key,
+                "orders": day.get("orders", 0),
+                "paid_orders": paid,
+                "revenue": round(day.get("revenue", 0), 2),
+                "net_revenue": round(net, 2),
+                "average_order_value": round(net / kept, 2) if kept > 0 else 0.0,
+            })
+            current += timedelta(days=1)
+        return series
+
+    def top_products(self, start, end, limit=10, by="quantity"):
+        products = {}
+        for day in self.days(start, end):
+            for product_id, stats in (day.get("products") or {}).items():
+                entry = products.setdefault(product_id, {"product_id": product_id, "name": None, "quantity": 0, "revenue": 0.0})
+                entry["name"] = stats.get("name") or entry["name"]
+                entry["quantity"] += stats.get("quantity", 0)
+                entry["revenue"] += stats.get("revenue", 0)
+        ranked = sorted(products.values(), key=lambda p: (-p[by], -p["revenue"], p["product_id"]))[:limit]
+        for entry in ranked:
+            entry["revenue"] = round(entry["revenue"], 2)
+        return ranked
+
+    def coupon_redemptions(self, start, end):
+        coupons = {}
+        for day in self.days(start, end):
+            for code, stats in (day.get("coupons") or {}).items():
+                entry = coupons.setdefault(code, {"code": code, "redemptions": 0, "discount": 0.0})
+                entry["redemptions"] += stats.get("redemptions", 0)
+                entry["discount"] += stats.get("discount", 0)
+        ranked = sorted(coupons.values(), key=lambda c: (-c["redemptions"], c["code"]))
+        for entry in ranked:
+            entry["discount"] = round(entry["discount"], 2)
+        return ranked
+
+    # --- Backfill ---
+
+    def _day_expression(self, date_field):
+        expression = {"format": "%Y-%m-%d", "date": date_field}
+        if self.tz_name != "UTC":
+            expression["timezone"] = self.tz_name
+        return {"$dateToString": expression}
+
+    def _range_match(self, field, start, end):
+        """created_at/paid_at bounds for start..end in the rollup timezone (None = unbounded)."""
+        bounds = {}
+        if start:
+            bounds["$gte"] = datetime.combine(datetime.strptime(start, "%Y-%m-%d").date(), time.min, self.tz).astimezone(timezone.utc)
+        if end:
+            next_day = datetime.strptime(end, "%Y-%m-%d").date() + timedelta(days=1)
+            bounds["$lt"] = datetime.combine(next_day, time.min, self.tz).astimezone(timezone.utc)
+        return {field: bounds} if bounds else {}
+
+    def backfill(self, start=None, end=None):
+        """
+        Recomputes the rollups for start..end (whole history by default) from the orders
+        collection. Run it while checkout traffic is quiet: increments applied between the
+        aggregation and the write are overwritten. Returns the number of days written.
+        """
+        paid_at = {"$ifNull": ["$paid_at", "$created_at"]}
+        paid_match = {"payment_status": PAID}
+        docs = {}
+
+        def day(key):
+            return docs.setdefault(key, {"_id": key, "orders": 0, "status": {}, "paid_orders": 0, "revenue": 0.0,
+                                         "discount": 0.0, "items_sold": 0, "cancelled_orders": 0,
+                                         "cancelled_revenue": 0.0, "products": {}, "coupons": {}})
+
+        for row in self.orders_collection.aggregate([
+            {"$match": self._range_match("created_at", start, end)},
+            {"$group": {"_id": {"day": self._day_expression("$created_at"), "status": "$status"}, "count": {"$sum": 1}}},
+        ], allowDiskUse=True):
+            doc = day(row["_id"]["day"])
+            doc["orders"] += row["count"]
+            status = field_key(row["_id"].get("status") or "Pending")
+            doc["status"][status] = doc["status"].get(status, 0) + row["count"]
+
+        paid_stage = [
+            {"$addFields": {"analytics_paid_at": paid_at}},
+            {"$match": {**paid_match, **self._range_match("analytics_paid_at", start, end)}},
+            {"$addFields": {"analytics_day": self._day_expression("$analytics_paid_at")}},
+        ]
+        for row in self.orders_collection.aggregate(paid_stage + [
+            {"$group": {
+                "_id": "$analytics_day",
+                "paid_orders": {"$sum": 1},
+                "revenue": {"$sum": "$total_amount"},
+                "discount": {"$sum": {"$ifNull": ["$discount_amount", 0]}},
+                "cancelled_orders": {"$sum": {"$cond": [{"$eq": ["$status", CANCELLED]}, 1, 0]}},
+                "cancelled_revenue": {"$sum": {"$cond": [{"$eq": ["$status", CANCELLED]}, "$total_amount", 0]}},
+            }},
+        ], allowDiskUse=True):
+            doc = day(row["_id"])
+            for field in ("paid_orders", "revenue", "discount", "cancelled_orders", "cancelled_revenue"):
+                doc[field] = row[field]
+
+        for row in self.orders_collection.aggregate(paid_stage + [
+            {"$unwind": "$items"},
+            {"$group": {
+                "_id": {"day": "$analytics_day", "product": "$items._id"},
+                "name": {"$last": "$items.name"},
+                "quantity": {"$sum": "$items.quantity"},
+                "revenue": {"$sum": {"$multiply": ["$items.price", "$items.quantity"]}},
+            }},
+        ], allowDiskUse=True):
+            doc = day(row["_id"]["day"])
+            doc["items_sold"] += row["quantity"]
+            doc["products"][field_key(row["_id"]["product"])] = {
+                "name": row["name"], "quantity": row["quantity"], "revenue": row["revenue"],
+            }
+
+        for row in self.orders_collection.aggregate(paid_stage + [
+            {"$match": {"coupon_code": {"$nin": [None, ""]}}},
+            {"$group": {
+                "_id": {"day": "$analytics_day", "code": "$coupon_code"},
+                "redemptions": {"$sum": 1},
+                "discount": {"$sum": {"$ifNull": ["$discount_amount", 0]}},
+            }},
+        ], allowDiskUse=True):
+            day(row["_id"]["day"])["coupons"][field_key(row["_id"]["code"])] = {
+                "redemptions": row["redemptions"], "discount": row["discount"],
+            }
+
+        # Days in the range that no longer have any orders are removed.
+        stale = {"_id": {}}
+        if start:
+            stale["_id"]["$gte"] = start
+        if end:
+            stale["_id"]["$lte"] = end
+        if docs:
+            stale["_id"]["$nin"] = list(docs)
+        operations = [DeleteMany(stale if stale["_id"] else {})]
+        operations += [ReplaceOne({"_id": key}, doc, upsert=True) for key, doc in docs.items()]
+        self.collection.bulk_write(operations, ordered=True)
+        return len(docs)
@@ -1,23 +1,35 @@
 import os
-import smtplib
-import random
-import string
 import hmac
 import hashlib
-import razorpay
+import base64
+import functools
+import json
 from datetime import datetime, timedelta, timezone
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from flask import Flask, jsonify, request
-from pymongo import MongoClient
+from flask import Flask, abort, jsonify, request, send_from_directory, stream_with_context
+from pymongo import ReturnDocument, UpdateOne
 from flask_cors import CORS
 from flask_jwt_extended import create_access_token, get_jwt_identity, jwt_required, JWTManager
 from bson.objectid import ObjectId
 from dotenv import load_dotenv
 import logging
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
+import click
+import threading
+import time
+from catalog_cache import CatalogCache, ListingCache, catalog_key
+from coupon_cache import CouponIndex
+from analytics import OrderAnalytics
+from db import connection_report, get_client, lazy_collection, resolve_read_profile
+from idempotency import MAX_KEY_LENGTH, IdempotencyStore, SequenceGenerator, request_fingerprint
+from images import CloudinaryStorage, LocalStorage
+from jobs import JobQueue
+from mailer import MailDispatcher, SMTPConnection
+from order_status import CANCELLED, SHIPPED, StatusNotifier, transition_error
+from otp_store import OTPStore
+from payments import CircuitBreaker, FakePaymentProvider, PaymentProviderError, RazorpayProvider
+from pricing import PricingEngine, QuoteError, parse_shipping_rules
+from ratelimit import RateLimiter
+from search_index import FACET_FIELDS, ProductSearchIndex, TRENDING_VALUES, parse_search_args
+from metrics import external_call, install_mongo_listener, registry as metrics_registry
 
 # --- CONFIGURATION ---
 load_dotenv()
@@ -31,15 +43,85 @@ RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
 RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET")
 # When set to "true" (case-insensitive), the backend will bypass Razorpay and mark orders as paid for testing.
 SKIP_PAYMENT = os.getenv("SKIP_PAYMENT", "false").lower() == "true"
+# Payment links: "razorpay", or "fake" (links issued locally, for development and tests).
+PAYMENT_PROVIDER = os.getenv("PAYMENT_PROVIDER", "razorpay").lower()
+# When "true", checkout returns as soon as the order is stored and a background job creates the
+# payment link, which the client polls for at /api/orders/<order_id>/payment-link.
+PAYMENT_LINK_ASYNC = os.getenv("PAYMENT_LINK_ASYNC", "false").lower() == "true"
+# Longest a payment-link poll may hold the request (seconds) when it passes ?wait=.
+PAYMENT_LINK_MAX_WAIT = float(os.getenv("PAYMENT_LINK_MAX_WAIT", "10"))
+# Razorpay HTTP timeouts (seconds) and connection pool size.
+RAZORPAY_CONNECT_TIMEOUT = float(os.getenv("RAZORPAY_CONNECT_TIMEOUT", "3.05"))
+RAZORPAY_READ_TIMEOUT = float(os.getenv("RAZORPAY_READ_TIMEOUT", "10"))
+RAZORPAY_POOL_SIZE = int(os.getenv("RAZORPAY_POOL_SIZE", "10"))
+# After this many consecutive provider failures, checkout stops calling it for PAYMENT_BREAKER_RESET_SECONDS.
+PAYMENT_BREAKER_FAILURES = int(os.getenv("PAYMENT_BREAKER_FAILURES", "5"))
+PAYMENT_BREAKER_RESET_SECONDS = float(os.getenv("PAYMENT_BREAKER_RESET_SECONDS", "30"))
+# OTP, contact and testimonial endpoints answer 429 past RATE_LIMITS; "false" turns the limits off.
+RATE_LIMITS_ENABLED = os.getenv("RATE_LIMITS_ENABLED", "true").lower() == "true"
+# Reverse proxies in front of the app whose X-Forwarded-For entry is trusted as the client IP (Vercel: 1).
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "1"))
+# Checkout responses are replayed for a repeated Idempotency-Key for this many hours.
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASS = os.getenv("EMAIL_PASS")
 CONTACT_EMAIL = os.getenv("CONTACT_EMAIL")
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
+# When "false", emails are sent inline on the request thread instead of through the background queue.
+EMAIL_ASYNC = os.getenv("EMAIL_ASYNC", "true").lower() == "true"
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_QUEUE_SIZE = int(os.getenv("EMAIL_QUEUE_SIZE", "500"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+# Order status emails wait this long (seconds) so that several updates to one order become one email.
+ORDER_EMAIL_COALESCE_SECONDS = float(os.getenv("ORDER_EMAIL_COALESCE_SECONDS", "60"))
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 SECRET_KEY = os.getenv("SECRET_KEY")
 ADMIN_KEY = os.getenv("ADMIN_KEY")
 CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
 CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
 CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
+# Product images: "cloudinary", or "local" (files under IMAGE_LOCAL_DIR served from /api/media, for development).
+IMAGE_STORAGE = os.getenv("IMAGE_STORAGE", "cloudinary").lower()
+IMAGE_LOCAL_DIR = os.getenv("IMAGE_LOCAL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "media"))
+IMAGE_LOCAL_BASE_URL = os.getenv("IMAGE_LOCAL_BASE_URL", "/api/media")
+IMAGE_MAX_FILES = int(os.getenv("IMAGE_MAX_FILES", "8"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+# Storefront catalog cache: number of filter combinations kept and max age (seconds) of each listing.
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "64"))
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "60"))
+# After a product or testimonial write in this process, listings are reloaded from the primary for this
+# long (seconds) instead of a secondary that may not have the write yet. Defaults to the browse profile's
+# max staleness (90 seconds when it sets no bound).
+_browse_staleness = resolve_read_profile("browse")[1]
+CATALOG_FRESH_READ_SECONDS = float(os.getenv("CATALOG_FRESH_READ_SECONDS") or (_browse_staleness if _browse_staleness > 0 else 90))
+# Stock reserved by a pending order is held this long before returning to available stock.
+STOCK_HOLD_MINUTES = int(os.getenv("STOCK_HOLD_MINUTES", "30"))
+STOCK_HOLD_SWEEP_SECONDS = int(os.getenv("STOCK_HOLD_SWEEP_SECONDS", "60"))
+STOCK_HOLD_RETENTION_DAYS = 7
+# Staged uploads left behind by a dead image job are purged after this many days.
+IMAGE_UPLOAD_RETENTION_DAYS = 7
+# Coupons are validated from an in-process index reloaded at most this often (seconds).
+COUPON_CACHE_TTL = float(os.getenv("COUPON_CACHE_TTL", "30"))
+# Shipping fee shown as the list price, and JSON rules [{"min_subtotal": ..., "fee": ...}] setting the fee
+# actually charged (the rule with the highest min_subtotal not above the discounted subtotal wins).
+SHIPPING_FEE_BASE = float(os.getenv("SHIPPING_FEE_BASE", "60"))
+SHIPPING_RULES = parse_shipping_rules(os.getenv("SHIPPING_RULES", '[{"min_subtotal": 0, "fee": 0}]'))
+# Priced cart lines served by /api/cart/quote are reused for at most this long (seconds).
+QUOTE_CACHE_TTL = float(os.getenv("QUOTE_CACHE_TTL", "30"))
+# Product search is served from an in-memory index rebuilt at most this often (seconds);
+# set SEARCH_INDEX_ENABLED=false to query the Mongo text index instead.
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "true").lower() == "true"
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", "300"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+# Requests slower than this (milliseconds) are logged with their Mongo/external time; 0 disables the log.
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+# Dashboard analytics are bucketed into calendar days in this timezone (IANA name).
+ANALYTICS_TIMEZONE = os.getenv("ANALYTICS_TIMEZONE", "Asia/Kolkata")
+# Bearer token for Prometheus scrapes of /api/metrics (the admin key is accepted as well).
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 
 # --- App Configuration ---
@@ -47,60 +129,249 @@ app.config["JWT_SECRET_KEY"] = SECRET_KEY
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=12)
 
 # --- Initialize Extensions ---
-CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
-jwt = JWTManager(app)
-razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
-
-# -- Cloudinary --
-cloudinary.config(
-    cloud_name=CLOUDINARY_CLOUD_NAME,
-    api_key=CLOUDINARY_API_KEY,
-    api_secret=CLOUDINARY_API_SECRET,
-    secure=True,
+CORS(
+    app,
+    resources={r"/api/*": {"origins": "*"}},
+    supports_credentials=True,
+    expose_headers=["X-Next-Cursor", "Retry-After", "Idempotent-Replayed"],
 )
+jwt = JWTManager(app)
 
+# Third-party SDKs are imported and configured on first use to keep cold starts short.
+payment_provider = None
+_cloudinary_uploader = None
+
+def get_payment_provider():
+    """Returns the configured payment-link provider (see payments.py), creating it on first use."""
+    global payment_provider
+    if payment_provider is None:
+        breaker = CircuitBreaker(PAYMENT_BREAKER_FAILURES, PAYMENT_BREAKER_RESET_SECONDS)
+        if PAYMENT_PROVIDER == "fake":
+            payment_provider = FakePaymentProvider(breaker=breaker)
+        else:
+            payment_provider = RazorpayProvider(
+                RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET,
+                connect_timeout=RAZORPAY_CONNECT_TIMEOUT,
+                read_timeout=RAZORPAY_READ_TIMEOUT,
+                pool_size=RAZORPAY_POOL_SIZE,
+                breaker=breaker,
+            )
+    return payment_provider
+
+def payments_enabled():
+    """False in testing mode: SKIP_PAYMENT, or Razorpay selected without keys."""
+    if SKIP_PAYMENT:
+        return False
+    return PAYMENT_PROVIDER == "fake" or bool(RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET)
+
+def get_cloudinary_uploader():
+    """Returns cloudinary.uploader, configuring Cloudinary on first use."""
+    global _cloudinary_uploader
+    if _cloudinary_uploader is None:
+        import cloudinary
+        import cloudinary.uploader
+        cloudinary.config(
+            cloud_name=CLOUDINARY_CLOUD_NAME,
+            api_key=CLOUDINARY_API_KEY,
+            api_secret=CLOUDINARY_API_SECRET,
+            secure=True,
+        )
+        _cloudinary_uploader = cloudinary.uploader
+    return _cloudinary_uploader
+
+_image_storage = None
+
+def get_image_storage():
+    """Returns the configured product image storage backend (see images.py)."""
+    global _image_storage
+    if _image_storage is None:
+        if IMAGE_STORAGE == "local":
+            _image_storage = LocalStorage(IMAGE_LOCAL_DIR, IMAGE_LOCAL_BASE_URL)
+        else:
+            _image_storage = CloudinaryStorage(get_cloudinary_uploader)
+    return _image_storage
 
 
 # --- Logging ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-SHIPPING_FEE_BASE = 60.0
-SHIPPING_FEE_APPLIED = 0.0
-
-# --- Database Setup (Robust Version) ---
-try:
-    # Connect to Main DB (Products, Coupons, etc.)
-    client_main = MongoClient(MONGO_URI_MAIN)
-    db_main = client_main.get_default_database()
-    products_collection = db_main.products
-    testimonials_collection = db_main.testimonials
-    coupons_collection = db_main.coupons
-
-    # Connect to Orders DB (Users, Orders)
-    client_orders = MongoClient(MONGO_URI_ORDERS)
-    db_orders = client_orders.get_default_database()
-    users_collection = db_orders.users
-    orders_collection = db_orders.orders
-
-    # Create Indexes
+# Order listings are paginated by (created_at, _id); admins may request up to ORDER_PAGE_SIZE_MAX per page.
+ORDER_PAGE_SIZE_DEFAULT = 50
+ORDER_PAGE_SIZE_MAX = 200
+MY_ORDERS_PAGE_SIZE_DEFAULT = 20
+# Most orders one bulk status/tracking update may touch.
+ORDER_BULK_UPDATE_MAX = 500
+# Heavy fields left out of the "summary" list view.
+ORDER_SUMMARY_EXCLUDED_FIELDS = ("items", "shipping_address")
+# Login OTPs expire after OTP_TTL_MINUTES; a code is burnt after OTP_MAX_ATTEMPTS wrong guesses.
+OTP_TTL_MINUTES = 10
+OTP_MAX_ATTEMPTS = 5
+# Token buckets per action and identity: (requests, per seconds); see ratelimit.py.
+RATE_LIMITS = {
+    "otp_send": {"email": (3, 600), "ip": (20, 3600)},
+    "otp_verify": {"email": (10, 900), "ip": (60, 3600)},
+    "contact": {"email": (3, 3600), "ip": (5, 3600)},
+    "testimonial": {"ip": (3, 3600)},
+}
+
+# --- Database Setup ---
+# Collections are lazy handles: no client is built and nothing connects until a
+# request first touches the database. Indexes are provisioned out of band with
+# `flask --app app init-db` (see ensure_indexes) rather than on every cold start.
+# Must run before any client is created so every Mongo command is timed.
+install_mongo_listener()
+
+# Main DB (Products, Coupons, etc.)
+products_collection = lazy_collection(MONGO_URI_MAIN, "products")
+testimonials_collection = lazy_collection(MONGO_URI_MAIN, "testimonials")
+coupons_collection = lazy_collection(MONGO_URI_MAIN, "coupons")
+stock_holds_collection = lazy_collection(MONGO_URI_MAIN, "stock_holds")
+# Uploaded product images waiting for the image pipeline job.
+image_uploads_collection = lazy_collection(MONGO_URI_MAIN, "image_uploads")
+
+# Orders DB (Users, Orders)
+users_collection = lazy_collection(MONGO_URI_ORDERS, "users")
+orders_collection = lazy_collection(MONGO_URI_ORDERS, "orders")
+email_outbox_collection = lazy_collection(MONGO_URI_ORDERS, "email_outbox")
+jobs_collection = lazy_collection(MONGO_URI_ORDERS, "jobs")
+# Pending (coalesced) status emails, one per order.
+order_notifications_collection = lazy_collection(MONGO_URI_ORDERS, "order_notifications")
+# One pre-aggregated document per day (see analytics.py).
+analytics_collection = lazy_collection(MONGO_URI_ORDERS, "analytics_daily")
+# First responses to Idempotency-Key requests.
+idempotency_keys_collection = lazy_collection(MONGO_URI_ORDERS, "idempotency_keys")
+# Pending login OTPs (hashed), one per email.
+otps_collection = lazy_collection(MONGO_URI_ORDERS, "otps")
+# Shared token buckets of the rate limiter.
+rate_limits_collection = lazy_collection(MONGO_URI_ORDERS, "rate_limits")
+# Shared counters for SequenceGenerator (order numbers).
+counters_collection = lazy_collection(MONGO_URI_ORDERS, "counters")
+
+# Read routing per route (profiles and their env overrides are defined in db.READ_PROFILES):
+# storefront listings may come from a secondary, prices/stock/coupons used at checkout never do.
+products_browse = lazy_collection(MONGO_URI_MAIN, "products", read_profile="browse")
+testimonials_browse = lazy_collection(MONGO_URI_MAIN, "testimonials", read_profile="browse")
+products_critical = lazy_collection(MONGO_URI_MAIN, "products", read_profile="critical")
+coupons_critical = lazy_collection(MONGO_URI_MAIN, "coupons", read_profile="critical")
+testimonials_critical = lazy_collection(MONGO_URI_MAIN, "testimonials", read_profile="critical")
+orders_listing = lazy_collection(MONGO_URI_ORDERS, "orders", read_profile="listing")
+coupons_listing = lazy_collection(MONGO_URI_MAIN, "coupons", read_profile="listing")
+testimonials_listing = lazy_collection(MONGO_URI_MAIN, "testimonials", read_profile="listing")
+
+if not MONGO_URI_MAIN or not MONGO_URI_ORDERS:
+    logger.critical("CRITICAL: MONGO_URI_MAIN / MONGO_URI_ORDERS not set. Database routes will fail.")
+
+def ensure_indexes():
+    """Creates every index the app relies on (idempotent; run once per deploy)."""
     users_collection.create_index("email", unique=True)
-    orders_collection.create_index("user_id")
+    orders_collection.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
     orders_collection.create_index("order_id", unique=True)
+    orders_collection.create_index([("created_at", -1), ("_id", -1)])
     products_collection.create_index("category")
+    products_collection.create_index("id")
+    products_collection.create_index(
+        [("name", "text"), ("description", "text"), ("category", "text")],
+        weights={"name": 3, "category": 2, "description": 1},
+        name="product_text_search",
+    )
     testimonials_collection.create_index("status")
     coupons_collection.create_index("code", unique=True)
-    
-    logger.info("Successfully connected to both MongoDB databases.")
+    stock_holds_collection.create_index([("status", 1), ("expires_at", 1)])
+    stock_holds_collection.create_index("purge_at", expireAfterSeconds=0)
+    image_uploads_collection.create_index([("product_id", 1), ("position", 1)])
+    image_uploads_collection.create_index("purge_at", expireAfterSeconds=0)
+    email_outbox_collection.create_index([("status", 1), ("next_attempt_at", 1)])
+    email_outbox_collection.create_index("sent_at", expireAfterSeconds=7 * 24 * 3600)
+    jobs_collection.create_index([("status", 1), ("run_after", 1)])
+    idempotency_keys_collection.create_index("expires_at", expireAfterSeconds=0)
+    rate_limits_collection.create_index("expires_at", expireAfterSeconds=0)
+    otps_collection.create_index("expires_at", expireAfterSeconds=0)
+    jobs_collection.create_index("purge_at", expireAfterSeconds=0)
+    order_notifications_collection.create_index("due_at")
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Creates the MongoDB indexes."""
+    ensure_indexes()
+    logger.info("MongoDB indexes are in place.")
+
+# --- Order Analytics ---
+order_analytics = OrderAnalytics(analytics_collection, orders_collection, ANALYTICS_TIMEZONE)
+
+def record_analytics(update, *args):
+    """
+    Applies an incremental rollup update. A failure only skews the dashboard, so it is
+    logged instead of failing the request; `backfill-analytics` repairs any drift.
+    """
+    try:
+        update(*args)
+    except Exception as e:
+        logger.error(f"Analytics rollup update ({update.__name__}) failed: {e}")
+
+@app.cli.command("backfill-analytics")
+@click.option("--start", help="First day to rebuild (YYYY-MM-DD); default: the whole history.")
+@click.option("--end", help="Last day to rebuild (YYYY-MM-DD); default: today.")
+def backfill_analytics_command(start, end):
+    """Rebuilds the daily analytics rollups from the orders collection."""
+    for value in (start, end):
+        try:
+            if value:
+                datetime.strptime(value, "%Y-%m-%d")
+        except ValueError:
+            raise click.BadParameter(f"{value} is not a YYYY-MM-DD date")
+    days = order_analytics.backfill(start, end)
+    logger.info(f"Rebuilt analytics rollups for {days} day(s).")
+
+# --- Email Dispatcher ---
+mailer = MailDispatcher(
+    connection_factory=lambda: SMTPConnection(SMTP_HOST, SMTP_PORT, EMAIL_USER, EMAIL_PASS, use_tls=SMTP_USE_TLS),
+    sender=f"Everaura Beauty <{EMAIL_USER}>",
+    outbox=email_outbox_collection,
+    workers=EMAIL_WORKERS,
+    queue_size=EMAIL_QUEUE_SIZE,
+    max_attempts=EMAIL_MAX_ATTEMPTS,
+)
+
+# --- Background Jobs ---
+job_queue = JobQueue(jobs_collection, workers=JOB_WORKERS, max_attempts=JOB_MAX_ATTEMPTS)
 
-except Exception as e:
-    logger.critical(f"CRITICAL: Failed to connect to MongoDB. App will not work. Error: {e}")
-    # Set to None so app can at least start, but routes will fail
-    products_collection = None 
-    testimonials_collection = None
-    coupons_collection = None
-    users_collection = None
-    orders_collection = None
+_hold_sweeper_started = False
+_hold_sweeper_lock = threading.Lock()
+
+@app.before_request
+def start_background_workers():
+    """
+    Starts background threads on the first request: the email and job workers (so work
+    left by a previous process is resumed) and the expired stock hold sweeper.
+    """
+    global _hold_sweeper_started
+    if EMAIL_ASYNC:
+        mailer.start()
+    if jobs_collection is not None:
+        job_queue.start()
+    if not _hold_sweeper_started and stock_holds_collection is not None:
+        with _hold_sweeper_lock:
+            if not _hold_sweeper_started:
+                threading.Thread(target=hold_sweeper_loop, name="stock-hold-sweeper", daemon=True).start()
+                _hold_sweeper_started = True
+
+@app.before_request
+def start_request_metrics():
+    metrics_registry.start_request()
+
+@app.after_request
+def record_request_metrics(response):
+    """Records route latency and Mongo usage, logging the request if it was slow."""
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    summary = metrics_registry.finish_request(route, request.method, response.status_code)
+    if summary and SLOW_REQUEST_MS and summary["seconds"] * 1000 >= SLOW_REQUEST_MS:
+        logger.warning(
+            f"Slow request: {request.method} {request.path} -> {response.status_code} in "
+            f"{summary['seconds'] * 1000:.0f}ms (mongo: {summary['mongo_commands']} commands, "
+            f"{summary['mongo_seconds'] * 1000:.0f}ms; external: {summary['external_seconds'] * 1000:.0f}ms)"
+        )
+    return response
 
 # --- HELPERS ---
 
@@ -112,16 +383,64 @@ def serialize_doc(doc):
         doc["user_id"] = str(doc["user_id"])
     return doc
 
+def apply_stock_fields(doc):
+    """Recomputes the derived inventory status fields of a serialized product."""
+    quantity = max(int(doc.get("quantity", 0)), 0)
+    reserved = max(int(doc.get("reserved", 0) or 0), 0)
+    available = max(quantity - reserved, 0)
+    doc["quantity"] = quantity
+    doc["reserved"] = reserved
+    doc["available_quantity"] = available
+    doc["in_stock"] = available > 0
+    doc["stock_status"] = "In Stock" if available > 0 else "Out of Stock"
+    return doc
+
 def serialize_product(doc):
     """Adds inventory status fields without changing the stored product structure."""
     doc = serialize_doc(doc)
     if doc:
-        quantity = max(int(doc.get("quantity", 0)), 0)
-        doc["quantity"] = quantity
-        doc["in_stock"] = quantity > 0
-        doc["stock_status"] = "In Stock" if quantity > 0 else "Out of Stock"
+        doc.pop("stock_ops", None)  # apply_line_updates bookkeeping
+        apply_stock_fields(doc)
     return doc
 
+catalog_cache = CatalogCache(
+    max_entries=CATALOG_CACHE_SIZE,
+    ttl_seconds=CATALOG_CACHE_TTL,
+    encoder=app.json.dumps,
+    stock_refresher=apply_stock_fields,
+)
+product_search = ProductSearchIndex(
+    loader=lambda: (serialize_product(p) for p in catalog_source().find()),
+    ttl_seconds=SEARCH_INDEX_TTL,
+    stock_refresher=apply_stock_fields,
+)
+testimonials_cache = ListingCache(max_entries=1, ttl_seconds=CATALOG_CACHE_TTL, encoder=app.json.dumps)
+
+def catalog_source():
+    """Products handle for listing reloads: the primary right after a local write, else the browse profile."""
+    return products_critical if catalog_cache.written_within(CATALOG_FRESH_READ_SECONDS) else products_browse
+
+def adjust_cached_stock(deltas, field="quantity"):
+    """Applies a stock movement to the cached listings and the search index."""
+    catalog_cache.adjust_quantities(deltas, field=field)
+    product_search.adjust_quantities(deltas, field=field)
+
+def cached_json_response(body, etag):
+    """Serves a pre-encoded JSON body, answering 304 when the client already has this ETag."""
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def product_cache_ref(product_filter):
+    """Maps a product filter used for stock updates to a catalog cache reference."""
+    if "_id" in product_filter:
+        return ("_id", str(product_filter["_id"]))
+    return ("id", product_filter["id"])
+
 def parse_optional_datetime(value):
     """Parses optional datetime strings while keeping backward compatibility."""
     if value in (None, ""):
@@ -140,46 +459,354 @@ def parse_optional_datetime(value):
         parsed = parsed.replace(tzinfo=timezone.utc)
     return parsed.astimezone(timezone.utc)
 
-def validate_coupon_constraints(coupon):
+def prepare_coupon(doc):
     """
-    Validates coupon runtime constraints.
+    Parses a stored coupon once into the form used for validation.
     Backward compatible defaults:
     - active defaults to True
     - used_count defaults to 0
     """
+    coupon = {
+        "doc": serialize_doc(dict(doc)),
+        "code": doc.get("code"),
+        "discount": float(doc.get("discount", 0) or 0),
+        "active": doc.get("active", True) is not False,
+        "used_count": int(doc.get("used_count", 0) or 0),
+        "start_at": None,
+        "end_at": None,
+        "max_uses_total": None,
+        "timing_error": None,
+        "usage_error": None,
+    }
+    try:
+        coupon["start_at"] = parse_optional_datetime(doc.get("start_at"))
+        coupon["end_at"] = parse_optional_datetime(doc.get("end_at"))
+    except ValueError:
+        coupon["timing_error"] = "Coupon timing configuration is invalid"
+
+    max_uses_total = doc.get("max_uses_total")
+    if max_uses_total is not None:
+        try:
+            coupon["max_uses_total"] = int(max_uses_total)
+        except (TypeError, ValueError):
+            coupon["usage_error"] = "Coupon usage configuration is invalid"
+    return coupon
+
+coupon_index = CouponIndex(
+    loader=lambda: coupons_critical.find(),
+    prepare=prepare_coupon,
+    ttl_seconds=COUPON_CACHE_TTL,
+)
+
+def validate_coupon_constraints(coupon):
+    """Validates a prepared coupon's runtime constraints without touching the database."""
     if not coupon:
         return False, "Invalid coupon code", 404
 
     now = datetime.now(timezone.utc)
-    if coupon.get("active", True) is False:
+    if not coupon["active"]:
         return False, "This coupon is inactive", 400
 
-    try:
-        start_at = parse_optional_datetime(coupon.get("start_at"))
-        end_at = parse_optional_datetime(coupon.get("end_at"))
-    except ValueError:
-        return False, "Coupon timing configuration is invalid", 400
-
-    if start_at and now < start_at:
+    if coupon["timing_error"]:
+        return False, coupon["timing_error"], 400
+    if coupon["start_at"] and now < coupon["start_at"]:
         return False, "This coupon is not active yet", 400
-    if end_at and now > end_at:
+    if coupon["end_at"] and now > coupon["end_at"]:
         return False, "This coupon has expired", 400
 
-    used_count = int(coupon.get("used_count", 0) or 0)
-    max_uses_total = coupon.get("max_uses_total")
-    if max_uses_total is not None:
+    if coupon["usage_error"]:
+        return False, coupon["usage_error"], 400
+    max_uses_total = coupon["max_uses_total"]
+    if max_uses_total is not None and max_uses_total >= 0 and coupon["used_count"] >= max_uses_total:
+        return False, "This coupon has reached its usage limit", 400
+
+    return True, None, None
+
+pricing_engine = PricingEngine(
+    products=products_critical,
+    coupon_lookup=coupon_index.get,
+    validate_coupon=validate_coupon_constraints,
+    shipping_fee_base=SHIPPING_FEE_BASE,
+    shipping_rules=SHIPPING_RULES,
+    catalog_version=lambda: catalog_cache.version,
+    cache_ttl=QUOTE_CACHE_TTL,
+)
+
+def redeem_coupon(code):
+    """
+    Counts one use of a coupon with a single conditional increment, so concurrent
+    checkouts can never push used_count past max_uses_total.
+    """
+    result = coupons_collection.update_one(
+        {"code": code, "$or": [
+            {"max_uses_total": None},
+            {"max_uses_total": {"$lt": 0}},
+            {"$expr": {"$lt": [{"$ifNull": ["$used_count", 0]}, "$max_uses_total"]}},
+        ]},
+        {"$inc": {"used_count": 1}}
+    )
+    if result.modified_count != 1:
+        return False
+    coupon_index.adjust_used_count(code, 1)
+    return True
+
+def unredeem_coupon(code):
+    """Gives back a use counted by redeem_coupon (order cancelled or its hold expired)."""
+    coupons_collection.update_one(
+        {"code": code, "used_count": {"$gt": 0}},
+        {"$inc": {"used_count": -1}}
+    )
+    coupon_index.adjust_used_count(code, -1)
+
+
+def aggregate_order_lines(items):
+    """
+    Groups order items by product so duplicate cart lines cost a single write.
+    Returns {cache_ref: {"filter", "quantity", "name"}} in first-seen order.
+    """
+    lines = {}
+    for item in items:
+        quantity = int(item.get("quantity", 0))
+        if quantity <= 0:
+            raise ValueError(f"Invalid quantity for {item.get('name', 'product')}")
+
+        product_filter = None
+        product_id = item.get("_id") or item.get("product_id")
+        if product_id:
+            try:
+                product_filter = {"_id": ObjectId(product_id)}
+            except Exception:
+                product_filter = None
+
+        if product_filter is None and item.get("id") is not None:
+            product_filter = {"id": int(item["id"])}
+
+        if product_filter is None:
+            raise ValueError(f"Product ID missing for {item.get('name', 'product')}")
+
+        ref = product_cache_ref(product_filter)
+        if ref in lines:
+            lines[ref]["quantity"] += quantity
+        else:
+            lines[ref] = {"filter": product_filter, "quantity": quantity, "name": item.get("name", "product")}
+    return lines
+
+_transactions_supported = None
+
+def products_support_transactions():
+    """Checks once whether the products deployment is a replica set or sharded cluster."""
+    global _transactions_supported
+    if _transactions_supported is None:
         try:
-            max_uses_total = int(max_uses_total)
-        except (TypeError, ValueError):
-            return False, "Coupon usage configuration is invalid", 400
-        if max_uses_total >= 0 and used_count >= max_uses_total:
-            return False, "This coupon has reached its usage limit", 400
+            hello = get_client(MONGO_URI_MAIN).admin.command("hello")
+            _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _transactions_supported = False
+    return _transactions_supported
+
+def available_stock(product):
+    """Units that can still be sold: on-hand quantity minus active reservations."""
+    return int(product.get("quantity", 0) or 0) - int(product.get("reserved", 0) or 0)
+
+def describe_stock_shortfall(lines):
+    """Reports every line that cannot be fulfilled, using one read of the affected products."""
+    products = products_critical.find(
+        {"$or": [line["filter"] for line in lines.values()]},
+        {"_id": 1, "id": 1, "quantity": 1, "reserved": 1}
+    )
+    available = {}
+    for product in products:
+        available[("_id", str(product["_id"]))] = available_stock(product)
+        if product.get("id") is not None:
+            available[("id", product["id"])] = available_stock(product)
+
+    shortfalls = [
+        f"{line['name']} (requested {line['quantity']}, available {max(available.get(ref, 0), 0)})"
+        for ref, line in lines.items()
+        if available.get(ref, 0) < line["quantity"]
+    ]
+    if not shortfalls:
+        return "Stock changed while the order was being processed"
+    return "Insufficient stock for " + ", ".join(shortfalls)
+
+def has_available(quantity):
+    """Filter clause matching products with at least `quantity` unreserved units."""
+    return {"$expr": {"$gte": [
+        {"$subtract": ["$quantity", {"$ifNull": ["$reserved", 0]}]},
+        quantity
+    ]}}
+
+def apply_line_updates(lines, make_update, make_undo):
+    """
+    Applies one conditional update per order line, all-or-nothing.
+    make_update(line) / make_undo(line) return (filter, update) pairs.
+
+    With transactions every update goes out as one ordered bulk_write and any
+    unmatched line aborts it. Standalone servers have no transactions, so the updates
+    go out as one ordered bulk_write without one, and the lines that applied are undone
+    in a second bulk write when any line did not match.
+    """
+    if products_support_transactions():
+        with get_client(MONGO_URI_MAIN).start_session() as session:
+            with session.start_transaction():
+                result = products_collection.bulk_write(
+                    [UpdateOne(*make_update(line)) for line in lines.values()],
+                    ordered=True,
+                    session=session
+                )
+                if result.modified_count != len(lines):
+                    session.abort_transaction()
+                    return False
+        return True
+
+    line_list = list(lines.values())
+    if len(line_list) == 1:
+        return products_collection.update_one(*make_update(line_list[0])).modified_count == 1
+
+    # An unmatched conditional update is not a bulk_write error and the result only has
+    # totals, so each update tags its product with a marker of its own: the undo writes
+    # match only the tagged (applied) lines, and the markers are pulled again afterwards.
+    call_id = str(ObjectId())
+    markers = [f"{call_id}:{i}" for i in range(len(line_list))]
+
+    def undo_applied():
+        undos = []
+        for line, marker in zip(line_list, markers):
+            undo_filter, undo = make_undo(line)
+            undos.append(UpdateOne({**undo_filter, "stock_ops": marker}, {**undo, "$pull": {"stock_ops": marker}}))
+        products_collection.bulk_write(undos, ordered=False)
+
+    updates = []
+    for line, marker in zip(line_list, markers):
+        line_filter, update = make_update(line)
+        updates.append(UpdateOne(line_filter, {**update, "$addToSet": {"stock_ops": marker}}))
+    try:
+        result = products_collection.bulk_write(updates, ordered=True)
+    except Exception:
+        undo_applied()
+        raise
+    if result.modified_count != len(line_list):
+        if result.modified_count:
+            undo_applied()
+        return False
+    products_collection.update_many(
+        {"$or": [line["filter"] for line in line_list], "stock_ops": {"$in": markers}},
+        {"$pull": {"stock_ops": {"$in": markers}}}
+    )
+    return True
+
+def reserve_order_stock(order_mongo_id, order_id_str, items, coupon_code=None):
+    """
+    Places a time-limited hold on stock (and on one use of the coupon, if any) for a new order.
+    Reserved units are counted in each product's `reserved` field and the hold is
+    recorded in stock_holds until it is converted (payment) or released (expiry/cancel).
+    Returns (ok, error_message, error_status).
+    """
+    lines = aggregate_order_lines(items)
+    reserved = apply_line_updates(
+        lines,
+        lambda line: ({**line["filter"], **has_available(line["quantity"])}, {"$inc": {"reserved": line["quantity"]}}),
+        lambda line: (line["filter"], {"$inc": {"reserved": -line["quantity"]}}),
+    )
+    if not reserved:
+        return False, describe_stock_shortfall(lines), 409
+
+    def undo_reservation():
+        products_collection.bulk_write(
+            [UpdateOne(line["filter"], {"$inc": {"reserved": -line["quantity"]}}) for line in lines.values()],
+            ordered=False
+        )
+
+    if coupon_code and not redeem_coupon(coupon_code):
+        undo_reservation()
+        return False, "This coupon has reached its usage limit", 400
+
+    now = datetime.now(timezone.utc)
+    try:
+        stock_holds_collection.insert_one({
+            "_id": order_mongo_id,
+            "order_id": order_id_str,
+            "lines": [{"filter": line["filter"], "quantity": line["quantity"], "name": line["name"]} for line in lines.values()],
+            "coupon_code": coupon_code or None,
+            "status": "active",
+            "created_at": now,
+            "expires_at": now + timedelta(minutes=STOCK_HOLD_MINUTES),
+        })
+    except Exception:
+        undo_reservation()
+        if coupon_code:
+            unredeem_coupon(coupon_code)
+        raise
 
+    adjust_cached_stock({ref: line["quantity"] for ref, line in lines.items()}, field="reserved")
     return True, None, None
 
+def claim_hold(order_mongo_id, new_status, extra_filter=None):
+    """Moves an active hold to a final status; only one caller can win the claim."""
+    return stock_holds_collection.find_one_and_update(
+        {"_id": order_mongo_id, "status": "active", **(extra_filter or {})},
+        {"$set": {
+            "status": new_status,
+            "closed_at": datetime.now(timezone.utc),
+            "purge_at": datetime.now(timezone.utc) + timedelta(days=STOCK_HOLD_RETENTION_DAYS),
+        }}
+    )
+
+def hold_lines(hold):
+    return {product_cache_ref(line["filter"]): line for line in hold["lines"]}
+
+def release_order_hold(order_mongo_id, extra_filter=None):
+    """Returns an order's reserved units (and coupon use) to the pool (expired, cancelled or failed orders)."""
+    hold = claim_hold(order_mongo_id, "released", extra_filter)
+    if not hold:
+        return False
+    lines = hold_lines(hold)
+    products_collection.bulk_write(
+        [UpdateOne(line["filter"], {"$inc": {"reserved": -line["quantity"]}}) for line in lines.values()],
+        ordered=False
+    )
+    adjust_cached_stock({ref: -line["quantity"] for ref, line in lines.items()}, field="reserved")
+    if hold.get("coupon_code"):
+        unredeem_coupon(hold["coupon_code"])
+        # If the order is paid later, the webhook counts the coupon use again.
+        orders_collection.update_one({"_id": order_mongo_id}, {"$set": {"coupon_redeemed": False}})
+    return True
+
+_last_hold_sweep = 0.0
+
+def release_expired_holds(limit=200, min_interval=0):
+    """Releases holds past their expiry. Throttled per process by `min_interval` seconds."""
+    global _last_hold_sweep
+    if min_interval and time.monotonic() - _last_hold_sweep < min_interval:
+        return 0
+    _last_hold_sweep = time.monotonic()
+
+    now = datetime.now(timezone.utc)
+    released = 0
+    expired = stock_holds_collection.find(
+        {"status": "active", "expires_at": {"$lte": now}}, {"_id": 1}
+    ).limit(limit)
+    for hold in expired:
+        if release_order_hold(hold["_id"], {"expires_at": {"$lte": now}}):
+            released += 1
+    if released:
+        logger.info(f"Released {released} expired stock hold(s).")
+    return released
+
+def hold_sweeper_loop():
+    while True:
+        try:
+            release_expired_holds()
+        except Exception as e:
+            logger.error(f"Stock hold sweep failed: {e}")
+        time.sleep(STOCK_HOLD_SWEEP_SECONDS)
 
 def deduct_order_inventory(order_id, items):
-    """Deducts inventory once for a paid order."""
+    """
+    Deducts inventory once for a paid order, all-or-nothing.
+    An active stock hold is converted into the deduction; orders whose hold has
+    expired (or that never had one) are deducted against unreserved stock.
+    """
     claim = orders_collection.update_one(
         {"_id": order_id, "inventory_deducted": {"$ne": True}},
         {"$set": {"inventory_deducted": True}}
@@ -187,42 +814,39 @@ def deduct_order_inventory(order_id, items):
     if claim.modified_count != 1:
         return True, None
 
-    deducted = []
+    hold = None
     try:
-        for item in items:
-            quantity = int(item.get("quantity", 0))
-            if quantity <= 0:
-                raise ValueError(f"Invalid quantity for {item.get('name', 'product')}")
-
-            product_filter = None
-            product_id = item.get("_id") or item.get("product_id")
-            if product_id:
-                try:
-                    product_filter = {"_id": ObjectId(product_id)}
-                except Exception:
-                    product_filter = None
-
-            if product_filter is None and item.get("id") is not None:
-                product_filter = {"id": int(item["id"])}
-
-            if product_filter is None:
-                raise ValueError(f"Product ID missing for {item.get('name', 'product')}")
-
-            result = products_collection.update_one(
-                {**product_filter, "quantity": {"$gte": quantity}},
-                {"$inc": {"quantity": -quantity}}
+        hold = claim_hold(order_id, "converted")
+        if hold:
+            lines = hold_lines(hold)
+            deducted = apply_line_updates(
+                lines,
+                lambda line: (
+                    {**line["filter"], "quantity": {"$gte": line["quantity"]}},
+                    {"$inc": {"quantity": -line["quantity"], "reserved": -line["quantity"]}}
+                ),
+                lambda line: (line["filter"], {"$inc": {"quantity": line["quantity"], "reserved": line["quantity"]}}),
             )
-            if result.modified_count != 1:
-                raise ValueError(f"Insufficient stock for {item.get('name', 'product')}")
-
-            deducted.append((product_filter, quantity))
+        else:
+            lines = aggregate_order_lines(items)
+            deducted = apply_line_updates(
+                lines,
+                lambda line: ({**line["filter"], **has_available(line["quantity"])}, {"$inc": {"quantity": -line["quantity"]}}),
+                lambda line: (line["filter"], {"$inc": {"quantity": line["quantity"]}}),
+            )
+        if not deducted:
+            raise ValueError(describe_stock_shortfall(lines))
 
+        adjust_cached_stock({ref: -line["quantity"] for ref, line in lines.items()})
+        if hold:
+            adjust_cached_stock({ref: -line["quantity"] for ref, line in lines.items()}, field="reserved")
         return True, None
     except Exception as e:
-        for product_filter, quantity in deducted:
-            products_collection.update_one(
-                product_filter,
-                {"$inc": {"quantity": quantity}}
+        if hold:
+            # Hand the hold back so a retry (or the expiry sweeper) can still settle it.
+            stock_holds_collection.update_one(
+                {"_id": order_id, "status": "converted"},
+                {"$set": {"status": "active"}, "$unset": {"closed_at": "", "purge_at": ""}}
             )
         orders_collection.update_one(
             {"_id": order_id},
@@ -230,29 +854,111 @@ def deduct_order_inventory(order_id, items):
         )
         return False, str(e)
 
-def send_email(to_email, subject, html_body):
-    """Sends an email using Gmail SMTP."""
+def send_email(to_email, subject, html_body, durable=True):
+    """
+    Queues an email for background delivery (or sends it inline when EMAIL_ASYNC is off).
+    Pass durable=False for mail carrying a secret, so it is never stored in the outbox.
+    """
     if not EMAIL_USER or not EMAIL_PASS:
         logger.error("Email credentials (EMAIL_USER, EMAIL_PASS) not set.")
         return False
-    
-    # This function will now raise exceptions on failure, to be caught by the route
-    msg = MIMEMultipart()
-    msg['From'] = f"Everaura Beauty <{EMAIL_USER}>"
-    msg['To'] = to_email
-    msg['Subject'] = subject
-    msg.attach(MIMEText(html_body, 'html'))
-
-    with smtplib.SMTP('smtp.gmail.com', 587) as server:
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASS)
-        server.send_message(msg)
-    logger.info(f"Email sent to {to_email} with subject: {subject}")
+
+    if EMAIL_ASYNC:
+        return mailer.enqueue(to_email, subject, html_body, durable=durable)
+
+    # Inline mode raises on SMTP failure, to be caught by the route
+    mailer.send_now(to_email, subject, html_body)
     return True
 
-def generate_otp():
-    """Generates a 6-digit numeric OTP."""
-    return "".join(random.choices(string.digits, k=6))
+def parse_page_size(value, default=ORDER_PAGE_SIZE_DEFAULT, maximum=ORDER_PAGE_SIZE_MAX):
+    """Parses a ?limit= value, clamping it to 1..maximum."""
+    if value in (None, ""):
+        return default
+    try:
+        return min(max(int(value), 1), maximum)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+
+def encode_order_cursor(order):
+    """Builds an opaque keyset cursor from the last order of a page."""
+    created_at = order.get("created_at")
+    payload = {
+        "t": created_at.isoformat() if isinstance(created_at, datetime) else None,
+        "id": str(order["_id"]),
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+def decode_order_cursor(token):
+    """Turns a cursor back into a filter matching orders after it in (created_at, _id) desc order."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        last_id = ObjectId(payload["id"])
+        created_at = datetime.fromisoformat(payload["t"]) if payload.get("t") else None
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": last_id}},
+    ]}
+
+def order_list_projection(args):
+    """Builds a Mongo projection from ?view=summary or ?fields=a,b,c (None means full documents)."""
+    fields = [f.strip() for f in (args.get("fields") or "").split(",") if f.strip()]
+    if fields:
+        projection = {field: 1 for field in fields}
+        projection.update({"order_id": 1, "created_at": 1})
+        return projection
+    if args.get("view") == "summary":
+        return {field: 0 for field in ORDER_SUMMARY_EXCLUDED_FIELDS}
+    return None
+
+def order_status_filter(args):
+    """Builds a filter from ?status=Paid,Shipped (empty when no status is requested)."""
+    statuses = [s.strip() for s in (args.get("status") or "").split(",") if s.strip()]
+    if not statuses:
+        return {}
+    return {"status": statuses[0] if len(statuses) == 1 else {"$in": statuses}}
+
+def paginated_orders_response(collection, query, args, default_limit=ORDER_PAGE_SIZE_DEFAULT):
+    """
+    Serves one keyset page of orders (newest first) as a JSON list.
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    limit = parse_page_size(args.get("limit"), default=default_limit)
+    if args.get("cursor"):
+        query = {"$and": [query, decode_order_cursor(args["cursor"])]}
+
+    orders = list(
+        collection.find(query, order_list_projection(args))
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+
+    response = jsonify([serialize_doc(order) for order in orders])
+    if has_more:
+        response.headers["X-Next-Cursor"] = encode_order_cursor(orders[-1])
+    return response
+
+def ndjson_orders_response(collection, query, args):
+    """Streams every matching order as newline-delimited JSON while the cursor yields them."""
+    if args.get("cursor"):
+        query = {"$and": [query, decode_order_cursor(args["cursor"])]}
+    cursor = (
+        collection.find(query, order_list_projection(args))
+        .sort([("created_at", -1), ("_id", -1)])
+        .batch_size(ORDER_PAGE_SIZE_MAX)
+    )
+
+    def generate():
+        try:
+            for order in cursor:
+                yield app.json.dumps(serialize_doc(order)) + "\n"
+        finally:
+            cursor.close()
+
+    return app.response_class(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 def check_admin_key():
     """Decorator to check for X-ADMIN-KEY header."""
@@ -261,9 +967,43 @@ def check_admin_key():
         return jsonify({"error": "Unauthorized admin access"}), 403
     return None
 
+rate_limiter = RateLimiter(rate_limits_collection, RATE_LIMITS)
+otp_store = OTPStore(otps_collection, SECRET_KEY, ttl_seconds=OTP_TTL_MINUTES * 60, max_attempts=OTP_MAX_ATTEMPTS)
+
+def client_ip():
+    """The caller's IP: the X-Forwarded-For entry added by the nearest trusted proxy, else the socket peer."""
+    forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+    if TRUSTED_PROXY_COUNT and len(forwarded) >= TRUSTED_PROXY_COUNT:
+        return forwarded[-TRUSTED_PROXY_COUNT]
+    return request.remote_addr
+
+def rate_limited(action):
+    """Answers 429, before any database or email work, once the caller's IP or body email is over `action`'s limits."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if RATE_LIMITS_ENABLED:
+                data = request.get_json(silent=True)
+                email = data.get('email') if isinstance(data, dict) else None
+                identities = {"ip": client_ip()}
+                if isinstance(email, str) and email.strip():
+                    identities["email"] = email.lower().strip()
+                retry_after = rate_limiter.hit(action, identities)
+                if retry_after:
+                    response = jsonify({
+                        "error": f"Too many requests. Please try again in {retry_after} seconds.",
+                        "retry_after": retry_after,
+                    })
+                    response.headers["Retry-After"] = str(retry_after)
+                    return response, 429
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
 # --- AUTHENTICATION ROUTES ---
 
 @app.route('/api/auth/send-otp', methods=['POST'])
+@rate_limited("otp_send")
 def send_otp():
     data = request.get_json()
     email = data.get('email')
@@ -271,17 +1011,19 @@ def send_otp():
         return jsonify({"error": "Email is required"}), 400
 
     email = email.lower().strip()
-    otp = generate_otp()
-    otp_expiry = datetime.now(timezone.utc) + timedelta(minutes=10)
 
     try:
         if users_collection is None:
             raise Exception("Orders database is not connected.")
-        users_collection.update_one(
+        # Creates the user on first login; existing user documents are left untouched.
+        user = users_collection.find_one_and_update(
             {"email": email},
-            {"$set": {"otp": otp, "otp_expiry": otp_expiry, "email": email}},
-            upsert=True
+            {"$setOnInsert": {"email": email, "created_at": datetime.now(timezone.utc)}},
+            projection={"_id": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
+        otp = otp_store.issue(email, user["_id"])
     except Exception as e:
         logger.critical(f"CRITICAL: MongoDB operation failed in send_otp. Check MONGO_URI_ORDERS. Error: {e}")
         return jsonify({"error": "Database service is currently unavailable."}), 500
@@ -292,7 +1034,7 @@ def send_otp():
         <h2>Everaura Beauty Login</h2>
         <p>Your One-Time Password (OTP) to log in is:</p>
         <p style="font-size: 24px; font-weight: bold; letter-spacing: 2px;">{otp}</p>
-        <p>This OTP is valid for 10 minutes. Please do not share it with anyone.</p>
+        <p>This OTP is valid for {OTP_TTL_MINUTES} minutes. Please do not share it with anyone.</p>
         <p>If you did not request this, please ignore this email.</p>
         <br>
         <p>Thank you,<br>The Everaura Team</p>
@@ -300,7 +1042,8 @@ def send_otp():
     """
     
     try:
-        if send_email(email, subject, html_body):
+        # Only the OTP's hash is stored, so the mail with the code must not be persisted either.
+        if send_email(email, subject, html_body, durable=False):
             return jsonify({"success": True, "message": "OTP sent to your email."})
         else:
             # This should not be reachable if EMAIL_USER/PASS are set, but as a fallback
@@ -311,6 +1054,7 @@ def send_otp():
         return jsonify({"error": "Failed to send OTP. Check email credentials."}), 500
 
 @app.route('/api/auth/verify-otp', methods=['POST'])
+@rate_limited("otp_verify")
 def verify_otp():
     data = request.get_json()
     email = data.get('email', '').lower().strip()
@@ -320,48 +1064,26 @@ def verify_otp():
         return jsonify({"error": "Email and OTP are required"}), 400
 
     try:
-        user = users_collection.find_one({"email": email})
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-
-        if user.get('otp') != otp_attempt:
-            return jsonify({"error": "Invalid OTP"}), 400
-
-        expiry = user.get('otp_expiry')
-        if not expiry:
-            return jsonify({"error": "OTP not generated"}), 400
+        # A matching code is checked and consumed in one round trip.
+        record, error, status = otp_store.verify(email, otp_attempt)
+        if record is None:
+            return jsonify({"error": error}), status
 
-        # ✅ Handle both naive and aware datetimes
-        if expiry.tzinfo is None:
-            expiry = expiry.replace(tzinfo=timezone.utc)
-
-        if datetime.now(timezone.utc) > expiry:
-            return jsonify({"error": "OTP has expired"}), 400
-
-        # ✅ Create JWT token before modifying the DB
         access_token = create_access_token(
-            identity=str(user['_id']), 
-            additional_claims={"email": user['email']}
-        )
-
-        # ✅ Clear OTP after successful verification
-        users_collection.update_one(
-            {"email": email},
-            {"$unset": {"otp": "", "otp_expiry": ""}}
+            identity=str(record['user_id']), 
+            additional_claims={"email": email}
         )
 
         return jsonify({
             "success": True,
             "message": "Login successful",
             "token": access_token,
-            "user": {"email": user['email'], "id": str(user['_id'])}
+            "user": {"email": email, "id": str(record['user_id'])}
         })
 
     except Exception as e:
-        import traceback
         logger.error(f"DB Error verify-otp: {e}")
-        print(traceback.format_exc())
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": "Internal server error"}), 500
 # ... (All other routes remain the same) ...
 
 @app.route('/api/auth/me', methods=['GET'])
@@ -384,8 +1106,74 @@ def get_me():
 
 # --- ORDER & CHECKOUT ROUTES ---
 
+@app.route('/api/cart/quote', methods=['POST'])
+def quote_cart():
+    """Server-side totals for {"items": [...], "coupon_code": optional}; an invalid coupon is reported, not fatal."""
+    data = request.get_json(silent=True) or {}
+    try:
+        quote = pricing_engine.quote(data.get('items'), data.get('coupon_code'), strict_coupon=False)
+    except QuoteError as e:
+        return jsonify({"error": e.message}), e.status
+    except Exception as e:
+        logger.error(f"Failed to price cart: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+    return jsonify(quote)
+
+# --- Idempotent Requests ---
+idempotency_store = IdempotencyStore(idempotency_keys_collection, ttl_seconds=IDEMPOTENCY_TTL_HOURS * 3600)
+order_numbers = SequenceGenerator(counters_collection, "order_id")
+
+def idempotent(scope):
+    """
+    Honours an Idempotency-Key header on a JWT-protected route: the first 2xx response is
+    stored and replayed for repeats of the same request; any other outcome frees the key.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.headers.get('Idempotency-Key') or '').strip()
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({"error": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters"}), 400
+
+            owner = f"{scope}:{get_jwt_identity()}"
+            try:
+                state, record = idempotency_store.begin(owner, key, request_fingerprint(request.get_data()))
+            except Exception as e:
+                logger.error(f"Idempotency lookup failed for {owner}: {e}")
+                return jsonify({"error": "Internal server error"}), 500
+            if state == "replay":
+                response = app.response_class(record["body"], status=record["status"], headers=record.get("headers"))
+                response.headers["Idempotent-Replayed"] = "true"
+                return response
+            if state == "in_progress":
+                response = jsonify({"error": "This request is already being processed.", "code": "idempotency_in_progress"})
+                response.headers["Retry-After"] = "1"
+                return response, 409
+            if state == "mismatch":
+                return jsonify({"error": "Idempotency-Key was already used for a different request"}), 422
+
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except Exception:
+                idempotency_store.release(owner, key)
+                raise
+            try:
+                if 200 <= response.status_code < 300:
+                    headers = {name: response.headers[name] for name in ("Content-Type", "Location") if name in response.headers}
+                    idempotency_store.complete(owner, key, response.status_code, response.get_data(as_text=True), headers)
+                else:
+                    idempotency_store.release(owner, key)
+            except Exception as e:
+                logger.error(f"Failed to record idempotent response for {owner}: {e}")
+            return response
+        return wrapper
+    return decorator
+
 @app.route('/api/orders/create', methods=['POST'])
 @jwt_required()
+@idempotent("orders.create")
 def create_order():
     user_id = get_jwt_identity()
     data = request.get_json()
@@ -417,70 +1205,30 @@ def create_order():
             }}
         )
 
-        # 3. Rebuild items and totals from server-side product data only.
-        validated_items = []
-        product_object_ids = []
-        for item in items:
-            quantity = int(item.get('quantity', 0))
-            if quantity <= 0:
-                return jsonify({"error": "Invalid item quantity in cart"}), 400
-
-            product_id = item.get('_id') or item.get('product_id')
-            if not product_id:
-                return jsonify({"error": "Product ID missing in cart item"}), 400
-
-            try:
-                product_object_ids.append(ObjectId(product_id))
-            except Exception:
-                return jsonify({"error": "Invalid product ID in cart item"}), 400
-
-            validated_items.append({
-                "_id": str(product_id),
-                "quantity": quantity
-            })
-
-        products = list(products_collection.find({"_id": {"$in": product_object_ids}}))
-        product_map = {str(product["_id"]): product for product in products}
-        if len(product_map) != len({item["_id"] for item in validated_items}):
-            return jsonify({"error": "One or more products are unavailable"}), 409
-
-        rebuilt_items = []
-        subtotal = 0.0
-        for item in validated_items:
-            product = product_map.get(item["_id"])
-            if not product:
-                return jsonify({"error": "One or more products are unavailable"}), 409
-
-            quantity = item["quantity"]
-            unit_price = float(product.get("price", 0) or 0)
-            line_total = unit_price * quantity
-            subtotal += line_total
-            product_images = product.get("images") or []
-            rebuilt_items.append({
-                "_id": str(product["_id"]),
-                "name": product.get("name", "Product"),
-                "price": unit_price,
-                "quantity": quantity,
-                "image": product_images[0] if product_images else item.get("image")
-            })
-
-        discount_percent = 0
-        discount_amount = 0
-
-        if coupon_code:
-            coupon = coupons_collection.find_one({"code": coupon_code})
-            is_valid, error_message, error_status = validate_coupon_constraints(coupon)
-            if not is_valid:
-                return jsonify({"error": error_message}), error_status
-            discount_percent = float(coupon.get('discount', 0) or 0)
-            discount_amount = (subtotal * discount_percent) / 100
-
-        shipping_fee_base = SHIPPING_FEE_BASE
-        shipping_fee_applied = SHIPPING_FEE_APPLIED
-        total = max(subtotal - discount_amount + shipping_fee_applied, 0)
+        # 3. Price the cart from server-side product data only (see pricing.py).
+        try:
+            quote = pricing_engine.quote(items, coupon_code, use_cache=False)
+        except QuoteError as e:
+            return jsonify({"error": e.message}), e.status
+        rebuilt_items = [
+            {
+                "_id": line["_id"],
+                "name": line["name"],
+                "price": line["price"],
+                "quantity": line["quantity"],
+                "image": line["image"] or item.get("image")
+            }
+            for line, item in zip(quote["items"], items)
+        ]
+        subtotal = quote["subtotal"]
+        discount_percent = quote["discount_percent"]
+        discount_amount = quote["discount_amount"]
+        shipping_fee_base = quote["shipping_fee_base"]
+        shipping_fee_applied = quote["shipping_fee_applied"]
+        total = quote["total_amount"]
         
         # 4. Create Order document
-        order_id_str = f"EA-{int(datetime.now().timestamp() * 1000)}"
+        order_id_str = f"EA-{order_numbers.next()}"
         order_doc = {
             "order_id": order_id_str,
             "user_id": ObjectId(user_id),
@@ -492,6 +1240,8 @@ def create_order():
             "shipping_fee_base": shipping_fee_base,
             "shipping_fee_applied": shipping_fee_applied,
             "coupon_code": coupon_code or None,
+            # The coupon use is counted together with the stock hold below.
+            "coupon_redeemed": bool(coupon_code),
             "discount_percent": discount_percent,
             "discount_amount": discount_amount,
             "total_amount": total,
@@ -508,24 +1258,40 @@ def create_order():
         logger.error(f"Failed to insert order/update user: {e}")
         return jsonify({"error": "Failed to create order in database"}), 500
 
-    # 5. Generate Payment (Razorpay or Skip for testing)
+    # 5. Hold stock for this order until it is paid or the hold expires
+    try:
+        release_expired_holds(min_interval=STOCK_HOLD_SWEEP_SECONDS)
+        reserved, reserve_error, reserve_status = reserve_order_stock(
+            order_mongo_id, order_id_str, rebuilt_items, coupon_code
+        )
+    except Exception as e:
+        logger.error(f"Failed to reserve stock for order {order_id_str}: {e}")
+        orders_collection.delete_one({"_id": order_mongo_id})
+        return jsonify({"error": "Failed to reserve stock for this order"}), 500
+    if not reserved:
+        orders_collection.delete_one({"_id": order_mongo_id})
+        return jsonify({"error": reserve_error}), reserve_status
+
+    # 6. Generate Payment (Razorpay or Skip for testing)
     try:
         # If SKIP_PAYMENT flag is enabled or Razorpay keys are not configured, mark as paid (testing mode)
-        if SKIP_PAYMENT or not (RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET):
+        if not payments_enabled():
             inventory_updated, inventory_error = deduct_order_inventory(order_mongo_id, rebuilt_items)
             if not inventory_updated:
+                release_order_hold(order_mongo_id)
                 orders_collection.delete_one({"_id": order_mongo_id})
                 return jsonify({"error": inventory_error}), 409
 
-            orders_collection.update_one(
-                {"_id": order_mongo_id},
-                {"$set": {
-                    "payment_status": "Paid",
-                    "status": "Paid",
-                    "payment_id": "TEST_PAYMENT_" + str(order_mongo_id),
-                    "paid_at": datetime.now(timezone.utc)
-                }}
-            )
+            paid_fields = {
+                "payment_status": "Paid",
+                "status": "Paid",
+                "payment_id": "TEST_PAYMENT_" + str(order_mongo_id),
+                "paid_at": datetime.now(timezone.utc)
+            }
+            orders_collection.update_one({"_id": order_mongo_id}, {"$set": paid_fields})
+            paid_order = {**order_doc, **paid_fields}
+            record_analytics(order_analytics.order_created, paid_order)
+            record_analytics(order_analytics.order_paid, paid_order)
 
             # Optionally send confirmation email (same as webhook flow)
             subject = f"Your Everaura Order is Confirmed! (ID: {order_id_str})"
@@ -560,54 +1326,131 @@ def create_order():
                 "payment_url": f"{FRONTEND_URL}/my-orders.html?order_id={order_id_str}"
             })
 
-        # Otherwise create a Razorpay payment link as normal
-        link_data = {
-            "amount": int(total * 100),  # Amount in paise
-            "currency": "INR",
-            "accept_partial": False,
-            "description": f"Payment for Everaura Order {order_id_str}",
-            "customer": {
-                "name": shipping_address['name'],
-                "email": shipping_address['email'],
-                "contact": shipping_address['phone']
-            },
-            "notify": {
-                "sms": True,
-                "email": True
-            },
-            "reminder_enable": True,
-            "callback_url": f"{FRONTEND_URL}/my-orders.html?order_id={order_id_str}",
-            "callback_method": "get"
-        }
-        payment_link = razorpay_client.payment_link.create(link_data)
-
-        # 6. Update order with payment link ID
-        orders_collection.update_one(
-            {"_id": order_mongo_id},
-            {"$set": {
-                "payment_link_id": payment_link['id'],
-                "razorpay_short_url": payment_link['short_url']
-            }}
-        )
-
-        return jsonify({
-            "success": True,
-            "message": "Order created, redirecting to payment.",
+        totals = {
             "order_id": order_id_str,
             "subtotal": subtotal,
             "shipping_fee_base": shipping_fee_base,
             "shipping_fee_applied": shipping_fee_applied,
             "discount_amount": discount_amount,
             "total_amount": total,
-            "payment_url": payment_link['short_url']
+        }
+
+        # Async mode: hand the provider call to a job; the client polls for the link.
+        if PAYMENT_LINK_ASYNC:
+            job_id = job_queue.enqueue("payment_link", {"order_id": order_mongo_id})
+            orders_collection.update_one(
+                {"_id": order_mongo_id},
+                {"$set": {"payment_link_status": "pending", "payment_link_job_id": job_id}}
+            )
+            record_analytics(order_analytics.order_created, order_doc)
+            poll_url = f"/api/orders/{order_id_str}/payment-link"
+            response = jsonify({
+                "success": True,
+                "message": "Order created, preparing payment.",
+                **totals,
+                "payment_url": None,
+                "payment_link_url": poll_url,
+            })
+            response.headers["Location"] = poll_url
+            return response, 202
+
+        # Otherwise create the payment link before answering
+        payment_url = attach_payment_link({**order_doc, "_id": order_mongo_id})
+        record_analytics(order_analytics.order_created, order_doc)
+
+        return jsonify({
+            "success": True,
+            "message": "Order created, redirecting to payment.",
+            **totals,
+            "payment_url": payment_url
         })
  
     except Exception as e:
-        logger.error(f"Razorpay link creation failed: {e}")
-        # Delete the order if payment link fails
+        logger.error(f"Payment link creation failed for order {order_id_str}: {e}")
+        # Delete the order (and free its stock) if payment link fails
+        release_order_hold(order_mongo_id)
         orders_collection.delete_one({"_id": order_mongo_id})
+        if isinstance(e, PaymentProviderError) and e.retryable:
+            return jsonify({"error": "Payment service is temporarily unavailable. Please try again shortly."}), 503
         return jsonify({"error": f"Failed to create payment link: {e}"}), 500
 
+def payment_link_request(order):
+    """Payment link body for an order (amount in paise)."""
+    address = order["shipping_address"]
+    return {
+        "amount": int(order["total_amount"] * 100),
+        "currency": "INR",
+        "accept_partial": False,
+        "description": f"Payment for Everaura Order {order['order_id']}",
+        "customer": {
+            "name": address['name'],
+            "email": address['email'],
+            "contact": address['phone']
+        },
+        "notify": {
+            "sms": True,
+            "email": True
+        },
+        "reminder_enable": True,
+        "callback_url": f"{FRONTEND_URL}/my-orders.html?order_id={order['order_id']}",
+        "callback_method": "get"
+    }
+
+def attach_payment_link(order):
+    """Creates the order's payment link, stores it on the order and returns its URL."""
+    provider = get_payment_provider()
+    with external_call(provider.name, "payment_link.create"):
+        payment_link = provider.create_payment_link(payment_link_request(order))
+    orders_collection.update_one(
+        {"_id": order["_id"]},
+        {"$set": {
+            "payment_link_id": payment_link['id'],
+            "razorpay_short_url": payment_link['short_url'],
+            "payment_link_status": "ready"
+        }, "$unset": {"payment_link_error": ""}}
+    )
+    return payment_link['short_url']
+
+def process_payment_link(payload):
+    """Job handler for async checkout: creates the payment link of a pending order."""
+    order = orders_collection.find_one({"_id": payload["order_id"]})
+    if order is None or order.get("payment_link_id") or order.get("status") != "Pending":
+        return
+    try:
+        attach_payment_link(order)
+    except PaymentProviderError as e:
+        if e.retryable:
+            orders_collection.update_one({"_id": order["_id"]}, {"$set": {"payment_link_error": str(e)}})
+            raise
+        # The provider rejected this order outright; retrying cannot help.
+        logger.error(f"Payment link rejected for order {order['order_id']}: {e}")
+        cancelled = orders_collection.find_one_and_update(
+            {"_id": order["_id"], "status": "Pending", "payment_link_id": None},
+            {"$set": {"status": CANCELLED, "payment_link_status": "failed", "payment_link_error": str(e)}}
+        )
+        if cancelled:
+            release_order_hold(order["_id"])
+            record_analytics(order_analytics.status_changed, order, "Pending", CANCELLED)
+
+job_queue.register("payment_link", process_payment_link)
+
+def payment_link_state(order):
+    """(body, HTTP status) for a payment-link poll: 200 once settled, 202 while the link is being created."""
+    order_id_str = order["order_id"]
+    if order.get("payment_status") == "Paid":
+        return {"status": "paid", "order_id": order_id_str,
+                "payment_url": f"{FRONTEND_URL}/my-orders.html?order_id={order_id_str}"}, 200
+    if order.get("razorpay_short_url"):
+        return {"status": "ready", "order_id": order_id_str, "payment_url": order["razorpay_short_url"]}, 200
+    failed = order.get("payment_link_status") == "failed" or order.get("status") == CANCELLED
+    if not failed and order.get("payment_link_job_id"):
+        job = job_queue.status(order["payment_link_job_id"])
+        failed = job is not None and job.get("status") == "dead"
+    if failed:
+        return {"status": "failed", "order_id": order_id_str,
+                "error": "We could not start the payment for this order. Please place it again."}, 200
+    return {"status": "pending", "order_id": order_id_str}, 202
+
 @app.route('/api/payment/webhook', methods=['POST'])
 def payment_webhook():
     data = request.get_json(silent=True) or {}
@@ -646,57 +1489,58 @@ def payment_webhook():
 
         # 3. Find and update the order
         # Idempotency guard: only the first paid event can flip Pending -> Paid.
+        paid_fields = {
+            "payment_status": "Paid",
+            "status": "Paid", # Set initial status to "Paid"
+            "payment_id": payment_id,
+            "paid_at": datetime.now(timezone.utc)
+        }
+        # The pre-update document tells the analytics rollup which status the order left.
+        # Cancelled is final, so a cancelled order is never reopened here (see below).
         order = orders_collection.find_one_and_update(
-            {"payment_link_id": payment_link_id, "payment_status": {"$ne": "Paid"}},
-            {"$set": {
-                "payment_status": "Paid",
-                "status": "Paid", # Set initial status to "Paid"
-                "payment_id": payment_id,
-                "paid_at": datetime.now(timezone.utc)
-            }},
-            return_document=True
+            {"payment_link_id": payment_link_id, "payment_status": {"$ne": "Paid"}, "status": {"$ne": CANCELLED}},
+            {"$set": paid_fields},
+            return_document=ReturnDocument.BEFORE
         )
 
         if order:
-            inventory_updated, inventory_error = deduct_order_inventory(order['_id'], order['items'])
-            if not inventory_updated:
-                logger.error(f"Inventory deduction failed for paid order {order['order_id']}: {inventory_error}")
-
-            coupon_code = (order.get("coupon_code") or "").strip().upper()
-            if coupon_code:
-                coupon_increment = coupons_collection.update_one(
-                    {"code": coupon_code},
-                    {"$inc": {"used_count": 1}}
-                )
-                if coupon_increment.modified_count != 1:
-                    logger.warning(
-                        f"Order {order['order_id']} used coupon {coupon_code}, but coupon usage increment failed."
-                    )
-
-            # 4. Send confirmation email
-            subject = f"Your Everaura Order is Confirmed! (ID: {order['order_id']})"
-            html_body = f"""
-            <div style="font-family: Arial, sans-serif; line-height: 1.6;">
-                <h2>Thank you for your purchase, {order['shipping_address']['name']}!</h2>
-                <p>Your payment has been successfully processed and your order <strong>(ID: {order['order_id']})</strong> is confirmed.</p>
-                <p>We will notify you again once your order has been shipped.</p>
-                <h3>Order Summary:</h3>
-                <ul>
-                    {"".join([f"<li>{item['name']} (x{item['quantity']}) - ₹{item['price'] * item['quantity']:.2f}</li>" for item in order['items']])}
-                </ul>
-                <p><strong>Total Paid: ₹{order['total_amount']:.2f}</strong></p>
-                <p>You can track your order status on your "My Orders" page:</p>
-                <a href="{FRONTEND_URL}/my-orders.html" style="display: inline-block; padding: 10px 15px; background-color: #000; color: #fff; text-decoration: none; border-radius: 5px;">View My Orders</a>
-                <br><br>
-                <p>Thank you,<br>The Everaura Team</p>
-            </div>
-            """
+            # 4. Hand inventory, coupon usage and the confirmation email to the job workers
             try:
-                send_email(order['shipping_address']['email'], subject, html_body)
-                logger.info(f"Order {order['order_id']} marked as Paid. Confirmation email sent.")
+                job_queue.enqueue("order_paid", {"order_id": order["_id"]})
+                logger.info(f"Order {order['order_id']} marked as Paid. Post-payment job queued.")
             except Exception as e:
-                logger.error(f"Order {order['order_id']} paid, but confirmation email failed: {e}")
+                logger.error(f"Failed to queue post-payment job for order {order['order_id']}: {e}")
+                # Undo the transition so that Razorpay's retry of this webhook is processed again.
+                orders_collection.update_one(
+                    {"_id": order["_id"], "payment_status": "Paid"},
+                    {"$set": {"payment_status": "Pending", "status": "Pending"},
+                     "$unset": {"paid_at": "", "payment_id": ""}}
+                )
+                return jsonify({"error": "Failed to process payment event"}), 500
+            paid_order = {**order, **paid_fields}
+            record_analytics(order_analytics.status_changed, paid_order, order.get("status"), "Paid")
+            record_analytics(order_analytics.order_paid, paid_order)
         else:
+            # The customer paid after the order was cancelled (by an admin, or after its link was
+            # rejected): record the payment and flag it for a refund, leaving the order Cancelled.
+            cancelled_order = orders_collection.find_one_and_update(
+                {"payment_link_id": payment_link_id, "payment_status": {"$ne": "Paid"}, "status": CANCELLED},
+                {"$set": {
+                    "payment_status": "Paid",
+                    "payment_id": payment_id,
+                    "paid_at": paid_fields["paid_at"],
+                    "refund_status": "required"
+                }},
+                return_document=ReturnDocument.AFTER
+            )
+            if cancelled_order:
+                logger.warning(
+                    f"Payment {payment_id} received for cancelled order {cancelled_order['order_id']}; flagged for refund."
+                )
+                # Its Cancelled status was already counted; only the payment is new.
+                record_analytics(order_analytics.cancelled_order_paid, cancelled_order)
+                return jsonify({"status": "ok"}), 200
+
             existing_order = orders_collection.find_one({"payment_link_id": payment_link_id})
             if existing_order and existing_order.get("payment_status") == "Paid":
                 logger.info(
@@ -707,12 +1551,114 @@ def payment_webhook():
 
     return jsonify({"status": "ok"}), 200
 
+def send_order_confirmation(order):
+    """Emails the customer that their payment went through."""
+    subject = f"Your Everaura Order is Confirmed! (ID: {order['order_id']})"
+    html_body = f"""
+    <div style="font-family: Arial, sans-serif; line-height: 1.6;">
+        <h2>Thank you for your purchase, {order['shipping_address']['name']}!</h2>
+        <p>Your payment has been successfully processed and your order <strong>(ID: {order['order_id']})</strong> is confirmed.</p>
+        <p>We will notify you again once your order has been shipped.</p>
+        <h3>Order Summary:</h3>
+        <ul>
+            {"".join([f"<li>{item['name']} (x{item['quantity']}) - ₹{item['price'] * item['quantity']:.2f}</li>" for item in order['items']])}
+        </ul>
+        <p><strong>Total Paid: ₹{order['total_amount']:.2f}</strong></p>
+        <p>You can track your order status on your "My Orders" page:</p>
+        <a href="{FRONTEND_URL}/my-orders.html" style="display: inline-block; padding: 10px 15px; background-color: #000; color: #fff; text-decoration: none; border-radius: 5px;">View My Orders</a>
+        <br><br>
+        <p>Thank you,<br>The Everaura Team</p>
+    </div>
+    """
+    send_email(order['shipping_address']['email'], subject, html_body)
+
+def process_paid_order(payload):
+    """
+    Job handler for "order_paid". Each side effect is claimed on the order first,
+    so a retried job only redoes the steps that have not completed.
+    """
+    order = orders_collection.find_one({"_id": payload["order_id"]})
+    if not order:
+        logger.warning(f"order_paid job for unknown order {payload['order_id']}")
+        return
+
+    inventory_updated, inventory_error = deduct_order_inventory(order['_id'], order['items'])
+    if not inventory_updated:
+        logger.error(f"Inventory deduction failed for paid order {order['order_id']}: {inventory_error}")
+
+    # Coupon uses are normally counted at checkout; count it now if the hold was released.
+    coupon_code = (order.get("coupon_code") or "").strip().upper()
+    if coupon_code:
+        coupon_claim = orders_collection.update_one(
+            {"_id": order["_id"], "coupon_redeemed": {"$ne": True}},
+            {"$set": {"coupon_redeemed": True}}
+        )
+        if coupon_claim.modified_count == 1 and not redeem_coupon(coupon_code):
+            orders_collection.update_one({"_id": order["_id"]}, {"$set": {"coupon_redeemed": False}})
+            logger.warning(
+                f"Order {order['order_id']} used coupon {coupon_code}, but coupon usage increment failed."
+            )
+
+    email_claim = orders_collection.update_one(
+        {"_id": order["_id"], "confirmation_email_sent": {"$ne": True}},
+        {"$set": {"confirmation_email_sent": True}}
+    )
+    if email_claim.modified_count == 1:
+        try:
+            send_order_confirmation(order)
+        except Exception as e:
+            orders_collection.update_one({"_id": order["_id"]}, {"$unset": {"confirmation_email_sent": ""}})
+            raise RuntimeError(f"Confirmation email failed for order {order['order_id']}: {e}")
+
+    if not inventory_updated:
+        # Retried with backoff, then dead-lettered for an admin to resolve.
+        raise RuntimeError(f"Inventory deduction failed: {inventory_error}")
+
+job_queue.register("order_paid", process_paid_order)
+
+@app.route('/api/orders/<order_id>/payment-link', methods=['GET'])
+@jwt_required()
+def get_order_payment_link(order_id):
+    """Payment link of an order placed in async mode. `?wait=<seconds>` long-polls until it is ready."""
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0.0), PAYMENT_LINK_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    query = {"order_id": order_id, "user_id": ObjectId(get_jwt_identity())}
+    projection = {"order_id": 1, "status": 1, "payment_status": 1, "razorpay_short_url": 1,
+                  "payment_link_status": 1, "payment_link_job_id": 1}
+    deadline = time.monotonic() + wait
+    delay = 0.2
+    try:
+        while True:
+            order = orders_collection.find_one(query, projection)
+            if order is None:
+                return jsonify({"error": "Order not found"}), 404
+            body, status = payment_link_state(order)
+            remaining = deadline - time.monotonic()
+            if status != 202 or remaining <= 0:
+                break
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 1.0)
+    except Exception as e:
+        logger.error(f"Failed to fetch payment link for order {order_id}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+    response = jsonify(body)
+    if status == 202:
+        response.headers["Retry-After"] = "1"
+    return response, status
+
 @app.route('/api/orders/my-orders', methods=['GET'])
 @jwt_required()
 def get_my_orders():
     user_id = get_jwt_identity()
-    orders = orders_collection.find({"user_id": ObjectId(user_id)}).sort("created_at", -1)
-    return jsonify([serialize_doc(order) for order in orders])
+    query = {"user_id": ObjectId(user_id), **order_status_filter(request.args)}
+    try:
+        return paginated_orders_response(
+            orders_listing, query, request.args, default_limit=MY_ORDERS_PAGE_SIZE_DEFAULT
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 # --- ADMIN ROUTES (Orders) ---
 
@@ -720,101 +1666,306 @@ def get_my_orders():
 def get_admin_orders():
     auth_error = check_admin_key()
     if auth_error: return auth_error
-    
-    orders = orders_collection.find().sort("created_at", -1)
-    return jsonify([serialize_doc(order) for order in orders])
+
+    try:
+        query = order_status_filter(request.args)
+        if request.args.get("format") == "ndjson":
+            return ndjson_orders_response(orders_listing, query, request.args)
+        return paginated_orders_response(orders_listing, query, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+# --- ADMIN ROUTES (Analytics) ---
+
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_DAYS = 3 * 366
+
+def analytics_range(args):
+    """(start, end) day strings from ?start=&end= (YYYY-MM-DD) or ?days=N ending today."""
+    today = datetime.strptime(order_analytics.day_of(None), "%Y-%m-%d")
+    try:
+        end = datetime.strptime(args["end"], "%Y-%m-%d") if args.get("end") else today
+        if args.get("start"):
+            start = datetime.strptime(args["start"], "%Y-%m-%d")
+        else:
+            start = end - timedelta(days=int(args.get("days", ANALYTICS_DEFAULT_DAYS)) - 1)
+    except ValueError:
+        raise ValueError("Use start/end as YYYY-MM-DD and days as a whole number")
+    if start > end:
+        raise ValueError("start must not be after end")
+    if (end - start).days >= ANALYTICS_MAX_DAYS:
+        raise ValueError(f"The range can span at most {ANALYTICS_MAX_DAYS} days")
+    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+def analytics_response(build):
+    auth_error = check_admin_key()
+    if auth_error: return auth_error
+    try:
+        start, end = analytics_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        return jsonify(build(start, end))
+    except Exception as e:
+        logger.error(f"Failed to load analytics: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@app.route('/api/admin/analytics/summary', methods=['GET'])
+def get_analytics_summary():
+    """Totals for the range: orders by status, revenue, net revenue and average order value."""
+    return analytics_response(order_analytics.summary)
+
+@app.route('/api/admin/analytics/revenue', methods=['GET'])
+def get_analytics_revenue():
+    return analytics_response(lambda start, end: {
+        "start": start, "end": end, "days": order_analytics.revenue_by_day(start, end)
+    })
+
+@app.route('/api/admin/analytics/top-products', methods=['GET'])
+def get_analytics_top_products():
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 100)
+    by = "revenue" if request.args.get("by") == "revenue" else "quantity"
+    return analytics_response(lambda start, end: {
+        "start": start, "end": end, "products": order_analytics.top_products(start, end, limit=limit, by=by)
+    })
+
+@app.route('/api/admin/analytics/coupons', methods=['GET'])
+def get_analytics_coupons():
+    return analytics_response(lambda start, end: {
+        "start": start, "end": end, "coupons": order_analytics.coupon_redemptions(start, end)
+    })
+
+@app.route('/api/admin/jobs', methods=['GET'])
+def get_job_stats():
+    auth_error = check_admin_key()
+    if auth_error: return auth_error
+    try:
+        return jsonify(job_queue.stats())
+    except Exception as e:
+        logger.error(f"Failed to fetch job stats: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@app.route('/api/admin/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    auth_error = check_admin_key()
+    if auth_error: return auth_error
+    if not ObjectId.is_valid(job_id):
+        return jsonify({"error": "Invalid job id"}), 400
+    try:
+        job = job_queue.status(ObjectId(job_id))
+    except Exception as e:
+        logger.error(f"Failed to fetch job {job_id}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint (per-process request, Mongo and external-call metrics)."""
+    bearer = request.headers.get('Authorization', '')
+    # Compared as bytes: compare_digest raises TypeError on non-ASCII str input.
+    token_ok = bool(METRICS_TOKEN) and hmac.compare_digest(bearer.encode("utf-8"), f"Bearer {METRICS_TOKEN}".encode("utf-8"))
+    if not token_ok:
+        auth_error = check_admin_key()
+        if auth_error: return auth_error
+    return app.response_class(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+def tracking_button(tracking_link):
+    label = "Track with India Post" if "indiapost.gov.in" in tracking_link else "Track Package"
+    return f"<a href='{tracking_link}' style='display: inline-block; padding: 10px 15px; background-color: #000; color: #fff; text-decoration: none; border-radius: 5px;'>{label}</a>"
+
+def render_status_email(notice):
+    """Subject and body of the (coalesced) status email for one order."""
+    status = notice["status"]
+    tracking_link = notice.get("tracking_link")
+    if status == SHIPPED and tracking_link:
+        subject = f"Your Everaura Order Has Shipped! (ID: {notice['order_id']})"
+        intro = f"<p>Good news! Your order <strong>(ID: {notice['order_id']})</strong> has shipped.</p>"
+    else:
+        subject = f"Your Everaura Order Status: {status} (ID: {notice['order_id']})"
+        intro = f"<p>The status of your order <strong>(ID: {notice['order_id']})</strong> has been updated to: <strong>{status}</strong>.</p>"
+    body = f"""
+    <div style="font-family: Arial, sans-serif; line-height: 1.6;">
+        <p>Hi {notice['name']},</p>
+        {intro}
+    """
+    if status == SHIPPED and tracking_link:
+        body += f"<p>You can track your package here:</p>{tracking_button(tracking_link)}"
+    body += """
+        <br><br>
+        <p>Thank you,<br>The Everaura Team</p>
+    </div>
+    """
+    return subject, body
+
+status_notifier = StatusNotifier(
+    order_notifications_collection,
+    job_queue,
+    render=render_status_email,
+    send=send_email,
+    window_seconds=ORDER_EMAIL_COALESCE_SECONDS,
+)
+
+def apply_order_updates(updates):
+    """
+    Applies admin updates ({order_id, status?, tracking_link?}) to many orders with one
+    read and one bulk_write. Status changes must follow order_status.TRANSITIONS.
+
+    Returns (updated, failed): the updated orders as they are now, and
+    {order_id, error, code} entries for the ones that were rejected.
+    """
+    failed = []
+    requested = {}
+    for update in updates:
+        order_id = str(update.get("order_id") or "").strip()
+        status = update.get("status") or None
+        tracking_link = (update.get("tracking_link") or "").strip() or None
+        if not order_id:
+            failed.append({"order_id": None, "error": "order_id is required", "code": 400})
+        elif not status and not tracking_link:
+            failed.append({"order_id": order_id, "error": "status or tracking_link is required", "code": 400})
+        elif order_id in requested:
+            failed.append({"order_id": order_id, "error": "Order listed more than once", "code": 400})
+        else:
+            requested[order_id] = (status, tracking_link)
+    if not requested:
+        return [], failed
+
+    orders = {order["order_id"]: order for order in orders_collection.find({"order_id": {"$in": list(requested)}})}
+    # Written with every change so that, if some guarded updates miss, the ones that landed can be told apart.
+    batch_id = str(ObjectId())
+    operations, planned = [], []
+    for order_id, (status, tracking_link) in requested.items():
+        order = orders.get(order_id)
+        if order is None:
+            failed.append({"order_id": order_id, "error": "Order not found", "code": 404})
+            continue
+        current = order.get("status") or "Pending"
+        error = transition_error(current, status) if status else None
+        if error:
+            failed.append({"order_id": order_id, "error": error, "code": 400 if "Unknown status" in error else 409})
+            continue
+        changes = {}
+        if status and status != current:
+            changes["status"] = status
+        if tracking_link and tracking_link != order.get("tracking_link"):
+            changes["tracking_link"] = tracking_link
+        if changes:
+            # Guarded on the status that was validated, so a concurrent change cannot produce an illegal jump.
+            operations.append(UpdateOne(
+                {"_id": order["_id"], "status": order.get("status")},
+                {"$set": {**changes, "update_batch_id": batch_id}},
+            ))
+        planned.append((order, changes))
+
+    if operations:
+        result = orders_collection.bulk_write(operations, ordered=False)
+        if result.matched_count < len(operations):
+            changed_ids = [order["_id"] for order, changes in planned if changes]
+            landed = {doc["_id"] for doc in orders_collection.find(
+                {"_id": {"$in": changed_ids}, "update_batch_id": batch_id}, {"_id": 1}
+            )}
+            still_planned = []
+            for order, changes in planned:
+                if changes and order["_id"] not in landed:
+                    failed.append({"order_id": order["order_id"], "error": "Order was updated concurrently; reload and retry", "code": 409})
+                else:
+                    still_planned.append((order, changes))
+            planned = still_planned
+
+    status_changes, notices, updated = [], [], []
+    for order, changes in planned:
+        new_order = {**order, **changes}
+        updated.append(new_order)
+        if "status" in changes:
+            status_changes.append((order, order.get("status"), changes["status"]))
+            if changes["status"] == CANCELLED:
+                try:
+                    release_order_hold(order["_id"])
+                except Exception as e:
+                    logger.error(f"Failed to release stock hold for cancelled order {order['order_id']}: {e}")
+        # Customers hear about status changes, and about tracking links once the order has shipped.
+        notify = "status" in changes or ("tracking_link" in changes and new_order.get("status") == SHIPPED)
+        address = order.get("shipping_address") or {}
+        if notify and address.get("email"):
+            notices.append({
+                "order_mongo_id": order["_id"],
+                "order_id": order["order_id"],
+                "email": address["email"],
+                "name": address.get("name", ""),
+                "status": new_order.get("status"),
+                "tracking_link": new_order.get("tracking_link"),
+            })
+
+    record_analytics(order_analytics.statuses_changed, status_changes)
+    try:
+        status_notifier.notify(notices)
+    except Exception as e:
+        logger.error(f"Failed to queue status notifications for {len(notices)} order(s): {e}")
+    return updated, failed
+
+def single_order_update_response(update):
+    updated, failed = apply_order_updates([update])
+    if failed:
+        return jsonify({"error": failed[0]["error"]}), failed[0]["code"]
+    return jsonify(serialize_doc(updated[0]))
 
 @app.route('/api/admin/orders/<order_id>/update-status', methods=['PUT'])
 def update_order_status(order_id):
     auth_error = check_admin_key()
     if auth_error: return auth_error
     
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     new_status = data.get('status')
     if not new_status:
         return jsonify({"error": "New status is required"}), 400
-
-    order = orders_collection.find_one_and_update(
-        {"order_id": order_id},
-        {"$set": {"status": new_status}},
-        return_document=True
-    )
-
-    if order:
-        # Send status update email
-        subject = f"Your Everaura Order Status: {new_status} (ID: {order['order_id']})"
-        body = f"""
-        <div style="font-family: Arial, sans-serif; line-height: 1.6;">
-            <p>Hi {order['shipping_address']['name']},</p>
-            <p>The status of your order <strong>(ID: {order['order_id']})</strong> has been updated to: <strong>{new_status}</strong>.</p>
-        """
-        
-        if new_status == "Shipped" and order.get('tracking_link'):
-            body += f"<p>You can track your package here:</p>"
-            if "indiapost.gov.in" in order['tracking_link']:
-                body += f"<a href='{order['tracking_link']}' style='display: inline-block; padding: 10px 15px; background-color: #000; color: #fff; text-decoration: none; border-radius: 5px;'>Track with India Post</a>"
-            else:
-                body += f"<a href='{order['tracking_link']}' style='display: inline-block; padding: 10px 15px; background-color: #000; color: #fff; text-decoration: none; border-radius: 5px;'>Track Package</a>"
-        
-        body += f"""
-            <br><br>
-            <p>Thank you,<br>The Everaura Team</p>
-        </div>
-        """
-        try:
-            send_email(order['shipping_address']['email'], subject, body)
-            logger.info(f"Status update email sent for order {order['order_id']}")
-        except Exception as e:
-            logger.error(f"Failed to send status update email for order {order['order_id']}: {e}")
-            
-        return jsonify(serialize_doc(order))
-    else:
-        return jsonify({"error": "Order not found"}), 404
+    return single_order_update_response({"order_id": order_id, "status": new_status})
 
 @app.route('/api/admin/orders/<order_id>/add-tracking', methods=['PUT'])
 def add_tracking(order_id):
     auth_error = check_admin_key()
     if auth_error: return auth_error
     
-    data = request.get_json()
-    tracking_link = data.get('tracking_link')
+    data = request.get_json(silent=True) or {}
+    tracking_link = (data.get('tracking_link') or '').strip()
     if not tracking_link:
         return jsonify({"error": "Tracking link is required"}), 400
+    return single_order_update_response({"order_id": order_id, "tracking_link": tracking_link})
 
-    order = orders_collection.find_one_and_update(
-        {"order_id": order_id},
-        {"$set": {"tracking_link": tracking_link}},
-        return_document=True
-    )
+@app.route('/api/admin/orders/bulk-update', methods=['POST'])
+def bulk_update_orders():
+    """
+    Applies status transitions and/or tracking links to many orders at once. Body is either
+    {"updates": [{"order_id", "status"?, "tracking_link"?}, ...]} or
+    {"order_ids": [...], "status": "..."} to move several orders to the same status.
+    """
+    auth_error = check_admin_key()
+    if auth_error: return auth_error
 
-    if order:
-        # If status is "Shipped", send notification with link
-        if order['status'] == 'Shipped':
-            subject = f"Your Everaura Order Has Shipped! (ID: {order['order_id']})"
-            body = f"""
-            <div style="font-family: Arial, sans-serif; line-height: 1.6;">
-                <p>Hi {order['shipping_address']['name']},</p>
-                <p>Good news! Your order <strong>(ID: {order['order_id']})</strong> has shipped.</p>
-                <p>You can track your package here:</p>
-            """
-            if "indiapost.gov.in" in tracking_link:
-                body += f"<a href='{tracking_link}' style='display: inline-block; padding: 10px 15px; background-color: #000; color: #fff; text-decoration: none; border-radius: 5px;'>Track with India Post</a>"
-            else:
-                 body += f"<a href='{tracking_link}' style='display: inline-block; padding: 10px 15px; background-color: #000; color: #fff; text-decoration: none; border-radius: 5px;'>Track Package</a>"
-            body += f"""
-                <br><br>
-                <p>Thank you,<br>The Everaura Team</p>
-            </div>
-            """
-            try:
-                send_email(order['shipping_address']['email'], subject, body)
-                logger.info(f"Tracking email sent for order {order['order_id']}")
-            except Exception as e:
-                logger.error(f"Failed to send tracking email for order {order['order_id']}: {e}")
-            
-        return jsonify(serialize_doc(order))
-    else:
-        return jsonify({"error": "Order not found"}), 404
+    data = request.get_json(silent=True) or {}
+    updates = data.get("updates")
+    if updates is None and isinstance(data.get("order_ids"), list):
+        updates = [{"order_id": order_id, "status": data.get("status")} for order_id in data["order_ids"]]
+    if not isinstance(updates, list) or not updates:
+        return jsonify({"error": "Provide a non-empty 'updates' list or 'order_ids' with a 'status'"}), 400
+    if len(updates) > ORDER_BULK_UPDATE_MAX:
+        return jsonify({"error": f"At most {ORDER_BULK_UPDATE_MAX} orders can be updated per request"}), 400
+    if not all(isinstance(update, dict) for update in updates):
+        return jsonify({"error": "Each update must be an object"}), 400
+
+    try:
+        updated, failed = apply_order_updates(updates)
+    except Exception as e:
+        logger.error(f"Bulk order update failed: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+    return jsonify({
+        "updated": [
+            {"order_id": order["order_id"], "status": order.get("status"), "tracking_link": order.get("tracking_link")}
+            for order in updated
+        ],
+        "failed": failed,
+    })
 
 # --- EXISTING CONTENT ROUTES (Modified with Admin Auth) ---
 
@@ -825,6 +1976,11 @@ def get_products():
         gender = request.args.get('gender')
         product_type = request.args.get('type')
 
+        cache_key = catalog_key(category, gender, int(product_type) if product_type else None)
+        cached = catalog_cache.get_response(cache_key)
+        if cached is not None:
+            return cached_json_response(*cached)
+
         query = {}
         if category and category != 'all':
             query['category'] = category
@@ -833,24 +1989,105 @@ def get_products():
         if product_type:
             query['type'] = int(product_type) # 0 for Anti-Tarnish, 1 for Jewelry
 
-        products = products_collection.find(query)
-        return jsonify([serialize_product(p) for p in products])
+        cache_version = catalog_cache.version
+        products = [serialize_product(p) for p in catalog_source().find(query)]
+        return cached_json_response(*catalog_cache.store(cache_key, products, cache_version))
     except Exception as e:
         logger.error(f"Failed to fetch products: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
+def text_search_products(q, filters, min_price, max_price, in_stock, sort, limit, offset):
+    """Fallback for product search using the Mongo text index (facets are not disjunctive here)."""
+    match = {}
+    if q:
+        match["$text"] = {"$search": q}
+    for field, values in filters.items():
+        # type/material are stored as integers by the admin form, gender/category as strings.
+        match[field] = {"$in": values + [int(v) for v in values if v.lstrip("-").isdigit()]}
+    if min_price is not None or max_price is not None:
+        match["price"] = {}
+        if min_price is not None:
+            match["price"]["$gte"] = min_price
+        if max_price is not None:
+            match["price"]["$lte"] = max_price
+    if in_stock:
+        match["$expr"] = {"$gt": [
+            {"$subtract": [{"$ifNull": ["$quantity", 0]}, {"$ifNull": ["$reserved", 0]}]}, 0
+        ]}
+
+    sort_keys = {
+        "price_asc": {"price": 1, "name": 1},
+        "price_desc": {"price": -1, "name": 1},
+        "trending": {"_trending": -1, "_score": -1, "name": 1},
+    }.get(sort, {"_score": -1, "name": 1})
+    pipeline = [
+        {"$match": match},
+        {"$addFields": {
+            "_score": {"$meta": "textScore"} if q else 0,
+            "_trending": {"$in": [
+                {"$toLower": {"$toString": {"$ifNull": ["$isTrending", ""]}}}, list(TRENDING_VALUES)
+            ]},
+        }},
+        {"$facet": {
+            "results": [{"$sort": sort_keys}, {"$skip": offset}, {"$limit": limit},
+                        {"$project": {"_score": 0, "_trending": 0}}],
+            "total": [{"$count": "count"}],
+            **{field: [{"$sortByCount": f"${field}"}] for field in FACET_FIELDS},
+        }},
+    ]
+    outcome = next(products_browse.aggregate(pipeline), {})
+    total = outcome.get("total") or [{"count": 0}]
+    return {
+        "query": q,
+        "total": total[0]["count"],
+        "limit": limit,
+        "offset": offset,
+        "sort": sort,
+        "results": [serialize_product(p) for p in outcome.get("results", [])],
+        "facets": {
+            field: {str(row["_id"]): row["count"] for row in outcome.get(field, []) if row["_id"] not in (None, "")}
+            for field in FACET_FIELDS
+        },
+        "source": "text",
+    }
+
+@app.route('/api/products/search', methods=['GET'])
+def search_products():
+    """
+    Product search: ?q= (name/description/category words, last word may be partial),
+    ?category=/gender=/type=/material= (comma-separated), ?min_price=&max_price=, ?in_stock=true,
+    ?sort=relevance|price_asc|price_desc|trending, ?limit=&offset=. Returns facet counts too.
+    """
+    try:
+        params = parse_search_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        if SEARCH_INDEX_ENABLED:
+            try:
+                return jsonify(product_search.search(**params))
+            except Exception as e:
+                logger.error(f"Product search index unavailable, using the text index: {e}")
+        return jsonify(text_search_products(**params))
+    except Exception as e:
+        logger.error(f"Failed to search products: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
 @app.route('/api/products', methods=['POST'])
 def add_product():
+    """
+    Creates the product and queues its images for the image pipeline. Responds 202 with
+    the job id; the product's `images` and `image_variants` are filled in when the job finishes.
+    """
     auth_error = check_admin_key()
     if auth_error: return auth_error
-    
-    if 'images' not in request.files:
+
+    files = [f for f in request.files.getlist('images') if f and f.filename]
+    if not files:
         return jsonify({"error": "No image file provided"}), 400
+    if len(files) > IMAGE_MAX_FILES:
+        return jsonify({"error": f"At most {IMAGE_MAX_FILES} images can be uploaded"}), 400
     try:
-        file_to_upload = request.files['images']
-        upload_result = cloudinary.uploader.upload(file_to_upload, folder="everaura_products")
-        image_url = upload_result.get("secure_url")
-
         id_val = int(request.form.get('id'))
         name = request.form.get('name')
         price = float(request.form.get('price'))
@@ -862,23 +2099,88 @@ def add_product():
         description = request.form.get('description')
         isTrending = request.form.get('isTrending')
         quantity = int(request.form.get('quantity', 0))
-        if quantity < 0:
-            return jsonify({"error": "Quantity cannot be negative"}), 400
-        
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid product fields"}), 400
+    if quantity < 0:
+        return jsonify({"error": "Quantity cannot be negative"}), 400
+
+    uploads = []
+    for position, file in enumerate(files):
+        if not (file.mimetype or "").startswith("image/"):
+            return jsonify({"error": f"{file.filename} is not an image"}), 400
+        data = file.read(IMAGE_MAX_BYTES + 1)
+        if len(data) > IMAGE_MAX_BYTES:
+            return jsonify({"error": f"{file.filename} is larger than {IMAGE_MAX_BYTES // (1024 * 1024)} MB"}), 413
+        uploads.append({"position": position, "filename": file.filename, "content_type": file.mimetype, "data": data})
+
+    try:
         new_product = {
             "id": id_val, "name": name, "price": price, "category": category,
             "gender": gender, "type": type_int, "material": material_int,
             "rsn": rsn, "description": description, "isTrending": isTrending,
             "quantity": quantity,
-            "images": [image_url]
+            "images": [],
+            "image_status": "processing",
         }
         result = products_collection.insert_one(new_product)
-        created_product = products_collection.find_one({"_id": result.inserted_id})
-        return jsonify(serialize_product(created_product)), 201
+        now = datetime.now(timezone.utc)
+        image_uploads_collection.insert_many([
+            {**upload, "product_id": result.inserted_id, "created_at": now,
+             "purge_at": now + timedelta(days=IMAGE_UPLOAD_RETENTION_DAYS)}
+            for upload in uploads
+        ])
+        job_id = job_queue.enqueue("product_images", {"product_id": str(result.inserted_id)})
+        created_product = serialize_product(products_collection.find_one({"_id": result.inserted_id}))
+        catalog_cache.product_added(created_product)
+        product_search.product_added(created_product)
+        response = jsonify({
+            "product": created_product,
+            "job_id": str(job_id),
+            "status_url": f"/api/admin/jobs/{job_id}",
+        })
+        response.headers["Location"] = f"/api/admin/jobs/{job_id}"
+        return response, 202
     except Exception as e:
         logger.error(f"Failed to add product: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
+def process_product_images(payload):
+    """Job handler: stores the staged uploads with their variants and points the product at them."""
+    product_id = ObjectId(payload["product_id"])
+    uploads = list(image_uploads_collection.find({"product_id": product_id}).sort("position", 1))
+    if not uploads:
+        return  # finished by an earlier attempt
+
+    storage = get_image_storage()
+    stored = []
+    for upload in uploads:
+        # Keys are stable across retries, so a retried job overwrites rather than duplicates.
+        with external_call(IMAGE_STORAGE, "upload"):
+            stored.append(storage.store(bytes(upload["data"]), f"{product_id}-{upload['position']}", upload.get("filename")))
+
+    result = products_collection.update_one(
+        {"_id": product_id},
+        {"$set": {
+            "images": [image["original"] for image in stored],
+            "image_variants": [image["variants"] for image in stored],
+            "image_status": "ready",
+        }},
+    )
+    image_uploads_collection.delete_many({"product_id": product_id})
+    if result.matched_count:
+        updated_product = serialize_product(products_collection.find_one({"_id": product_id}))
+        catalog_cache.product_updated(updated_product)
+        product_search.product_updated(updated_product)
+
+job_queue.register("product_images", process_product_images)
+
+@app.route('/api/media/<path:filename>', methods=['GET'])
+def get_media(filename):
+    """Serves images written by the local storage backend (IMAGE_STORAGE=local only)."""
+    if IMAGE_STORAGE != "local":
+        abort(404)
+    return send_from_directory(IMAGE_LOCAL_DIR, filename, max_age=365 * 24 * 3600)
+
 
 @app.route('/api/products/<product_id>', methods=['PUT'])
 def update_product(product_id):
@@ -886,8 +2188,9 @@ def update_product(product_id):
     if auth_error: return auth_error
     try:
         update_data = request.get_json()
-        if '_id' in update_data:
-            del update_data['_id']
+        # Stock counters and derived status fields are maintained by the server.
+        for field in ('_id', 'reserved', 'available_quantity', 'in_stock', 'stock_status'):
+            update_data.pop(field, None)
         if 'quantity' in update_data:
             update_data['quantity'] = int(update_data['quantity'])
             if update_data['quantity'] < 0:
@@ -895,8 +2198,10 @@ def update_product(product_id):
         result = products_collection.update_one({"_id": ObjectId(product_id)}, {"$set": update_data})
         if result.matched_count == 0:
             return jsonify({"error": "Product not found"}), 404
-        updated_product = products_collection.find_one({"_id": ObjectId(product_id)})
-        return jsonify(serialize_product(updated_product))
+        updated_product = serialize_product(products_collection.find_one({"_id": ObjectId(product_id)}))
+        catalog_cache.product_updated(updated_product)
+        product_search.product_updated(updated_product)
+        return jsonify(updated_product)
     except Exception as e:
         logger.error(f"Failed to update product: {e}")
         return jsonify({"error": "Internal server error"}), 500
@@ -909,6 +2214,8 @@ def delete_product(product_id):
         result = products_collection.delete_one({"_id": ObjectId(product_id)})
         if result.deleted_count == 0:
             return jsonify({"error": "Product not found"}), 404
+        catalog_cache.product_removed(product_id)
+        product_search.product_removed(product_id)
         return "", 204
     except Exception as e:
         logger.error(f"Failed to delete product: {e}")
@@ -916,6 +2223,7 @@ def delete_product(product_id):
 
 # --- Testimonials ---
 @app.route('/api/testimonials', methods=['POST'])
+@rate_limited("testimonial")
 def add_testimonial():
     # No auth needed, this is public
     data = request.get_json()
@@ -940,7 +2248,7 @@ def get_all_testimonials():
     auth_error = check_admin_key()
     if auth_error: return auth_error
     try:
-        testimonials = testimonials_collection.find().sort("submitted_at", -1)
+        testimonials = testimonials_listing.find().sort("submitted_at", -1)
         return jsonify([serialize_doc(t) for t in testimonials])
     except Exception as e:
         logger.error(f"Failed to fetch all testimonials: {e}")
@@ -950,8 +2258,14 @@ def get_all_testimonials():
 def get_approved_testimonials():
     # Public route
     try:
-        approved = testimonials_collection.find({"status": "approved"})
-        return jsonify([serialize_doc(t) for t in approved])
+        cached = testimonials_cache.get_response("approved")
+        if cached is not None:
+            return cached_json_response(*cached)
+
+        cache_version = testimonials_cache.version
+        source = testimonials_critical if testimonials_cache.written_within(CATALOG_FRESH_READ_SECONDS) else testimonials_browse
+        approved = [serialize_doc(t) for t in source.find({"status": "approved"})]
+        return cached_json_response(*testimonials_cache.store("approved", approved, cache_version))
     except Exception as e:
         logger.error(f"Failed to fetch approved testimonials: {e}")
         return jsonify({"error": "Internal server error"}), 500
@@ -967,6 +2281,7 @@ def approve_testimonial(testimonial_id):
         )
         if result.matched_count == 0:
             return jsonify({"error": "Testimonial not found"}), 404
+        testimonials_cache.invalidate()
         return jsonify({"message": "Testimonial approved"}), 200
     except Exception as e:
         logger.error(f"Failed to approve testimonial: {e}")
@@ -980,6 +2295,7 @@ def delete_testimonial(testimonial_id):
         result = testimonials_collection.delete_one({"_id": ObjectId(testimonial_id)})
         if result.deleted_count == 0:
             return jsonify({"error": "Testimonial not found"}), 404
+        testimonials_cache.invalidate()
         return "", 204
     except Exception as e:
         logger.error(f"Failed to delete testimonial: {e}")
@@ -1032,6 +2348,7 @@ def add_coupon():
         if coupons_collection.find_one({"code": coupon["code"]}):
             return jsonify({"error": "Coupon code already exists"}), 409
         result = coupons_collection.insert_one(coupon)
+        coupon_index.invalidate()
         new_coupon = coupons_collection.find_one({"_id": result.inserted_id})
         return jsonify(serialize_doc(new_coupon)), 201
     except ValueError as e:
@@ -1047,7 +2364,7 @@ def get_coupons():
     auth_error = check_admin_key()
     if auth_error: return auth_error
     try:
-        all_coupons = coupons_collection.find()
+        all_coupons = coupons_listing.find()
         return jsonify([serialize_doc(c) for c in all_coupons])
     except Exception as e:
         logger.error(f"Failed to fetch coupons: {e}")
@@ -1061,6 +2378,7 @@ def delete_coupon(coupon_id):
         result = coupons_collection.delete_one({"_id": ObjectId(coupon_id)})
         if result.deleted_count == 0:
             return jsonify({"error": "Coupon not found"}), 404
+        coupon_index.invalidate()
         return "", 204
     except Exception as e:
         logger.error(f"Failed to delete coupon: {e}")
@@ -1074,17 +2392,18 @@ def apply_coupon():
     if not code:
         return jsonify({"error": "Coupon code is required"}), 400
     try:
-        coupon = coupons_collection.find_one({"code": code})
+        coupon = coupon_index.get(code)
         is_valid, error_message, error_status = validate_coupon_constraints(coupon)
         if not is_valid:
             return jsonify({"error": error_message}), error_status
-        return jsonify(serialize_doc(coupon))
+        return jsonify(coupon["doc"])
     except Exception as e:
         logger.error(f"Failed to apply coupon: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
 # --- Contact Form Route ---
 @app.route('/api/contact', methods=['POST'])
+@rate_limited("contact")
 def contact_form():
     data = request.get_json()
     name = data.get('name')
@@ -1095,6 +2414,8 @@ def contact_form():
     if not name or not email or not message:
         return jsonify({"error": "Name, email, and message are required"}), 400
 
+    message_html = message.replace('\n', '<br>')
+
     try:
         # Send email to admin
         admin_subject = subject if subject else "New Contact Form Message"
@@ -1104,7 +2425,7 @@ def contact_form():
             <p><strong>Name:</strong> {name}</p>
             <p><strong>Email:</strong> {email}</p>
             <p><strong>Message:</strong></p>
-            <p style="padding-left: 10px; border-left: 2px solid #ccc;">{message.replace('\\n', '<br>')}</p>
+            <p style="padding-left: 10px; border-left: 2px solid #ccc;">{message_html}</p>
         </div>
         """
         send_email(CONTACT_EMAIL, admin_subject, admin_body)
@@ -1116,7 +2437,7 @@ def contact_form():
             <p>Hi {name},</p>
             <p>Thank you for contacting Everaura Beauty! We've received your message and will get back to you as soon as possible.</p>
             <p><strong>Your Message:</strong></p>
-            <p style="padding-left: 10px; border-left: 2px solid #ccc;">{message.replace('\\n', '<br>')}</p>
+            <p style="padding-left: 10px; border-left: 2px solid #ccc;">{message_html}</p>
             <br>
             <p>Thank you,<br>The Everaura Team</p>
         </div>
@@ -1130,19 +2451,35 @@ def contact_form():
 
 
 # --- Health Check ---
+def payments_report():
+    if not payments_enabled():
+        return {"provider": "disabled"}
+    provider = get_payment_provider()
+    return {"provider": provider.name, "async": PAYMENT_LINK_ASYNC, "circuit": provider.breaker.snapshot()}
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    # Check DB connections
+    # Check DB connections (both URIs share one client when they point at the same cluster)
     try:
-        client_main.admin.command('ping')
-        client_orders.admin.command('ping')
-        return jsonify({"status": "ok", "message": "Backend and Databases are running"}), 200
+        get_client(MONGO_URI_MAIN).admin.command('ping')
+        get_client(MONGO_URI_ORDERS).admin.command('ping')
+        return jsonify({
+            "status": "ok",
+            "message": "Backend and Databases are running",
+            "mongo": connection_report(),
+            "payments": payments_report(),
+        }), 200
     except Exception as e:
         logger.error(f"Health check failed: DB connection error: {e}")
-        return jsonify({"status": "error", "message": "Backend is running, but database connection failed"}), 500
+        return jsonify({
+            "status": "error",
+            "message": "Backend is running, but database connection failed",
+            "mongo": connection_report(),
+        }), 500
 
 # --- Main Runner ---
 if __name__ == '__main__':
     if not all([MONGO_URI_MAIN, MONGO_URI_ORDERS, RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET, EMAIL_USER, EMAIL_PASS, SECRET_KEY, ADMIN_KEY]):
         logger.warning("Missing one or more critical environment variables!")
+    ensure_indexes()
     app.run(debug=True, port=os.getenv("PORT", 5000))
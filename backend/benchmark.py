@@ -0,0 +1,466 @@
+"""
+Load-testing harness for the Flask API.
+
+Boots app.py against a local MongoDB (or an in-memory mongomock stand-in), the fake
+payment-link provider from payments.py and a sink SMTP server, then drives a weighted
+mix of storefront, checkout, webhook and admin requests at increasing concurrency.
+Results are written as JSON (p50/p95/p99 latency, RPS and Mongo round trips per route)
+so runs can be compared between commits.
+
+Usage:
+    pip install -r requirements-bench.txt
+    python benchmark.py --mongomock --concurrency 1,4,16 --requests 500 --output bench.json
+    python benchmark.py --mongo-uri mongodb://localhost:27017 --concurrency 1,8,32
+    python benchmark.py --mongomock --startup-runs 10 --concurrency ""   # cold starts only
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_ADMIN_KEY = "bench-admin-key"
+BENCH_WEBHOOK_SECRET = "bench-webhook-secret"
+DEFAULT_MIX = "products=55,coupon=15,order=12,webhook=10,admin_orders=8"
+
+SHIPPING_ADDRESS = {
+    "name": "Bench Customer",
+    "phone": "9999999999",
+    "email": "bench@example.com",
+    "address": "1 Load Test Lane",
+    "city": "Jaipur",
+    "pincode": "302001",
+}
+
+
+# --- Local stand-ins ---
+
+class SinkSMTPHandler(socketserver.StreamRequestHandler):
+    """Accepts any SMTP conversation (including AUTH) and discards the messages."""
+
+    def handle(self):
+        self.wfile.write(b"220 bench-sink ESMTP\r\n")
+        in_data = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if in_data:
+                if line == b".\r\n":
+                    in_data = False
+                    self.server.received += 1
+                    self.wfile.write(b"250 OK\r\n")
+                continue
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.wfile.write(b"250-bench-sink\r\n250 AUTH PLAIN LOGIN\r\n")
+            elif command == b"AUTH":
+                self.wfile.write(b"235 Authentication successful\r\n")
+            elif command == b"DATA":
+                in_data = True
+                self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            elif command == b"QUIT":
+                self.wfile.write(b"221 Bye\r\n")
+                return
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+
+class SinkSMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    received = 0
+
+
+def start_smtp_sink():
+    server = SinkSMTPServer(("127.0.0.1", 0), SinkSMTPHandler)
+    threading.Thread(target=server.serve_forever, name="smtp-sink", daemon=True).start()
+    return server
+
+
+# --- Mongo round-trip counting ---
+
+_current_route = threading.local()
+
+
+def current_route():
+    return getattr(_current_route, "name", "background")
+
+
+class RoundTripCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = defaultdict(int)
+
+    def record(self):
+        with self._lock:
+            self.counts[current_route()] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+def install_command_listener(counter):
+    """Counts every command sent to a real MongoDB server."""
+    from pymongo import monitoring
+
+    class Listener(monitoring.CommandListener):
+        def started(self, event):
+            counter.record()
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    monitoring.register(Listener())
+
+
+MONGOMOCK_COUNTED_METHODS = (
+    "find", "find_one", "insert_one", "insert_many", "update_one", "update_many",
+    "delete_one", "delete_many", "find_one_and_update", "find_one_and_delete",
+    "bulk_write", "aggregate", "count_documents", "replace_one",
+)
+
+
+def install_mongomock(counter):
+    """Replaces pymongo.MongoClient with mongomock and counts collection calls as round trips."""
+    import mongomock
+    import pymongo
+
+    for name in MONGOMOCK_COUNTED_METHODS:
+        original = getattr(mongomock.collection.Collection, name, None)
+        if original is None:
+            continue
+
+        def counted(self, *args, __original=original, **kwargs):
+            counter.record()
+            return __original(self, *args, **kwargs)
+
+        setattr(mongomock.collection.Collection, name, counted)
+
+    store = mongomock.store.ServerStore()
+
+    class BenchMongoClient(mongomock.MongoClient):
+        # Every client shares one in-memory server, like a single local mongod.
+        def __init__(self, host=None, *args, **kwargs):
+            kwargs.pop("event_listeners", None)
+            super().__init__(host, *args, _store=store, **kwargs)
+
+    pymongo.MongoClient = BenchMongoClient
+
+
+# --- App bootstrap ---
+
+def boot_app(args, counter):
+    smtp = start_smtp_sink()
+    db_suffix = f"bench_{int(time.time())}"
+    base_uri = args.mongo_uri.rstrip("/") if args.mongo_uri else "mongodb://localhost:27017"
+    os.environ.update({
+        "MONGO_URI_MAIN": f"{base_uri}/{db_suffix}_main",
+        "MONGO_URI_ORDERS": f"{base_uri}/{db_suffix}_orders",
+        "SECRET_KEY": "bench-secret-key-with-enough-length-for-hs256",
+        "ADMIN_KEY": BENCH_ADMIN_KEY,
+        "RAZORPAY_KEY_ID": "rzp_bench",
+        "RAZORPAY_KEY_SECRET": "rzp_bench_secret",
+        "RAZORPAY_WEBHOOK_SECRET": BENCH_WEBHOOK_SECRET,
+        "SKIP_PAYMENT": "false",
+        "PAYMENT_PROVIDER": "fake",
+        "EMAIL_USER": "bench@example.com",
+        "EMAIL_PASS": "bench",
+        "CONTACT_EMAIL": "bench@example.com",
+        "FRONTEND_URL": "http://localhost",
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(smtp.server_address[1]),
+        "SMTP_USE_TLS": "false",
+    })
+    if args.mongomock:
+        install_mongomock(counter)
+    else:
+        install_command_listener(counter)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import logging
+    logging.disable(logging.WARNING)
+    started = time.perf_counter()
+    import app as app_module
+    import_seconds = time.perf_counter() - started
+
+    return app_module, smtp, import_seconds
+
+
+def seed(app_module, product_count):
+    from flask_jwt_extended import create_access_token
+
+    categories = ["rings", "earrings", "necklaces", "bracelets"]
+    products = [
+        {
+            "id": i,
+            "name": f"Bench Product {i}",
+            "price": float(199 + i % 50 * 10),
+            "category": categories[i % len(categories)],
+            "gender": str(i % 2),
+            "type": i % 2,
+            "material": i % 3,
+            "description": "Benchmark catalogue item",
+            "isTrending": "true" if i % 7 == 0 else "false",
+            "quantity": 1_000_000,
+            "images": [f"https://img.example/{i}.jpg"],
+        }
+        for i in range(product_count)
+    ]
+    app_module.ensure_indexes()
+    product_ids = [str(pid) for pid in app_module.products_collection.insert_many(products).inserted_ids]
+    app_module.coupons_collection.insert_one({
+        "code": "BENCH10", "discount": 10.0, "active": True,
+        "start_at": None, "end_at": None, "max_uses_total": None, "used_count": 0,
+    })
+    user_id = app_module.users_collection.insert_one({"email": SHIPPING_ADDRESS["email"]}).inserted_id
+    with app_module.app.app_context():
+        token = create_access_token(identity=str(user_id), additional_claims={"email": SHIPPING_ADDRESS["email"]})
+    return product_ids, token
+
+
+# --- Workload ---
+
+class Workload:
+    def __init__(self, app_module, product_ids, token):
+        self.app_module = app_module
+        self.product_ids = product_ids
+        self.auth = {"Authorization": f"Bearer {token}"}
+        self.unpaid_links = []
+        self._links_lock = threading.Lock()
+
+    def products(self, client):
+        category = random.choice(["all", "rings", "earrings", "necklaces", "bracelets"])
+        return client.get(f"/api/products?category={category}")
+
+    def coupon(self, client):
+        return client.post("/api/coupons/apply", json={"code": "BENCH10"})
+
+    def order(self, client):
+        items = [
+            {"_id": pid, "quantity": random.randint(1, 2)}
+            for pid in random.sample(self.product_ids, k=min(3, len(self.product_ids)))
+        ]
+        response = client.post(
+            "/api/orders/create",
+            json={"items": items, "shipping_address": SHIPPING_ADDRESS, "coupon_code": random.choice([None, "BENCH10"])},
+            headers=self.auth,
+        )
+        if response.status_code == 200:
+            # Bookkeeping read for the webhook mix; not charged to the route.
+            route, _current_route.name = current_route(), "harness"
+            order = self.app_module.orders_collection.find_one(
+                {"order_id": response.get_json()["order_id"]}, {"payment_link_id": 1}
+            )
+            _current_route.name = route
+            if order and order.get("payment_link_id"):
+                with self._links_lock:
+                    self.unpaid_links.append(order["payment_link_id"])
+        return response
+
+    def webhook(self, client):
+        with self._links_lock:
+            link_id = self.unpaid_links.pop() if self.unpaid_links else None
+        if link_id is None:
+            link_id = "plink_unknown"
+        body = json.dumps({
+            "event": "payment_link.paid",
+            "payload": {
+                "payment_link": {"entity": {"id": link_id}},
+                "payment": {"entity": {"id": f"pay_{link_id}"}},
+            },
+        }).encode("utf-8")
+        signature = hmac.new(BENCH_WEBHOOK_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        return client.post(
+            "/api/payment/webhook",
+            data=body,
+            headers={"X-Razorpay-Signature": signature, "Content-Type": "application/json"},
+        )
+
+    def admin_orders(self, client):
+        return client.get("/api/admin/orders", headers={"X-ADMIN-KEY": BENCH_ADMIN_KEY})
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile_ms(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1000, 3)
+
+
+def run_level(app_module, workload, mix, concurrency, total_requests, counter):
+    routes = list(mix)
+    weights = [mix[r] for r in routes]
+    plan = random.choices(routes, weights=weights, k=total_requests)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    clients = threading.local()
+    before = counter.snapshot()
+
+    def execute(route):
+        client = getattr(clients, "client", None)
+        if client is None:
+            client = clients.client = app_module.app.test_client()
+        _current_route.name = route
+        started = time.perf_counter()
+        try:
+            response = getattr(workload, route)(client)
+            failed = response.status_code >= 500
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - started
+        _current_route.name = "background"
+        with lock:
+            latencies[route].append(elapsed)
+            if failed:
+                errors[route] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(execute, plan))
+    duration = time.perf_counter() - started
+
+    after = counter.snapshot()
+    route_results = {}
+    for route in routes:
+        samples = latencies.get(route, [])
+        trips = after.get(route, 0) - before.get(route, 0)
+        route_results[route] = {
+            "requests": len(samples),
+            "errors": errors.get(route, 0),
+            "p50_ms": percentile_ms(samples, 0.50),
+            "p95_ms": percentile_ms(samples, 0.95),
+            "p99_ms": percentile_ms(samples, 0.99),
+            "rps": round(len(samples) / duration, 2) if duration else None,
+            "db_round_trips_per_request": round(trips / len(samples), 2) if samples else None,
+        }
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "duration_s": round(duration, 3),
+        "rps": round(total_requests / duration, 2) if duration else None,
+        "routes": route_results,
+    }
+
+
+# --- Cold start ---
+
+def startup_probe(args):
+    """Runs in a fresh interpreter: times `import app` and the first /api/products response."""
+    app_module, _, import_seconds = boot_app(args, RoundTripCounter())
+    started = time.perf_counter()
+    response = app_module.app.test_client().get("/api/products")
+    first_response_seconds = time.perf_counter() - started
+    print(json.dumps({
+        "import_ms": round(import_seconds * 1000, 3),
+        "first_response_ms": round(first_response_seconds * 1000, 3),
+        "status": response.status_code,
+    }))
+
+
+def measure_startup(args, runs):
+    """Boots the app `runs` times in new processes and summarizes import-to-first-response latency."""
+    command = [sys.executable, os.path.abspath(__file__), "--startup-probe"]
+    command += ["--mongomock"] if args.mongomock else ["--mongo-uri", args.mongo_uri]
+    samples = []
+    for _ in range(runs):
+        output = subprocess.check_output(command, stderr=subprocess.DEVNULL)
+        samples.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    def summary(values):
+        return {"p50": percentile_ms(values, 0.50), "p95": percentile_ms(values, 0.95), "max": percentile_ms(values, 1.0)}
+
+    imports = [s["import_ms"] / 1000 for s in samples]
+    first = [s["first_response_ms"] / 1000 for s in samples]
+    return {
+        "runs": runs,
+        "import_ms": summary(imports),
+        "first_response_ms": summary(first),
+        "import_to_first_response_ms": summary([a + b for a, b in zip(imports, first)]),
+        "errors": sum(1 for s in samples if s["status"] >= 500),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Everaura Flask API with local stand-ins.")
+    backend = parser.add_mutually_exclusive_group(required=True)
+    backend.add_argument("--mongomock", action="store_true", help="Use an in-memory mongomock database.")
+    backend.add_argument("--mongo-uri", help="Base URI of a local MongoDB server (databases are created per run).")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels.")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per concurrency level.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weighted route mix (default: {DEFAULT_MIX}).")
+    parser.add_argument("--products", type=int, default=200, help="Number of seeded products.")
+    parser.add_argument("--seed", type=int, default=1234, help="Random seed for a reproducible request plan.")
+    parser.add_argument("--output", help="Write results JSON to this file instead of stdout.")
+    parser.add_argument("--startup-runs", type=int, default=0,
+                        help="Also measure import-to-first-response latency over this many fresh processes.")
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_probe:
+        startup_probe(args)
+        return
+
+    startup = measure_startup(args, args.startup_runs) if args.startup_runs > 0 else None
+    random.seed(args.seed)
+    counter = RoundTripCounter()
+    app_module, smtp, _ = boot_app(args, counter)
+    product_ids, token = seed(app_module, args.products)
+    workload = Workload(app_module, product_ids, token)
+    mix = parse_mix(args.mix)
+
+    levels = [
+        run_level(app_module, workload, mix, int(level), args.requests, counter)
+        for level in args.concurrency.split(",") if level.strip()
+    ]
+    results = {
+        "revision": git_revision(),
+        "database": "mongomock" if args.mongomock else "mongodb",
+        "products": args.products,
+        "mix": mix,
+        "startup": startup,
+        "levels": levels,
+        "emails_delivered": smtp.received,
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
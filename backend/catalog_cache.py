@@ -0,0 +1,188 @@
+"""In-process caches for public listings (GET /api/products, approved testimonials)."""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def catalog_key(category=None, gender=None, product_type=None):
+    """Normalizes listing filters into the tuple used as a cache key."""
+    if category == "all":
+        category = None
+    return (category or None, gender or None, product_type)
+
+
+def key_matches(key, product):
+    """Returns True when a product would be part of the listing for this key."""
+    category, gender, product_type = key
+    if category is not None and product.get("category") != category:
+        return False
+    if gender is not None and product.get("gender") != gender:
+        return False
+    if product_type is not None and product.get("type") != product_type:
+        return False
+    return True
+
+
+def product_matches_ref(product, ref):
+    """Checks a serialized product against a ("_id", str) or ("id", int) reference."""
+    field, value = ref
+    if field == "_id":
+        return str(product.get("_id")) == str(value)
+    return product.get(field) == value
+
+
+class ListingCache:
+    """
+    Bounded LRU cache of serialized listings plus their pre-encoded JSON response bodies.
+
+    Every mutation bumps `version`, so a request that started loading from Mongo
+    before a write cannot store its (now stale) result afterwards.
+    Entries also expire after `ttl_seconds` to bound staleness from writes made
+    by other worker processes. written_within() tells loaders that a write was made
+    here recently, so they can reload from the primary rather than a lagging secondary.
+    """
+
+    def __init__(self, max_entries=64, ttl_seconds=60, encoder=None):
+        self.max_entries = max(int(max_entries), 1)
+        self.ttl_seconds = ttl_seconds
+        self.encoder = encoder or json.dumps
+        self.version = 0
+        self._written_at = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl_seconds and time.monotonic() - entry["loaded_at"] > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _encode(self, items):
+        body = self.encoder(items)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        return body, hashlib.sha1(body).hexdigest()
+
+    def _encoded(self, entry):
+        if entry["body"] is None:
+            entry["body"], entry["etag"] = self._encode(entry["items"])
+        return entry["body"], entry["etag"]
+
+    def get(self, key):
+        """Returns the cached list for a key, or None on a miss."""
+        with self._lock:
+            entry = self._live_entry(key)
+            return entry["items"] if entry else None
+
+    def get_response(self, key):
+        """Returns (body_bytes, etag) for a cached listing, encoding it at most once per change."""
+        with self._lock:
+            entry = self._live_entry(key)
+            return self._encoded(entry) if entry else None
+
+    def put(self, key, items, version):
+        """Stores a listing loaded while the cache was at `version`; stale loads are dropped."""
+        with self._lock:
+            if version != self.version:
+                return False
+            self._entries[key] = {
+                "items": items,
+                "body": None,
+                "etag": None,
+                "loaded_at": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def store(self, key, items, version):
+        """Caches a freshly loaded listing and returns its (body_bytes, etag)."""
+        if not self.put(key, items, version):
+            return self._encode(items)
+        with self._lock:
+            entry = self._entries.get(key)
+            return self._encoded(entry) if entry else self._encode(items)
+
+    def written_within(self, seconds):
+        """True if a write went through this cache in the last `seconds`."""
+        written_at = self._written_at
+        return written_at is not None and time.monotonic() - written_at < seconds
+
+    def invalidate(self):
+        """Drops every cached listing."""
+        with self._lock:
+            self._entries.clear()
+            self.version += 1
+            self._written_at = time.monotonic()
+
+
+class CatalogCache(ListingCache):
+    """Product listing cache keyed by (category, gender, type) with precise, in-place updates."""
+
+    def __init__(self, max_entries=64, ttl_seconds=60, encoder=None, stock_refresher=None):
+        super().__init__(max_entries=max_entries, ttl_seconds=ttl_seconds, encoder=encoder)
+        self.stock_refresher = stock_refresher
+
+    def product_added(self, product):
+        """Drops only the listings the new product belongs to."""
+        with self._lock:
+            for key in [k for k in self._entries if key_matches(k, product)]:
+                del self._entries[key]
+            self.version += 1
+            self._written_at = time.monotonic()
+
+    def product_updated(self, product):
+        """Replaces an updated product in place, dropping listings whose membership changed."""
+        ref = ("_id", product.get("_id"))
+        with self._lock:
+            for key in list(self._entries):
+                entry = self._entries[key]
+                products = entry["items"]
+                position = next(
+                    (i for i, p in enumerate(products) if product_matches_ref(p, ref)), None
+                )
+                belongs = key_matches(key, product)
+                if position is not None and belongs:
+                    products[position] = dict(product)
+                    entry["body"] = None
+                elif position is not None or belongs:
+                    del self._entries[key]
+            self.version += 1
+            self._written_at = time.monotonic()
+
+    def product_removed(self, product_id):
+        """Removes a deleted product from every cached listing."""
+        ref = ("_id", product_id)
+        with self._lock:
+            for entry in self._entries.values():
+                remaining = [p for p in entry["items"] if not product_matches_ref(p, ref)]
+                if len(remaining) != len(entry["items"]):
+                    entry["items"][:] = remaining
+                    entry["body"] = None
+            self.version += 1
+            self._written_at = time.monotonic()
+
+    def adjust_quantities(self, deltas, field="quantity"):
+        """
+        Patches stock counters in place after a sale, reservation or restock.
+        `deltas` maps a product reference (("_id", str) or ("id", int)) to a change of `field`.
+        """
+        if not deltas:
+            return
+        with self._lock:
+            for entry in self._entries.values():
+                for product in entry["items"]:
+                    for ref, delta in deltas.items():
+                        if product_matches_ref(product, ref):
+                            product[field] = int(product.get(field, 0) or 0) + delta
+                            if self.stock_refresher:
+                                self.stock_refresher(product)
+                            entry["body"] = None
+            self.version += 1
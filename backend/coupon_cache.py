@@ -0,0 +1,59 @@
+"""In-process index of coupons keyed by code, refreshed on admin writes and on a short TTL."""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CouponIndex:
+    """
+    Holds every coupon in memory, already prepared for validation (see `prepare`),
+    so checking a code at checkout costs no database reads.
+
+    The whole coupon set is reloaded when it is older than `ttl_seconds`, after
+    invalidate(), or on a lookup miss once `miss_reload_seconds` have passed since
+    the last load (so codes created by another worker show up quickly without letting
+    unknown codes trigger a read on every request).
+    """
+
+    def __init__(self, loader, prepare, ttl_seconds=30, miss_reload_seconds=5):
+        self.loader = loader
+        self.prepare = prepare
+        self.ttl_seconds = ttl_seconds
+        self.miss_reload_seconds = miss_reload_seconds
+        self._coupons = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _reload(self):
+        coupons = {}
+        for doc in self.loader():
+            code = (doc.get("code") or "").strip().upper()
+            if code:
+                coupons[code] = self.prepare(doc)
+        self._coupons = coupons
+        self._loaded_at = time.monotonic()
+
+    def get(self, code):
+        """Returns the prepared coupon for a code, or None if no such coupon exists."""
+        code = (code or "").strip().upper()
+        with self._lock:
+            age = None if self._loaded_at is None else time.monotonic() - self._loaded_at
+            if age is None or age > self.ttl_seconds:
+                self._reload()
+            elif code not in self._coupons and age > self.miss_reload_seconds:
+                self._reload()
+            return self._coupons.get(code)
+
+    def invalidate(self):
+        """Forces a reload on the next lookup (after add_coupon / delete_coupon)."""
+        with self._lock:
+            self._loaded_at = None
+
+    def adjust_used_count(self, code, delta):
+        """Keeps the cached usage snapshot in step with redemptions made by this process."""
+        with self._lock:
+            coupon = self._coupons.get((code or "").strip().upper())
+            if coupon is not None:
+                coupon["used_count"] = max(int(coupon.get("used_count", 0)) + delta, 0)
@@ -0,0 +1,244 @@
+"""
+MongoDB connection manager.
+
+Clients are created lazily and shared: URIs that differ only in the database name
+(for example MONGO_URI_MAIN and MONGO_URI_ORDERS on the same cluster) use one client
+and therefore one connection pool per server. Pool sizing, timeouts, wire compression
+and read preference come from the environment (see client_options).
+
+Individual routes can additionally read through a named profile (see READ_PROFILES)
+so storefront browsing can be served by secondaries while money-critical reads are
+pinned to the primary.
+"""
+import os
+import threading
+from urllib.parse import unquote
+
+from pymongo import MongoClient, monitoring
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+
+# Environment variable -> (MongoClient keyword, parser). Unset variables keep the
+# driver default (or whatever the URI itself specifies).
+CLIENT_OPTION_ENV = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "MONGO_MAX_CONNECTING": ("maxConnecting", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    # e.g. "zstd,snappy,zlib" -- zstd needs the `zstandard` package, snappy needs `python-snappy`.
+    "MONGO_COMPRESSORS": ("compressors", str),
+    "MONGO_ZLIB_COMPRESSION_LEVEL": ("zlibCompressionLevel", int),
+    # primary | primaryPreferred | secondary | secondaryPreferred | nearest
+    "MONGO_READ_PREFERENCE": ("readPreference", str),
+    "MONGO_APP_NAME": ("appname", str),
+}
+
+# Per-route read profiles: name -> (read preference, max staleness in seconds or -1, read concern level).
+# Each field can be overridden with MONGO_<NAME>_READ_PREFERENCE, MONGO_<NAME>_MAX_STALENESS_SECONDS
+# and MONGO_<NAME>_READ_CONCERN. The server requires a max staleness of at least 90 seconds.
+READ_PROFILES = {
+    # Public catalogue and testimonial listings: fine to be a little behind the primary.
+    "browse": ("secondaryPreferred", 90, "local"),
+    # Order and coupon listings; set MONGO_LISTING_READ_PREFERENCE=secondaryPreferred to offload them.
+    "listing": ("primaryPreferred", -1, "local"),
+    # Prices, stock and coupon rules used to charge a customer: always the primary.
+    "critical": ("primary", -1, "local"),
+}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client_options():
+    """MongoClient keyword arguments configured through the environment."""
+    options = {}
+    for env_name, (option, parse) in CLIENT_OPTION_ENV.items():
+        value = os.getenv(env_name)
+        if value not in (None, ""):
+            options[option] = parse(value)
+    return options
+
+
+def split_uri(uri):
+    """Splits a connection string into (scheme://hosts, database name, query string)."""
+    scheme, _, rest = uri.partition("://")
+    hosts, _, tail = rest.partition("/")
+    path, _, query = tail.partition("?")
+    return f"{scheme}://{hosts}", unquote(path) or None, query
+
+
+def pool_key(uri):
+    """
+    Identifies the client a URI can share. The database name is ignored unless it
+    also acts as the authentication database (credentials present, no explicit
+    authSource, and not an SRV URI whose TXT record supplies authSource).
+    """
+    hosts, database, query = split_uri(uri)
+    has_credentials = "@" in hosts
+    explicit_auth_source = "authsource=" in query.lower()
+    if has_credentials and not explicit_auth_source and not hosts.startswith("mongodb+srv://"):
+        return (hosts, query, database)
+    return (hosts, query, None)
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Tracks open, checked-out and waiting connections for every server pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    def _pool(self, address):
+        key = f"{address[0]}:{address[1]}"
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {"max_size": None, "open": 0, "in_use": 0, "waiting": 0,
+                                       "checkout_failures": 0, "cleared": 0}
+        return pool
+
+    def _update(self, address, **deltas):
+        with self._lock:
+            pool = self._pool(address)
+            for field, delta in deltas.items():
+                pool[field] = max(pool[field] + delta, 0)
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event.address)["max_size"] = event.options.get("maxPoolSize")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._update(event.address, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, waiting=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._update(event.address, waiting=-1, in_use=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, in_use=-1)
+
+    def snapshot(self):
+        """Per-server pool usage, with in_use / max_size as `utilization`."""
+        with self._lock:
+            pools = {key: dict(pool) for key, pool in self._pools.items()}
+        for pool in pools.values():
+            max_size = pool["max_size"]
+            pool["utilization"] = round(pool["in_use"] / max_size, 3) if max_size else None
+        return pools
+
+
+pool_stats = PoolStats()
+
+
+def get_client(uri):
+    """Returns the process-wide MongoClient serving a URI, creating it on first use."""
+    key = pool_key(uri)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = MongoClient(uri, event_listeners=[pool_stats], **client_options())
+    return client
+
+
+def get_database(uri):
+    """Returns the database named in the URI, on the (possibly shared) client."""
+    _, database, _ = split_uri(uri)
+    client = get_client(uri)
+    return client.get_database(database) if database else client.get_default_database()
+
+
+def connection_report():
+    """Client count and pool usage, for the health endpoint."""
+    with _clients_lock:
+        clients = len(_clients)
+    return {"clients": clients, "options": client_options(), "pools": pool_stats.snapshot()}
+
+
+def resolve_read_profile(profile):
+    """(read preference mode id, max staleness seconds or -1, read concern) with environment overrides."""
+    mode, max_staleness, concern = READ_PROFILES[profile]
+    prefix = f"MONGO_{profile.upper()}_"
+    mode = os.getenv(prefix + "READ_PREFERENCE") or mode
+    max_staleness = int(os.getenv(prefix + "MAX_STALENESS_SECONDS") or max_staleness)
+    concern = os.getenv(prefix + "READ_CONCERN") or concern
+    mode_id = read_pref_mode_from_name(mode)
+    if mode_id == 0:
+        # The primary mode does not accept a staleness bound.
+        max_staleness = -1
+    return mode_id, max_staleness, concern
+
+
+def read_profile_options(profile):
+    """Collection.with_options() arguments for a read profile, with environment overrides."""
+    mode_id, max_staleness, concern = resolve_read_profile(profile)
+    return {
+        "read_preference": make_read_preference(mode_id, tag_sets=None, max_staleness=max_staleness),
+        "read_concern": ReadConcern(concern),
+    }
+
+
+class LazyCollection:
+    """
+    Stands in for a pymongo Collection and resolves it on first attribute access.
+    The client (DNS/SRV lookup, pool and monitor threads) is therefore only
+    built when a request actually needs the database.
+    """
+
+    def __init__(self, uri, name, read_profile=None):
+        self._uri = uri
+        self._name = name
+        self._read_profile = read_profile
+        self._collection = None
+
+    def _resolve(self):
+        if self._collection is None:
+            collection = get_database(self._uri)[self._name]
+            if self._read_profile:
+                collection = collection.with_options(**read_profile_options(self._read_profile))
+            self._collection = collection
+        return self._collection
+
+    def with_read_profile(self, profile):
+        """Another lazy handle on the same collection that reads through a READ_PROFILES entry."""
+        if profile not in READ_PROFILES:
+            raise ValueError(f"Unknown read profile '{profile}'")
+        return LazyCollection(self._uri, self._name, profile)
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __repr__(self):
+        if self._read_profile:
+            return f"LazyCollection({self._name!r}, read_profile={self._read_profile!r})"
+        return f"LazyCollection({self._name!r})"
+
+
+def lazy_collection(uri, name, read_profile=None):
+    """A LazyCollection for `name`, or None when the database URI is not configured."""
+    return LazyCollection(uri, name, read_profile) if uri else None
@@ -0,0 +1,114 @@
+"""
+Checkout deduplication: Idempotency-Key bookkeeping and collision-free order numbers.
+
+IdempotencyStore remembers the first response to each (scope, key) in a TTL collection,
+so a double-click or client retry replays that response with one _id lookup instead of
+placing a second order. SequenceGenerator hands out order numbers that are unique and
+strictly increasing across every worker and process.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Header values longer than this are rejected rather than stored.
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(body):
+    """Hash of the raw request body; a key reused with a different body is a client bug."""
+    return hashlib.sha256(body or b"").hexdigest()
+
+
+class IdempotencyStore:
+    """
+    begin() claims a key before the work starts; the caller then either complete()s it
+    with the response to replay, or release()s it (for errors worth retrying). Documents
+    expire `ttl_seconds` after creation through a TTL index on `expires_at`.
+
+    A claim whose request died mid-way (worker crash) can be taken over once
+    `lock_seconds` have passed.
+    """
+
+    def __init__(self, collection, ttl_seconds=24 * 3600, lock_seconds=60):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+
+    def begin(self, scope, key, fingerprint):
+        """
+        Returns ("new", None) when this request owns the key, ("replay", record) when a
+        response is stored, ("in_progress", None) while another request holds the key, or
+        ("mismatch", None) when the key was first used with a different request body.
+        """
+        now = datetime.now(timezone.utc)
+        doc_id = f"{scope}:{key}"
+        try:
+            self.collection.insert_one({
+                "_id": doc_id,
+                "fingerprint": fingerprint,
+                "state": "in_progress",
+                "locked_until": now + timedelta(seconds=self.lock_seconds),
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl_seconds),
+            })
+            return "new", None
+        except DuplicateKeyError:
+            pass
+
+        record = self.collection.find_one({"_id": doc_id})
+        if record is None:
+            # Expired between the insert and the read; try once more.
+            return self.begin(scope, key, fingerprint)
+        if record["fingerprint"] != fingerprint:
+            return "mismatch", None
+        if record["state"] == "done":
+            return "replay", record
+        taken_over = self.collection.find_one_and_update(
+            {"_id": doc_id, "state": "in_progress", "locked_until": {"$lte": now}},
+            {"$set": {"locked_until": now + timedelta(seconds=self.lock_seconds)}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return ("new", None) if taken_over else ("in_progress", None)
+
+    def complete(self, scope, key, status, body, headers=None):
+        """Stores the response that later requests with this key receive."""
+        self.collection.update_one(
+            {"_id": f"{scope}:{key}"},
+            {"$set": {"state": "done", "status": status, "body": body, "headers": headers or {}},
+             "$unset": {"locked_until": ""}},
+        )
+
+    def release(self, scope, key):
+        """Forgets the key so the client can retry the same request."""
+        self.collection.delete_one({"_id": f"{scope}:{key}", "state": "in_progress"})
+
+
+class SequenceGenerator:
+    """
+    Strictly increasing numbers shared by every process through one counter document.
+
+    Each call advances the counter to max(previous + 1, now in milliseconds) in a single
+    atomic update, so numbers track the clock (EA-<ms> order IDs stay time-sortable and
+    continue the existing series) yet never repeat, even for orders placed in the same
+    millisecond on different workers.
+    """
+
+    def __init__(self, collection, name):
+        self.collection = collection
+        self.name = name
+
+    def next(self):
+        now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+        update = [{"$set": {"value": {"$max": [{"$add": [{"$ifNull": ["$value", 0]}, 1]}, now_ms]}}}]
+        try:
+            counter = self.collection.find_one_and_update(
+                {"_id": self.name}, update, upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Two first calls raced to create the counter; it exists now, so the retry updates it.
+            counter = self.collection.find_one_and_update(
+                {"_id": self.name}, update, upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        return counter["value"]
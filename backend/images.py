@@ -0,0 +1,104 @@
+"""
+Product image storage and the responsive-variant pipeline.
+
+add_product stages the uploaded files and returns immediately; a background job then
+hands each file to a storage backend, which stores the original plus resized variants
+(VARIANT_WIDTHS) in modern formats (VARIANT_FORMATS). The storefront picks the smallest
+variant that fits instead of downloading full-size originals.
+
+Backends implement store(data, key, filename) -> {"original": url, "variants": {size: {format: url}}}.
+"""
+import os
+import re
+from io import BytesIO
+
+# Longest edge of each variant, in pixels (images are never upscaled).
+VARIANT_WIDTHS = {"thumb": 160, "card": 480, "detail": 1200}
+# Listed in order of preference; a backend skips formats it cannot encode.
+VARIANT_FORMATS = ("avif", "webp")
+VARIANT_QUALITY = 80
+
+SAFE_KEY_RE = re.compile(r"[^A-Za-z0-9_-]+")
+
+
+def safe_key(key):
+    return SAFE_KEY_RE.sub("-", str(key)).strip("-") or "image"
+
+
+class CloudinaryStorage:
+    """
+    Uploads the original once and asks Cloudinary to pre-generate every variant
+    (`eager` transformations) so the first storefront request does not pay for it.
+    """
+
+    def __init__(self, uploader_factory, folder="everaura_products"):
+        self.uploader_factory = uploader_factory
+        self.folder = folder
+
+    @staticmethod
+    def _transformation(width, fmt):
+        return {"width": width, "crop": "limit", "quality": "auto", "format": fmt}
+
+    def store(self, data, key, filename=None):
+        from cloudinary.utils import cloudinary_url
+
+        eager = [self._transformation(width, fmt) for width in VARIANT_WIDTHS.values() for fmt in VARIANT_FORMATS]
+        result = self.uploader_factory().upload(
+            BytesIO(data), folder=self.folder, public_id=safe_key(key), overwrite=True,
+            eager=eager, eager_async=True,
+        )
+        public_id = result["public_id"]
+        variants = {
+            size: {
+                fmt: cloudinary_url(public_id, secure=True, **self._transformation(width, fmt))[0]
+                for fmt in VARIANT_FORMATS
+            }
+            for size, width in VARIANT_WIDTHS.items()
+        }
+        return {"original": result["secure_url"], "variants": variants}
+
+
+class LocalStorage:
+    """
+    Writes the original and Pillow-rendered variants to a directory; used for local
+    development and tests. Needs Pillow (AVIF output needs Pillow 11.2+ or pillow-avif-plugin).
+    """
+
+    def __init__(self, directory, base_url):
+        self.directory = os.path.abspath(directory)
+        self.base_url = base_url.rstrip("/")
+
+    def _write(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, name), "wb") as file:
+            file.write(data)
+        return f"{self.base_url}/{name}"
+
+    def store(self, data, key, filename=None):
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            raise RuntimeError("LocalStorage needs Pillow: pip install -r requirements-bench.txt")
+
+        Image.init()
+        key = safe_key(key)
+        with Image.open(BytesIO(data)) as source:
+            extension = {"JPEG": "jpg"}.get(source.format, (source.format or "img").lower())
+            image = ImageOps.exif_transpose(source)
+            if image.mode not in ("RGB", "RGBA"):
+                has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+                image = image.convert("RGBA" if has_alpha else "RGB")
+
+            original = self._write(f"{key}.{extension}", data)
+            variants = {}
+            for size, width in VARIANT_WIDTHS.items():
+                resized = image.copy()
+                resized.thumbnail((width, width), Image.LANCZOS)
+                variants[size] = {}
+                for fmt in VARIANT_FORMATS:
+                    if fmt.upper() not in Image.SAVE:
+                        continue
+                    buffer = BytesIO()
+                    resized.save(buffer, format=fmt.upper(), quality=VARIANT_QUALITY)
+                    variants[size][fmt] = self._write(f"{key}-{size}.{fmt}", buffer.getvalue())
+        return {"original": original, "variants": variants}
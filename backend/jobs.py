@@ -0,0 +1,192 @@
+"""Durable background jobs stored in MongoDB and drained by a local worker pool."""
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return round(ordered[index], 2)
+
+
+class JobQueue:
+    """
+    A small job queue on top of a Mongo collection.
+
+    enqueue() inserts a `queued` document; worker threads claim jobs atomically with
+    a lease (so a job is processed by one worker across all processes, and jobs held by
+    a crashed worker are picked up again once the lease lapses). Failed jobs are retried
+    with exponential backoff and moved to `dead` after `max_attempts`.
+    """
+
+    def __init__(self, collection, workers=2, max_attempts=5, backoff_seconds=5.0,
+                 lease_seconds=300, poll_interval=5.0, retention_days=7, sample_size=500):
+        self.collection = collection
+        self.workers = max(int(workers), 1)
+        self.max_attempts = max(int(max_attempts), 1)
+        self.backoff_seconds = backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retention_days = retention_days
+        self.handlers = {}
+        self._wake = threading.Event()
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._wait_samples = deque(maxlen=sample_size)
+        self._run_samples = deque(maxlen=sample_size)
+        self._counters = {"succeeded": 0, "retried": 0, "dead": 0}
+
+    def register(self, job_type, handler):
+        """Registers handler(payload) for a job type. Handlers must be idempotent."""
+        self.handlers[job_type] = handler
+
+    def start(self):
+        """Starts the worker threads once per process."""
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+            self._started = True
+
+    def enqueue(self, job_type, payload, delay_seconds=0):
+        """Durably records a job (runnable after `delay_seconds`) and wakes a local worker. Returns the job id."""
+        now = datetime.now(timezone.utc)
+        run_after = now + timedelta(seconds=delay_seconds)
+        result = self.collection.insert_one({
+            "type": job_type,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "created_at": now,
+            # Queue wait is measured from here, so a deliberate delay is not reported as backlog.
+            "available_at": run_after,
+            "run_after": run_after,
+        })
+        self.start()
+        self._wake.set()
+        return result.inserted_id
+
+    def status(self, job_id):
+        """Status of one job (without its payload), or None if unknown or already purged."""
+        job = self.collection.find_one(
+            {"_id": job_id},
+            {"type": 1, "status": 1, "attempts": 1, "created_at": 1, "finished_at": 1, "failed_at": 1, "last_error": 1},
+        )
+        if job is None:
+            return None
+        job["id"] = str(job.pop("_id"))
+        return job
+
+    def stats(self):
+        """Queue depth by status plus recent wait/processing latency (milliseconds)."""
+        depth = {status: 0 for status in ("queued", "running", "dead")}
+        for row in self.collection.aggregate([
+            {"$match": {"status": {"$in": list(depth)}}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ]):
+            depth[row["_id"]] = row["count"]
+
+        with self._stats_lock:
+            waits = list(self._wait_samples)
+            runs = list(self._run_samples)
+            counters = dict(self._counters)
+        return {
+            "depth": depth,
+            "processed": counters,
+            "wait_ms": {"p50": percentile(waits, 0.5), "p95": percentile(waits, 0.95)},
+            "run_ms": {"p50": percentile(runs, 0.5), "p95": percentile(runs, 0.95)},
+        }
+
+    # --- Internals ---
+
+    def _claim(self):
+        now = datetime.now(timezone.utc)
+        return self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_after": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lte": now}},
+            ]},
+            {"$set": {
+                "status": "running",
+                "started_at": now,
+                "lease_until": now + timedelta(seconds=self.lease_seconds),
+            }, "$inc": {"attempts": 1}},
+            sort=[("run_after", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+            except Exception as e:
+                logger.error(f"Job claim failed: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        handler = self.handlers.get(job["type"])
+        started = time.monotonic()
+        available_at = job.get("available_at") or job.get("created_at")
+        if available_at is not None:
+            if available_at.tzinfo is None:
+                available_at = available_at.replace(tzinfo=timezone.utc)
+            wait_ms = (datetime.now(timezone.utc) - available_at).total_seconds() * 1000
+        else:
+            wait_ms = None
+
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job type '{job['type']}'")
+            handler(job.get("payload") or {})
+        except Exception as e:
+            self._failed(job, e)
+            return
+
+        now = datetime.now(timezone.utc)
+        self.collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {
+                "status": "done",
+                "finished_at": now,
+                "purge_at": now + timedelta(days=self.retention_days),
+            }, "$unset": {"lease_until": "", "last_error": ""}},
+        )
+        with self._stats_lock:
+            self._counters["succeeded"] += 1
+            self._run_samples.append((time.monotonic() - started) * 1000)
+            if wait_ms is not None:
+                self._wait_samples.append(wait_ms)
+
+    def _failed(self, job, error):
+        attempts = int(job.get("attempts", 1))
+        now = datetime.now(timezone.utc)
+        if attempts >= self.max_attempts:
+            logger.error(f"Job {job['_id']} ({job['type']}) dead-lettered after {attempts} attempts: {error}")
+            update = {"status": "dead", "failed_at": now, "last_error": str(error)}
+            counter = "dead"
+        else:
+            delay = self.backoff_seconds * (2 ** (attempts - 1))
+            logger.warning(f"Job {job['_id']} ({job['type']}) failed (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+            update = {"status": "queued", "run_after": now + timedelta(seconds=delay), "last_error": str(error)}
+            counter = "retried"
+        self.collection.update_one({"_id": job["_id"]}, {"$set": update, "$unset": {"lease_until": ""}})
+        with self._stats_lock:
+            self._counters[counter] += 1
@@ -0,0 +1,278 @@
+"""Background email dispatch over persistent SMTP connections with a durable Mongo outbox."""
+import logging
+import queue
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from pymongo import ReturnDocument
+
+from metrics import external_call
+
+logger = logging.getLogger(__name__)
+
+
+def build_message(sender, to_email, subject, html_body):
+    """Builds the HTML email sent for every transactional message."""
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(html_body, 'html'))
+    return msg
+
+
+class SMTPConnection:
+    """
+    A reusable SMTP session. It connects and authenticates on first use,
+    probes with NOOP after being idle, and reconnects once if the server dropped it.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=True, timeout=30, idle_check_seconds=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.idle_check_seconds = idle_check_seconds
+        self._server = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+
+    def _ensure_connected(self):
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_check_seconds:
+            try:
+                status, _ = self._server.noop()
+                if status != 250:
+                    self.close()
+            except OSError:
+                self.close()
+        if self._server is None:
+            self._connect()
+
+    def send(self, msg):
+        """Sends one message, re-establishing the session once if the server dropped it."""
+        for attempt in (1, 2):
+            self._ensure_connected()
+            try:
+                self._server.send_message(msg)
+                self._last_used = time.monotonic()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            pass
+        self._server = None
+
+
+class MailDispatcher:
+    """
+    Fire-and-forget email sending.
+
+    enqueue() records the message in the outbox collection (when one is configured)
+    and hands it to a bounded in-memory queue drained by worker threads, each holding
+    its own persistent SMTP connection. Failed sends are retried with exponential
+    backoff; a sweeper re-queues outbox messages that are due or whose worker died,
+    so queued mail survives restarts. Messages carrying secrets (login codes) are
+    enqueued with durable=False and never written to the outbox; the body of a sent
+    outbox message is dropped when it is marked sent.
+    """
+
+    def __init__(self, connection_factory, sender, outbox=None, workers=2, queue_size=500,
+                 max_attempts=5, backoff_seconds=2.0, lease_seconds=120, sweep_interval=30):
+        self.connection_factory = connection_factory
+        self.sender = sender
+        self.outbox = outbox
+        self.workers = max(int(workers), 1)
+        self.max_attempts = max(int(max_attempts), 1)
+        self.backoff_seconds = backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.sweep_interval = sweep_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._local = threading.local()
+
+    # --- Public API ---
+
+    def start(self):
+        """Starts the worker and sweeper threads once per process."""
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f"mail-worker-{i}", daemon=True).start()
+            if self.outbox is not None:
+                threading.Thread(target=self._sweep, name="mail-sweeper", daemon=True).start()
+            self._started = True
+
+    def enqueue(self, to_email, subject, html_body, durable=True):
+        """
+        Queues a message for background delivery. Returns False if it could not be accepted.
+        A non-durable message only lives in memory, so it is lost if the process dies.
+        """
+        self.start()
+        job = {"to": to_email, "subject": subject, "html": html_body, "attempts": 0}
+        if durable and self.outbox is not None:
+            now = datetime.now(timezone.utc)
+            try:
+                result = self.outbox.insert_one({
+                    **job,
+                    "status": "pending",
+                    "created_at": now,
+                    "next_attempt_at": now,
+                })
+                job["_id"] = result.inserted_id
+            except Exception as e:
+                logger.error(f"Failed to record email to {to_email} in outbox: {e}")
+                job.pop("_id", None)
+
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            if "_id" in job:
+                logger.warning(f"Email queue is full; message to {to_email} left in outbox for the sweeper.")
+                return True
+            logger.error(f"Email queue is full; dropping message to {to_email}.")
+            return False
+        return True
+
+    def send_now(self, to_email, subject, html_body):
+        """Sends synchronously on this thread's persistent connection (raises on failure)."""
+        with external_call("smtp", "send"):
+            self._connection().send(build_message(self.sender, to_email, subject, html_body))
+        logger.info(f"Email sent to {to_email} with subject: {subject}")
+
+    def pending_count(self):
+        """Number of messages waiting in the in-memory queue."""
+        return self._queue.qsize()
+
+    # --- Internals ---
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self.connection_factory()
+            self._local.connection = connection
+        return connection
+
+    def _claim(self, job):
+        """Takes the outbox lease for a job so that only one worker (in any process) sends it."""
+        if "_id" not in job:
+            return job
+        now = datetime.now(timezone.utc)
+        return self.outbox.find_one_and_update(
+            {
+                "_id": job["_id"],
+                "$or": [
+                    {"status": "pending", "next_attempt_at": {"$lte": now}},
+                    {"status": "sending", "lease_until": {"$lte": now}},
+                ],
+            },
+            {"$set": {"status": "sending", "lease_until": now + timedelta(seconds=self.lease_seconds)}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._process(job)
+            except Exception as e:
+                logger.error(f"Email worker error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _process(self, job):
+        claimed = self._claim(job)
+        if claimed is None:
+            return
+        try:
+            self.send_now(claimed["to"], claimed["subject"], claimed["html"])
+        except Exception as e:
+            self._failed(claimed, e)
+            return
+        if "_id" in claimed:
+            self.outbox.update_one(
+                {"_id": claimed["_id"]},
+                {"$set": {"status": "sent", "sent_at": datetime.now(timezone.utc)},
+                 "$unset": {"lease_until": "", "html": ""}},
+            )
+
+    def _failed(self, job, error):
+        attempts = int(job.get("attempts", 0)) + 1
+        if attempts >= self.max_attempts:
+            logger.error(f"Giving up on email to {job['to']} after {attempts} attempts: {error}")
+            if "_id" in job:
+                self.outbox.update_one(
+                    {"_id": job["_id"]},
+                    {"$set": {"status": "dead", "attempts": attempts, "last_error": str(error)},
+                     "$unset": {"lease_until": ""}},
+                )
+            return
+
+        delay = self.backoff_seconds * (2 ** (attempts - 1))
+        logger.warning(f"Email to {job['to']} failed (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+        job = {**job, "attempts": attempts}
+        if "_id" in job:
+            self.outbox.update_one(
+                {"_id": job["_id"]},
+                {"$set": {
+                    "status": "pending",
+                    "attempts": attempts,
+                    "last_error": str(error),
+                    "next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=delay),
+                }, "$unset": {"lease_until": ""}},
+            )
+        timer = threading.Timer(delay, self._requeue, args=(job,))
+        timer.daemon = True
+        timer.start()
+
+    def _requeue(self, job):
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            # The outbox copy (if any) is picked up again by the sweeper.
+            pass
+
+    def _sweep(self):
+        while True:
+            try:
+                now = datetime.now(timezone.utc)
+                due = self.outbox.find(
+                    {"$or": [
+                        {"status": "pending", "next_attempt_at": {"$lte": now}},
+                        {"status": "sending", "lease_until": {"$lte": now}},
+                    ]},
+                    {"_id": 1},
+                ).limit(self._queue.maxsize or 100)
+                for doc in due:
+                    self._requeue({"_id": doc["_id"]})
+            except Exception as e:
+                logger.error(f"Email outbox sweep failed: {e}")
+            time.sleep(self.sweep_interval)
@@ -0,0 +1,207 @@
+"""In-process request, MongoDB and external-call metrics rendered in the Prometheus text format."""
+import threading
+import time
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+# Prometheus' default latency buckets (seconds).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Commands whose first argument is not a collection name.
+_COLLECTIONLESS_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "buildInfo", "endSessions",
+                            "commitTransaction", "abortTransaction", "saslStart", "saslContinue"}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["counts"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series["counts"]):
+                le = _labels(self.label_names, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {count}")
+            inf = _labels(self.label_names, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {series['count']}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {series['sum']!r}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collects per-route latency, MongoDB command counts/durations by collection and
+    timings of outbound calls (Razorpay, SMTP, Cloudinary).
+
+    Values are kept per process; with several gunicorn workers each worker reports
+    its own series, which Prometheus aggregates across scrape targets.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.requests_total = Counter(
+            "everaura_http_requests_total", "HTTP requests handled.", ("route", "method", "status"))
+        self.request_seconds = Histogram(
+            "everaura_http_request_duration_seconds", "HTTP request latency.", ("route", "method"), buckets)
+        self.request_mongo_commands = Counter(
+            "everaura_http_request_mongo_commands_total", "MongoDB commands issued while serving requests.", ("route",))
+        self.request_mongo_seconds = Counter(
+            "everaura_http_request_mongo_seconds_total", "Time spent in MongoDB while serving requests.", ("route",))
+        self.mongo_commands = Counter(
+            "everaura_mongo_commands_total", "MongoDB commands by collection.", ("collection", "command", "outcome"))
+        self.mongo_seconds = Histogram(
+            "everaura_mongo_command_duration_seconds", "MongoDB command latency.", ("collection", "command"), buckets)
+        self.external_calls = Counter(
+            "everaura_external_calls_total", "Outbound calls to third-party services.", ("service", "operation", "outcome"))
+        self.external_seconds = Histogram(
+            "everaura_external_call_duration_seconds", "Outbound call latency.", ("service", "operation"), buckets)
+
+    # --- Per-request tracking ---
+
+    def start_request(self):
+        """Starts tracking the request being served on this thread."""
+        self._local.current = {"started": time.perf_counter(), "mongo_commands": 0, "mongo_seconds": 0.0,
+                               "external_seconds": 0.0}
+
+    def finish_request(self, route, method, status):
+        """Records the request started on this thread and returns its summary (None if untracked)."""
+        current = getattr(self._local, "current", None)
+        if current is None:
+            return None
+        self._local.current = None
+        elapsed = time.perf_counter() - current["started"]
+        with self._lock:
+            self.requests_total.inc((route, method, str(status)))
+            self.request_seconds.observe((route, method), elapsed)
+            self.request_mongo_commands.inc((route,), current["mongo_commands"])
+            self.request_mongo_seconds.inc((route,), current["mongo_seconds"])
+        return {**current, "seconds": elapsed}
+
+    # --- Observations ---
+
+    def observe_mongo(self, collection, command, seconds, failed=False):
+        with self._lock:
+            self.mongo_commands.inc((collection, command, "error" if failed else "ok"))
+            self.mongo_seconds.observe((collection, command), seconds)
+        current = getattr(self._local, "current", None)
+        if current is not None:
+            current["mongo_commands"] += 1
+            current["mongo_seconds"] += seconds
+
+    def observe_external(self, service, operation, seconds, failed=False):
+        with self._lock:
+            self.external_calls.inc((service, operation, "error" if failed else "ok"))
+            self.external_seconds.observe((service, operation), seconds)
+        current = getattr(self._local, "current", None)
+        if current is not None:
+            current["external_seconds"] += seconds
+
+    @contextmanager
+    def external_call(self, service, operation):
+        """Times a block that calls a third-party service, counting exceptions as failures."""
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self.observe_external(service, operation, time.perf_counter() - started, failed)
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            for metric in (self.requests_total, self.request_seconds, self.request_mongo_commands,
+                           self.request_mongo_seconds, self.mongo_commands, self.mongo_seconds,
+                           self.external_calls, self.external_seconds):
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Feeds every MongoDB command's duration into a MetricsRegistry, labelled by collection."""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        name = event.command_name
+        if name in _COLLECTIONLESS_COMMANDS:
+            collection = ""
+        elif name == "getMore":
+            collection = event.command.get("collection", "")
+        else:
+            target = event.command.get(name)
+            collection = target if isinstance(target, str) else ""
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, failed):
+        with self._lock:
+            collection = self._collections.pop((event.connection_id, event.request_id), "")
+        self.registry.observe_mongo(collection, event.command_name, event.duration_micros / 1e6, failed)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+
+registry = MetricsRegistry()
+external_call = registry.external_call
+
+
+def install_mongo_listener():
+    """Registers the command listener for every MongoClient created afterwards."""
+    monitoring.register(MongoCommandListener(registry))
@@ -1,44 +1,364 @@
+"""
+Product catalogue import/export.
+
+    python migrate.py import products.json                 # upsert by product `id`, in batches
+    python migrate.py import products.csv --dry-run        # show what would change
+    python migrate.py import catalogue.ndjson --swap       # load into a staging collection, then rename over products
+    python migrate.py export backup.ndjson                 # stream the catalogue out (ndjson, json or csv)
+
+Files are read and written incrementally, so the catalogue size is not limited by memory,
+and the live collection stays readable for the whole run.
+"""
+import argparse
+import csv
 import json
-from pymongo import MongoClient
 import os
+import sys
+import time
+
 from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import ConfigurationError
 
 # Load the environment file
 load_dotenv()
 
 # Get the connection string from your .env file
-CONNECTION_STRING = os.getenv("MONGO_URI")
+CONNECTION_STRING = os.getenv("MONGO_URI_MAIN") or os.getenv("MONGO_URI")
 DB_NAME = "everaura_db"
 COLLECTION_NAME = "products"
 
-def migrate_data():
-    # Create a connection to MongoDB
-    client = MongoClient(CONNECTION_STRING)
-    db = client[DB_NAME]
+# Maintained by the server (stock holds); never overwritten by an import.
+SERVER_FIELDS = ("_id", "reserved", "available_quantity", "in_stock", "stock_status")
+INT_FIELDS = ("id", "quantity", "type", "material")
+FLOAT_FIELDS = ("price",)
+CSV_FIELDS = ("id", "name", "price", "category", "gender", "type", "material", "rsn",
+              "description", "isTrending", "isBestSelling", "isAntiTarnish", "quantity", "images", "image")
+# Multiple image URLs share one CSV cell.
+CSV_LIST_SEPARATOR = "|"
+
+
+# --- Reading ---
+
+def iter_json_array(file, chunk_size=64 * 1024):
+    """Yields the objects of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started:
+            if buffer.startswith("["):
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer:
+                raise ValueError("Expected a JSON array of products")
+        else:
+            if buffer.startswith(","):
+                buffer = buffer[1:]
+                continue
+            if buffer.startswith("]"):
+                return
+            if buffer:
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    yield item
+                    buffer = buffer[end:]
+                    continue
+        if eof:
+            raise ValueError("Unexpected end of JSON input")
+        chunk = file.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer += chunk
+
+
+def iter_ndjson(file):
+    for line_number, line in enumerate(file, start=1):
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {line_number}: {e}")
+
+
+def iter_csv(file):
+    for row in csv.DictReader(file):
+        record = {key: value for key, value in row.items() if key and value not in (None, "")}
+        if "images" in record:
+            record["images"] = [url for url in record["images"].split(CSV_LIST_SEPARATOR) if url]
+        yield record
+
+
+def detect_format(path, explicit=None):
+    if explicit:
+        return explicit
+    extension = os.path.splitext(path)[1].lower()
+    return {".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}.get(extension, "json")
+
+
+def read_products(file, file_format):
+    readers = {"json": iter_json_array, "ndjson": iter_ndjson, "csv": iter_csv}
+    return readers[file_format](file)
+
+
+def normalize_product(record):
+    """Coerces field types (CSV values arrive as strings) and drops server-maintained fields."""
+    product = {key: value for key, value in record.items() if key not in SERVER_FIELDS}
+    if product.get("id") in (None, ""):
+        raise ValueError(f"Product without an 'id': {record.get('name', record)}")
+    for field in INT_FIELDS:
+        value = product.get(field)
+        if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+            product[field] = int(value)
+        elif isinstance(value, float) and value.is_integer():
+            product[field] = int(value)
+    for field in FLOAT_FIELDS:
+        if isinstance(product.get(field), (str, int)):
+            product[field] = float(product[field])
+    return product
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Progress:
+    """Prints running totals and throughput after every batch."""
+
+    def __init__(self, label):
+        self.label = label
+        self.count = 0
+        self.started = time.monotonic()
+
+    def update(self, n):
+        self.count += n
+        elapsed = time.monotonic() - self.started
+        rate = self.count / elapsed if elapsed else 0
+        print(f"  {self.label}: {self.count} products ({rate:,.0f}/s)", flush=True)
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        rate = self.count / elapsed if elapsed else 0
+        return f"{self.count} products in {elapsed:.1f}s ({rate:,.0f}/s)"
+
+
+# --- Import ---
+
+def diff_batch(collection, batch, stats, show):
+    """Compares a batch with the stored products (one query) and reports new/changed ones."""
+    existing = {doc["id"]: doc for doc in collection.find({"id": {"$in": [p["id"] for p in batch]}})}
+    for product in batch:
+        current = existing.get(product["id"])
+        if current is None:
+            stats["new"] += 1
+            if stats["new"] <= show:
+                print(f"  + {product['id']}: {product.get('name', '')}")
+            continue
+        changed = sorted(key for key, value in product.items() if current.get(key) != value)
+        if changed:
+            stats["changed"] += 1
+            if stats["changed"] <= show:
+                print(f"  ~ {product['id']}: {', '.join(changed)}")
+        else:
+            stats["unchanged"] += 1
+
+
+def upsert_batch(collection, batch):
+    """Upserts a batch keyed by `id` with one unordered bulk write."""
+    result = collection.bulk_write(
+        [UpdateOne({"id": p["id"]}, {"$set": p}, upsert=True) for p in batch],
+        ordered=False,
+    )
+    return result.upserted_count, result.modified_count
+
+
+def stage_batch(live, staging, batch):
+    """Writes a batch to the staging collection, keeping each product's live _id and reservations."""
+    current = {
+        doc["id"]: doc
+        for doc in live.find({"id": {"$in": [p["id"] for p in batch]}}, {"id": 1, "reserved": 1})
+    }
+    operations = []
+    for product in batch:
+        document = dict(product)
+        existing = current.get(product["id"])
+        if existing is not None:
+            document["_id"] = existing["_id"]
+            if existing.get("reserved"):
+                document["reserved"] = existing["reserved"]
+        operations.append(UpdateOne({"id": product["id"]}, {"$set": document}, upsert=True))
+    staging.bulk_write(operations, ordered=False)
+
+
+def copy_indexes(source, target):
+    """Recreates the live collection's secondary indexes on the staging collection."""
+    existing = target.index_information()
+    for name, info in source.index_information().items():
+        if name == "_id_" or name in existing:
+            continue
+        keys = info["key"]
+        if "weights" in info:
+            # Text indexes are reported by their internal _fts/_ftsx keys.
+            keys = [(field, "text") for field in info["weights"]]
+        options = {key: value for key, value in info.items() if key not in ("key", "v", "ns")}
+        target.create_index(keys, name=name, **options)
+
+
+def import_products(db, args):
     collection = db[COLLECTION_NAME]
+    file_format = detect_format(args.path, args.format)
+    seen_ids = set()
+    progress = Progress("dry run" if args.dry_run else "imported")
 
-    # Clear existing data to prevent duplicates on re-runs
-    print("Clearing existing products from the database...")
-    collection.delete_many({})
+    staging = None
+    if args.swap and not args.dry_run:
+        staging = db[f"{COLLECTION_NAME}_staging_{int(time.time())}"]
+        staging.create_index("id", unique=True)
+        print(f"Loading into staging collection '{staging.name}'...")
+    elif not args.dry_run:
+        collection.create_index("id")
 
-    # Read the local JSON file
-    print("Reading products.json file...")
-    try:
-        with open('products.json', 'r', encoding='utf-8') as file:
-            data = json.load(file)
-    except FileNotFoundError:
-        print("❌ ERROR: products.json not found. Make sure it's in the backend folder.")
+    stats = {"new": 0, "changed": 0, "unchanged": 0, "upserted": 0, "modified": 0}
+    with open(args.path, "r", encoding="utf-8", newline="") as file:
+        products = (normalize_product(record) for record in read_products(file, file_format))
+        for batch in batched(products, args.batch_size):
+            seen_ids.update(p["id"] for p in batch)
+            if args.dry_run:
+                diff_batch(collection, batch, stats, args.show)
+            elif staging is not None:
+                stage_batch(collection, staging, batch)
+            else:
+                upserted, modified = upsert_batch(collection, batch)
+                stats["upserted"] += upserted
+                stats["modified"] += modified
+            progress.update(len(batch))
+
+    if not seen_ids:
+        print("❌ No products found in the input file.")
+        if staging is not None:
+            staging.drop()
         return
 
-    # Insert the new data into the database
-    if data:
-        print(f"Inserting {len(data)} products into the database...")
-        collection.insert_many(data)
-        print("✅ Data migration successful!")
-    else:
-        print("❌ No data found in products.json file.")
+    stale = collection.count_documents({"id": {"$nin": list(seen_ids)}})
+    if args.dry_run:
+        print(f"Dry run: {stats['new']} new, {stats['changed']} changed, {stats['unchanged']} unchanged; "
+              f"{stale} stored products are not in the file"
+              f"{' and would be removed (swap/prune)' if args.swap or args.prune else ''}.")
+        return
+
+    if staging is not None:
+        copy_indexes(collection, staging)
+        # renameCollection with dropTarget replaces the live collection in one step.
+        staging.rename(COLLECTION_NAME, dropTarget=True)
+        print(f"✅ Swapped in {len(seen_ids)} products ({stale} products not in the file were dropped). "
+              f"{progress.summary()}")
+        return
+
+    removed = 0
+    if args.prune and stale:
+        removed = collection.delete_many({"id": {"$nin": list(seen_ids)}}).deleted_count
+    print(f"✅ Import complete: {stats['upserted']} inserted, {stats['modified']} updated, {removed} removed. "
+          f"{progress.summary()}")
+
+
+# --- Export ---
+
+def export_products(db, args):
+    collection = db[COLLECTION_NAME]
+    file_format = detect_format(args.path, args.format)
+    progress = Progress("exported")
+    cursor = collection.find({}, {"_id": 0}).sort("id", 1).batch_size(args.batch_size)
+
+    with open(args.path, "w", encoding="utf-8", newline="") as file:
+        if file_format == "csv":
+            writer = csv.DictWriter(file, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+        elif file_format == "json":
+            file.write("[\n")
+
+        first = True
+        for batch in batched(cursor, args.batch_size):
+            for product in batch:
+                if file_format == "csv":
+                    row = dict(product)
+                    if isinstance(row.get("images"), list):
+                        row["images"] = CSV_LIST_SEPARATOR.join(row["images"])
+                    writer.writerow(row)
+                elif file_format == "json":
+                    file.write(("" if first else ",\n") + json.dumps(product, ensure_ascii=False, default=str))
+                else:
+                    file.write(json.dumps(product, ensure_ascii=False, default=str) + "\n")
+                first = False
+            progress.update(len(batch))
+
+        if file_format == "json":
+            file.write("\n]\n")
+    print(f"✅ Exported {progress.summary()} to {args.path}")
+
+
+def select_database(client, name=None):
+    if name:
+        return client[name]
+    try:
+        return client.get_default_database()
+    except ConfigurationError:
+        return client[DB_NAME]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import or export the product catalogue.")
+    parser.add_argument("--uri", default=CONNECTION_STRING, help="MongoDB connection string (default: MONGO_URI_MAIN).")
+    parser.add_argument("--db", help=f"Database name (default: the URI's database, else {DB_NAME}).")
+    parser.add_argument("--batch-size", type=int, default=500)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="Upsert products from a JSON, NDJSON or CSV file.")
+    importer.add_argument("path", nargs="?", default="products.json")
+    importer.add_argument("--format", choices=("json", "ndjson", "csv"))
+    importer.add_argument("--dry-run", action="store_true", help="Report new/changed products without writing.")
+    importer.add_argument("--show", type=int, default=20, help="Number of new/changed products listed in a dry run.")
+    mode = importer.add_mutually_exclusive_group()
+    mode.add_argument("--swap", action="store_true",
+                      help="Build a staging collection and atomically rename it over the live one.")
+    mode.add_argument("--prune", action="store_true", help="Delete stored products that are not in the file.")
+
+    exporter = commands.add_parser("export", help="Write every product to a JSON, NDJSON or CSV file.")
+    exporter.add_argument("path")
+    exporter.add_argument("--format", choices=("json", "ndjson", "csv"))
+
+    args = parser.parse_args()
+    if not args.uri:
+        print("❌ ERROR: set MONGO_URI_MAIN (or pass --uri).")
+        sys.exit(1)
+
+    client = MongoClient(args.uri)
+    try:
+        db = select_database(client, args.db)
+        if args.command == "import":
+            if not os.path.exists(args.path):
+                print(f"❌ ERROR: {args.path} not found.")
+                sys.exit(1)
+            import_products(db, args)
+        else:
+            export_products(db, args)
+    finally:
+        client.close()
 
-    client.close()
 
 if __name__ == "__main__":
-    migrate_data()
+    main()
@@ -0,0 +1,121 @@
+"""Order status state machine and coalesced customer status notifications."""
+import logging
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+PENDING = "Pending"
+PAID = "Paid"
+PACKAGING = "Packaging"
+SHIPPED = "Shipped"
+DELIVERED = "Delivered"
+CANCELLED = "Cancelled"
+
+ORDER_STATUSES = (PENDING, PAID, PACKAGING, SHIPPED, DELIVERED, CANCELLED)
+
+# Status -> statuses an order may move to next. Delivered and Cancelled are final.
+TRANSITIONS = {
+    PENDING: {PAID, CANCELLED},
+    PAID: {PACKAGING, CANCELLED},
+    PACKAGING: {SHIPPED, CANCELLED},
+    SHIPPED: {DELIVERED},
+    DELIVERED: set(),
+    CANCELLED: set(),
+}
+
+# Only payment confirmation (webhook or test-mode checkout) moves an order to these.
+PAYMENT_ONLY_STATUSES = {PAID}
+
+
+def transition_error(current, target, manual=True):
+    """Why `current` -> `target` is not allowed, or None if it is (staying put is allowed)."""
+    if target not in ORDER_STATUSES:
+        return f"Unknown status '{target}'. Use one of: {', '.join(ORDER_STATUSES)}"
+    current = current or PENDING
+    if current == target:
+        return None
+    if manual and target in PAYMENT_ONLY_STATUSES:
+        return f"Orders become {target} when their payment is confirmed"
+    if target not in TRANSITIONS.get(current, ()):
+        allowed = ", ".join(s for s in ORDER_STATUSES if s in TRANSITIONS.get(current, ())) or "none (final status)"
+        return f"Cannot move an order from {current} to {target} (allowed: {allowed})"
+    return None
+
+
+class StatusNotifier:
+    """
+    Coalesces customer status emails.
+
+    notify() upserts one pending notification per order (the latest status and tracking
+    link win) and schedules a flush job; the job emails each order once its coalescing
+    window has passed. A batch that marks 200 orders Shipped and then adds their tracking
+    links therefore sends 200 emails from the background, not 400 from the request.
+
+    Flush jobs may run concurrently, so each notice is claimed with a lease before it is
+    sent; a claim whose worker died is taken over once `lease_seconds` have passed.
+    """
+
+    def __init__(self, collection, job_queue, render, send, window_seconds=60, job_type="order_notifications",
+                 lease_seconds=120):
+        self.collection = collection
+        self.job_queue = job_queue
+        self.render = render
+        self.send = send
+        self.window_seconds = max(float(window_seconds), 0.0)
+        self.job_type = job_type
+        self.lease_seconds = lease_seconds
+        job_queue.register(job_type, self.flush)
+
+    def notify(self, notices):
+        """Queues notices ({order_mongo_id, order_id, email, name, status, tracking_link}) in one bulk_write."""
+        if not notices:
+            return
+        now = datetime.now(timezone.utc)
+        due_at = now + timedelta(seconds=self.window_seconds)
+        self.collection.bulk_write([
+            UpdateOne(
+                {"_id": notice["order_mongo_id"]},
+                {
+                    "$set": {**{k: v for k, v in notice.items() if k != "order_mongo_id"}, "due_at": due_at},
+                    "$inc": {"revision": 1},
+                    "$setOnInsert": {"created_at": now},
+                },
+                upsert=True,
+            )
+            for notice in notices
+        ], ordered=False)
+        self.job_queue.enqueue(self.job_type, {}, delay_seconds=self.window_seconds)
+
+    def _claim(self, skip):
+        """Leases one due, unclaimed notice to this flush, or returns None when none is left."""
+        now = datetime.now(timezone.utc)
+        return self.collection.find_one_and_update(
+            {"_id": {"$nin": skip}, "due_at": {"$lte": now}, "claimed_until": {"$not": {"$gt": now}}},
+            {"$set": {"claimed_until": now + timedelta(seconds=self.lease_seconds)}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def flush(self, payload=None):
+        """Job handler: sends every notification whose window has passed."""
+        failed = []
+        while True:
+            notice = self._claim(failed)
+            if notice is None:
+                break
+            subject, body = self.render(notice)
+            sent = False
+            try:
+                sent = self.send(notice["email"], subject, body)
+            except Exception as e:
+                logger.error(f"Status notification for order {notice.get('order_id')} failed: {e}")
+            # A newer update arriving meanwhile bumps the revision and keeps the notice for the next flush.
+            if sent and self.collection.delete_one({"_id": notice["_id"], "revision": notice["revision"]}).deleted_count:
+                continue
+            if not sent:
+                failed.append(notice["_id"])
+            # Hand the notice back so a later flush sends it (or its newer revision).
+            self.collection.update_one({"_id": notice["_id"]}, {"$unset": {"claimed_until": ""}})
+        if failed:
+            raise RuntimeError(f"{len(failed)} status notification(s) could not be queued for delivery")
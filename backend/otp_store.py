@@ -0,0 +1,76 @@
+"""
+Login OTPs kept in their own collection instead of on user documents.
+
+Only an HMAC of each code is stored, one pending code per email, and MongoDB's TTL
+monitor removes codes once they expire. A correct code is checked and consumed by a
+single find_one_and_delete; a wrong one increments the code's attempt counter and
+burns the code after `max_attempts` misses.
+"""
+import hashlib
+import hmac
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+
+class OTPStore:
+    def __init__(self, collection, secret, ttl_seconds=600, max_attempts=5, digits=6):
+        self.collection = collection
+        self.secret = (secret or "").encode("utf-8")
+        self.ttl_seconds = ttl_seconds
+        self.max_attempts = max(int(max_attempts), 1)
+        self.digits = digits
+
+    def _hash(self, email, otp):
+        return hmac.new(self.secret, f"{email}:{otp}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def issue(self, email, user_id):
+        """Creates a fresh code for `email` (replacing any pending one) and returns it."""
+        otp = "".join(secrets.choice("0123456789") for _ in range(self.digits))
+        now = datetime.now(timezone.utc)
+        self.collection.replace_one(
+            {"_id": email},
+            {
+                "user_id": user_id,
+                "otp_hash": self._hash(email, otp),
+                "attempts": 0,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl_seconds),
+            },
+            upsert=True,
+        )
+        return otp
+
+    def verify(self, email, otp):
+        """
+        Consumes the code when it matches. Returns (record, None, None) on success, where
+        record carries the user_id, or (None, error message, HTTP status) otherwise.
+        """
+        now = datetime.now(timezone.utc)
+        record = self.collection.find_one_and_delete({
+            "_id": email,
+            "otp_hash": self._hash(email, str(otp).strip()),
+            "expires_at": {"$gt": now},
+            "attempts": {"$lt": self.max_attempts},
+        })
+        if record is not None:
+            return record, None, None
+
+        pending = self.collection.find_one_and_update(
+            {"_id": email},
+            {"$inc": {"attempts": 1}},
+            projection={"attempts": 1, "expires_at": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if pending is None:
+            return None, "No OTP was requested for this email, or it has already been used", 400
+        expires_at = pending["expires_at"]
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        if expires_at <= now:
+            return None, "OTP has expired", 400
+        if pending["attempts"] >= self.max_attempts:
+            self.collection.delete_one({"_id": email})
+            return None, "Too many incorrect attempts. Please request a new OTP.", 429
+        return None, "Invalid OTP", 400
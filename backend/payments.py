@@ -0,0 +1,173 @@
+"""
+Payment-link providers.
+
+create_order talks to a provider through create_payment_link(data) -> {"id", "short_url"}.
+RazorpayProvider reuses pooled HTTPS connections, bounds every call with connect/read
+timeouts and stops calling Razorpay for a while once it keeps failing (CircuitBreaker),
+so an outage costs checkout a fast 503 instead of a worker blocked on each request.
+FakePaymentProvider issues links locally for development, tests and benchmarks.
+"""
+import itertools
+import threading
+import time
+
+
+class PaymentProviderError(Exception):
+    """A payment link could not be created. `retryable` is False when the request itself was rejected."""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class CircuitOpenError(PaymentProviderError):
+    """Raised without calling the provider while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After `failure_threshold` consecutive failures the breaker
+    opens and rejects calls for `reset_seconds`; then a single trial call is let through
+    (half-open) and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """Whether a call may go out now (claims the trial call when half-open)."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            return {"state": self._state(), "consecutive_failures": self._failures}
+
+
+class RazorpayProvider:
+    """Razorpay payment links over a pooled requests.Session with timeouts and a circuit breaker."""
+
+    name = "razorpay"
+
+    def __init__(self, key_id, key_secret, connect_timeout=3.05, read_timeout=10.0, pool_size=10, breaker=None):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = max(int(pool_size), 1)
+        self.breaker = breaker or CircuitBreaker()
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def _build_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        timeout = self.timeout
+
+        class TimeoutSession(requests.Session):
+            def request(self, *args, **kwargs):
+                kwargs.setdefault("timeout", timeout)
+                return super().request(*args, **kwargs)
+
+        session = TimeoutSession()
+        # No transport-level retries: a retried POST could create a second link.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount("https://", adapter)
+        return session
+
+    @property
+    def client(self):
+        """razorpay.Client sharing one connection pool, created on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import razorpay
+                    self._client = razorpay.Client(session=self._build_session(), auth=(self.key_id, self.key_secret))
+        return self._client
+
+    def create_payment_link(self, data):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Razorpay is unavailable (circuit open); try again shortly")
+        try:
+            link = self.client.payment_link.create(data)
+        except Exception as e:
+            from razorpay.errors import BadRequestError
+
+            if isinstance(e, BadRequestError):
+                # Razorpay answered; the request was wrong, not the service.
+                self.breaker.record_success()
+                raise PaymentProviderError(f"Razorpay rejected the payment link: {e}", retryable=False) from e
+            self.breaker.record_failure()
+            raise PaymentProviderError(f"Razorpay request failed: {e}") from e
+        self.breaker.record_success()
+        return {"id": link["id"], "short_url": link["short_url"]}
+
+
+class FakePaymentProvider:
+    """
+    Issues payment links without a network call. The link points straight back to the
+    order's callback_url; mark it paid by posting a signed payment_link.paid webhook.
+    `latency_seconds` and `fail_every` simulate a slow or flaky provider.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency_seconds=0.0, fail_every=0, breaker=None):
+        self.latency_seconds = latency_seconds
+        self.fail_every = int(fail_every)
+        self.breaker = breaker or CircuitBreaker()
+        self.links = {}
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def create_payment_link(self, data):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Fake provider is unavailable (circuit open)")
+        number = next(self._counter)
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if self.fail_every and number % self.fail_every == 0:
+            self.breaker.record_failure()
+            raise PaymentProviderError(f"Simulated provider failure #{number}")
+        link_id = f"plink_fake_{number}"
+        link = {"id": link_id, "short_url": data.get("callback_url") or f"https://payments.invalid/{link_id}"}
+        with self._lock:
+            self.links[link_id] = {**link, "amount": data.get("amount")}
+        self.breaker.record_success()
+        return link
@@ -0,0 +1,197 @@
+"""
+Cart pricing shared by /api/cart/quote and checkout.
+
+PricingEngine prices a cart from server-side data only: one `$in` read of the cart's
+products (projected to the fields pricing needs), the in-memory coupon index and the
+configured shipping rules. Priced lines are cached per (cart hash, catalog version), so
+a checkout page refreshing its quote does not read the catalog again; checkout itself
+always prices from a fresh read.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from bson.objectid import ObjectId
+
+QUOTE_PRODUCT_PROJECTION = {"name": 1, "price": 1, "images": 1, "quantity": 1, "reserved": 1}
+
+
+class QuoteError(Exception):
+    """The cart cannot be priced; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def parse_shipping_rules(raw):
+    """
+    Parses SHIPPING_RULES: a JSON list of {"min_subtotal": amount, "fee": amount}. The rule
+    with the highest min_subtotal not above the discounted subtotal sets the shipping fee.
+    """
+    rules = []
+    for rule in json.loads(raw or "[]"):
+        rules.append({"min_subtotal": float(rule.get("min_subtotal", 0)), "fee": max(float(rule["fee"]), 0.0)})
+    return sorted(rules, key=lambda rule: rule["min_subtotal"])
+
+
+def normalize_cart(items):
+    """Validates cart items into [(product_id, quantity)], keeping cart order and duplicates."""
+    if not items:
+        raise QuoteError("Cart cannot be empty")
+    cart = []
+    for item in items:
+        try:
+            quantity = int(item.get('quantity', 0))
+        except (TypeError, ValueError, AttributeError):
+            raise QuoteError("Invalid item quantity in cart")
+        if quantity <= 0:
+            raise QuoteError("Invalid item quantity in cart")
+        product_id = item.get('_id') or item.get('product_id')
+        if not product_id:
+            raise QuoteError("Product ID missing in cart item")
+        if not ObjectId.is_valid(str(product_id)):
+            raise QuoteError("Invalid product ID in cart item")
+        cart.append((str(product_id), quantity))
+    return cart
+
+
+def cart_hash(cart):
+    return hashlib.sha1(json.dumps(cart, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class PricingEngine:
+    """
+    quote(items, coupon_code) -> {"items", "subtotal", "discount_percent", "discount_amount",
+    "shipping_fee_base", "shipping_fee_applied", "total_amount", ...}.
+
+    `catalog_version` returns a number that changes whenever this process sees a catalog
+    write; cached lines also expire after `cache_ttl` to bound staleness from writes made
+    by other workers.
+    """
+
+    def __init__(self, products, coupon_lookup, validate_coupon, shipping_fee_base, shipping_rules,
+                 catalog_version=lambda: 0, cache_size=256, cache_ttl=30):
+        self.products = products
+        self.coupon_lookup = coupon_lookup
+        self.validate_coupon = validate_coupon
+        self.shipping_fee_base = float(shipping_fee_base)
+        self.shipping_rules = shipping_rules
+        self.catalog_version = catalog_version
+        self.cache_size = max(int(cache_size), 1)
+        self.cache_ttl = cache_ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- Lines ---
+
+    def _load_lines(self, cart):
+        ids = {product_id for product_id, _ in cart}
+        products = {
+            str(product["_id"]): product
+            for product in self.products.find({"_id": {"$in": [ObjectId(i) for i in ids]}}, QUOTE_PRODUCT_PROJECTION)
+        }
+        if len(products) != len(ids):
+            raise QuoteError("One or more products are unavailable", 409)
+
+        lines = []
+        for product_id, quantity in cart:
+            product = products[product_id]
+            unit_price = float(product.get("price", 0) or 0)
+            images = product.get("images") or []
+            available = max(int(product.get("quantity", 0) or 0) - int(product.get("reserved", 0) or 0), 0)
+            lines.append({
+                "_id": product_id,
+                "name": product.get("name", "Product"),
+                "price": unit_price,
+                "quantity": quantity,
+                "image": images[0] if images else None,
+                "line_total": unit_price * quantity,
+                "available_quantity": available,
+            })
+        return lines
+
+    def _cached_lines(self, cart):
+        version = self.catalog_version()
+        key = (cart_hash(cart), version)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and time.monotonic() - entry["loaded_at"] <= self.cache_ttl:
+                self._cache.move_to_end(key)
+                return [dict(line) for line in entry["lines"]]
+
+        lines = self._load_lines(cart)
+        with self._lock:
+            # A catalog write during the read makes these lines stale; answer with them but do not keep them.
+            if version == self.catalog_version():
+                self._cache[key] = {"lines": [dict(line) for line in lines], "loaded_at": time.monotonic()}
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return lines
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+
+    # --- Shipping ---
+
+    def shipping_fee(self, amount):
+        """Fee of the rule matching `amount` (the discounted subtotal); the base fee when none matches."""
+        fee = self.shipping_fee_base
+        for rule in self.shipping_rules:
+            if amount >= rule["min_subtotal"]:
+                fee = rule["fee"]
+        return fee
+
+    def next_shipping_rule(self, amount, fee):
+        """The nearest cheaper rule above `amount`, so the storefront can say "add X for free shipping"."""
+        for rule in self.shipping_rules:
+            if rule["min_subtotal"] > amount and rule["fee"] < fee:
+                return {**rule, "amount_remaining": rule["min_subtotal"] - amount}
+        return None
+
+    # --- Quote ---
+
+    def quote(self, items, coupon_code=None, use_cache=True, strict_coupon=True):
+        """
+        Prices a cart. Raises QuoteError for an invalid cart, and for an invalid coupon when
+        `strict_coupon`; otherwise the coupon is ignored and explained in "coupon_error".
+        """
+        cart = normalize_cart(items)
+        lines = self._cached_lines(cart) if use_cache else self._load_lines(cart)
+        subtotal = sum(line["line_total"] for line in lines)
+
+        coupon_code = (coupon_code or "").strip().upper() or None
+        discount_percent = 0
+        coupon_error = None
+        if coupon_code:
+            coupon = self.coupon_lookup(coupon_code)
+            is_valid, error_message, error_status = self.validate_coupon(coupon)
+            if is_valid:
+                discount_percent = coupon["discount"]
+            elif strict_coupon:
+                raise QuoteError(error_message, error_status)
+            else:
+                coupon_error = error_message
+                coupon_code = None
+        discount_amount = (subtotal * discount_percent) / 100
+
+        shipping_fee_applied = self.shipping_fee(subtotal - discount_amount)
+        quote = {
+            "items": lines,
+            "subtotal": subtotal,
+            "coupon_code": coupon_code,
+            "discount_percent": discount_percent,
+            "discount_amount": discount_amount,
+            "shipping_fee_base": self.shipping_fee_base,
+            "shipping_fee_applied": shipping_fee_applied,
+            "total_amount": max(subtotal - discount_amount + shipping_fee_applied, 0),
+            "next_shipping_rule": self.next_shipping_rule(subtotal - discount_amount, shipping_fee_applied),
+        }
+        if coupon_error:
+            quote["coupon_error"] = coupon_error
+        return quote
@@ -0,0 +1,139 @@
+"""
+Token-bucket rate limiting for the public, email-sending and login endpoints.
+
+Each (action, identity) pair - an IP address or an email - has a bucket of `capacity`
+tokens that refills completely over `per_seconds`. A request spends one token from each
+of its buckets.
+
+Buckets live in process memory first: a client whose local bucket is empty is refused
+without touching MongoDB. Otherwise the token is spent on the shared bucket in
+`collection` (one atomic update, so every worker enforces the same limit) and the local
+bucket is synced to the shared result. When one of a request's buckets refuses, the
+tokens already spent on its other buckets are refunded, so hammering a blocked email
+does not drain the budget of the IP it comes from. Shared buckets expire through a TTL index once
+they would be full again. If MongoDB is unreachable, the local buckets alone apply.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    `limits` maps an action to {identity kind: (capacity, per_seconds)}, e.g.
+    {"otp_send": {"email": (3, 600), "ip": (20, 3600)}}.
+    """
+
+    def __init__(self, collection, limits, max_local_buckets=10000):
+        self.collection = collection
+        self.limits = limits
+        self.max_local_buckets = max(int(max_local_buckets), 1)
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _refill(tokens, updated, now, capacity, rate):
+        return min(capacity, tokens + max(now - updated, 0) * rate)
+
+    def _local(self, key, capacity, rate, now):
+        """Current local token count for a key (a missing bucket is full)."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return capacity
+        self._buckets.move_to_end(key)
+        return self._refill(bucket[0], bucket[1], now, capacity, rate)
+
+    def _set_local(self, key, tokens, now):
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_local_buckets:
+            self._buckets.popitem(last=False)
+
+    def _spend_shared(self, key, capacity, rate, per_seconds, now):
+        """Spends a token on the shared bucket. Returns (allowed, tokens left)."""
+        refilled = {"$min": [capacity, {"$add": [
+            {"$ifNull": ["$tokens", capacity]},
+            {"$multiply": [{"$max": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, 0]}, rate]},
+        ]}]}
+        bucket = self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {
+                    "tokens": refilled,
+                    "updated": now,
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=per_seconds),
+                }},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", 1]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return bucket["allowed"], bucket["tokens"]
+
+    def _refund(self, spent):
+        """Gives back the token a refused request spent on each (key, capacity, shared) bucket."""
+        for key, capacity, shared in spent:
+            if shared:
+                try:
+                    self.collection.update_one(
+                        {"_id": key},
+                        [{"$set": {"tokens": {"$min": [capacity, {"$add": ["$tokens", 1]}]}}}],
+                    )
+                except Exception as e:
+                    logger.error(f"Shared rate limit refund failed for {key}: {e}")
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    self._set_local(key, min(capacity, bucket[0] + 1), bucket[1])
+
+    def hit(self, action, identities):
+        """
+        Spends one token per identity ({kind: value}) for `action`. Returns 0 when the
+        request may proceed, otherwise the number of seconds until it may be retried.
+        """
+        limits = self.limits.get(action, {})
+        buckets = []
+        for kind, value in identities.items():
+            if value and kind in limits:
+                capacity, per_seconds = limits[kind]
+                buckets.append((f"{action}:{kind}:{value}", capacity, capacity / per_seconds, per_seconds))
+        if not buckets:
+            return 0
+
+        now = time.time()
+        with self._lock:
+            for key, capacity, rate, _ in buckets:
+                tokens = self._local(key, capacity, rate, now)
+                if tokens < 1:
+                    return math.ceil((1 - tokens) / rate)
+
+        spent = []
+        for key, capacity, rate, per_seconds in buckets:
+            shared = True
+            try:
+                allowed, tokens = self._spend_shared(key, capacity, rate, per_seconds, now)
+            except Exception as e:
+                shared = False
+                logger.error(f"Shared rate limit update failed for {key}, using the local bucket: {e}")
+                with self._lock:
+                    tokens = self._local(key, capacity, rate, now)
+                    allowed = tokens >= 1
+                    if allowed:
+                        tokens -= 1
+            with self._lock:
+                self._set_local(key, tokens, now)
+            if not allowed:
+                self._refund(spent)
+                return math.ceil((1 - tokens) / rate)
+            spent.append((key, capacity, shared))
+        return 0
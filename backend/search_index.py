@@ -0,0 +1,272 @@
+"""In-memory inverted index serving product search, filters, sorting and facet counts."""
+import bisect
+import re
+import threading
+import time
+
+from catalog_cache import product_matches_ref
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Relative weight of a query term found in each product field.
+FIELD_WEIGHTS = {"name": 3, "category": 2, "description": 1}
+FACET_FIELDS = ("category", "gender", "type", "material")
+SORTS = ("relevance", "price_asc", "price_desc", "trending")
+TRENDING_VALUES = {"y", "yes", "true", "1"}
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+
+def normalize_token(token):
+    """Folds simple plurals so "rings" matches "ring" and "earrings" matches "earring"."""
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [normalize_token(t) for t in TOKEN_RE.findall(str(text).lower())]
+
+
+def is_trending(product):
+    return str(product.get("isTrending") or "").strip().lower() in TRENDING_VALUES
+
+
+def product_price(product):
+    try:
+        return float(product.get("price") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def parse_search_args(args):
+    """Turns /api/products/search query parameters into search() keyword arguments (raises ValueError)."""
+    def number(name):
+        value = args.get(name)
+        if value in (None, ""):
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"{name} must be a number")
+
+    def integer(name, default, minimum, maximum):
+        value = args.get(name)
+        if value in (None, ""):
+            return default
+        try:
+            return min(max(int(value), minimum), maximum)
+        except ValueError:
+            raise ValueError(f"{name} must be an integer")
+
+    filters = {}
+    for field in FACET_FIELDS:
+        values = [v.strip() for v in (args.get(field) or "").split(",") if v.strip() and v.strip() != "all"]
+        if values:
+            filters[field] = values
+
+    sort = args.get("sort") or "relevance"
+    if sort not in SORTS:
+        raise ValueError(f"sort must be one of: {', '.join(SORTS)}")
+
+    return {
+        "q": (args.get("q") or "").strip(),
+        "filters": filters,
+        "min_price": number("min_price"),
+        "max_price": number("max_price"),
+        "in_stock": (args.get("in_stock") or "").lower() in ("1", "true", "yes"),
+        "sort": sort,
+        "limit": integer("limit", DEFAULT_LIMIT, 1, MAX_LIMIT),
+        "offset": integer("offset", 0, 0, 10_000),
+    }
+
+
+class ProductSearchIndex:
+    """
+    Keeps every product (already serialized for the API) in memory together with an
+    inverted index from normalized tokens to weighted product ids.
+
+    The index is built on first use and rebuilt after `ttl_seconds` (to pick up writes
+    made by other worker processes); in between, admin edits and stock movements made by
+    this process are applied incrementally through the same hooks as the catalog cache.
+    """
+
+    def __init__(self, loader, ttl_seconds=300, stock_refresher=None):
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        self.stock_refresher = stock_refresher
+        self._products = {}
+        self._postings = {}
+        self._doc_tokens = {}
+        self._vocabulary = []
+        self._vocabulary_dirty = False
+        self._loaded_at = None
+        self._lock = threading.RLock()
+
+    # --- Index maintenance ---
+
+    def _index(self, product):
+        product_id = str(product["_id"])
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(product.get(field)):
+                weights[token] = weights.get(token, 0) + weight
+        self._products[product_id] = dict(product)
+        self._doc_tokens[product_id] = set(weights)
+        for token, weight in weights.items():
+            if token not in self._postings:
+                self._postings[token] = {}
+                self._vocabulary_dirty = True
+            self._postings[token][product_id] = weight
+
+    def _unindex(self, product_id):
+        self._products.pop(product_id, None)
+        for token in self._doc_tokens.pop(product_id, ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                self._vocabulary_dirty = True
+
+    def _rebuild(self):
+        self._products, self._postings, self._doc_tokens = {}, {}, {}
+        for product in self.loader():
+            self._index(product)
+        self._vocabulary = sorted(self._postings)
+        self._vocabulary_dirty = False
+        self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_seconds:
+            self._rebuild()
+        elif self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+
+    def invalidate(self):
+        """Forces a full rebuild on the next search."""
+        with self._lock:
+            self._loaded_at = None
+
+    def product_added(self, product):
+        self.product_updated(product)
+
+    def product_updated(self, product):
+        """Re-indexes one serialized product (no-op until the index has been built)."""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            product_id = str(product["_id"])
+            self._unindex(product_id)
+            self._index(product)
+
+    def product_removed(self, product_id):
+        with self._lock:
+            if self._loaded_at is not None:
+                self._unindex(str(product_id))
+
+    def adjust_quantities(self, deltas, field="quantity"):
+        """Applies stock movements (same contract as CatalogCache.adjust_quantities)."""
+        if not deltas:
+            return
+        with self._lock:
+            for product in self._products.values():
+                for ref, delta in deltas.items():
+                    if product_matches_ref(product, ref):
+                        product[field] = int(product.get(field, 0) or 0) + delta
+                        if self.stock_refresher:
+                            self.stock_refresher(product)
+
+    # --- Querying ---
+
+    def _term_matches(self, term, prefix):
+        """{product_id: weight} for one query term; the last term also matches as a prefix."""
+        if not prefix:
+            return dict(self._postings.get(term, {}))
+        matches = {}
+        start = bisect.bisect_left(self._vocabulary, term)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(term):
+                break
+            for product_id, weight in self._postings.get(token, {}).items():
+                # Exact matches outrank prefix matches.
+                matches[product_id] = max(matches.get(product_id, 0), weight if token == term else weight / 2)
+        return matches
+
+    def _text_scores(self, q):
+        terms = tokenize(q)
+        if not terms:
+            return {product_id: 0 for product_id in self._products}
+        scores = None
+        for i, term in enumerate(terms):
+            matches = self._term_matches(term, prefix=i == len(terms) - 1)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {pid: scores[pid] + weight for pid, weight in matches.items() if pid in scores}
+            if not scores:
+                return {}
+        return scores
+
+    @staticmethod
+    def _passes(product, filters, skip_field=None):
+        for field, values in filters.items():
+            if field != skip_field and str(product.get(field)) not in values:
+                return False
+        return True
+
+    def search(self, q="", filters=None, min_price=None, max_price=None, in_stock=False,
+               sort="relevance", limit=DEFAULT_LIMIT, offset=0):
+        """Returns a page of matching products plus facet counts for the whole result set."""
+        filters = {field: set(map(str, values)) for field, values in (filters or {}).items()}
+        with self._lock:
+            self._ensure_loaded()
+            scores = self._text_scores(q)
+            candidates = []
+            for product_id, score in scores.items():
+                product = self._products[product_id]
+                price = product_price(product)
+                if min_price is not None and price < min_price:
+                    continue
+                if max_price is not None and price > max_price:
+                    continue
+                if in_stock and not product.get("in_stock", True):
+                    continue
+                candidates.append((product, score))
+
+            # Each facet is counted with every filter applied except its own, so the
+            # counts show what selecting another value of that facet would return.
+            facets = {}
+            for field in FACET_FIELDS:
+                counts = {}
+                for product, _ in candidates:
+                    value = product.get(field)
+                    if value is None or value == "" or not self._passes(product, filters, skip_field=field):
+                        continue
+                    counts[str(value)] = counts.get(str(value), 0) + 1
+                facets[field] = dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+            matched = [(product, score) for product, score in candidates if self._passes(product, filters)]
+            if sort == "price_asc":
+                matched.sort(key=lambda m: (product_price(m[0]), str(m[0].get("name", ""))))
+            elif sort == "price_desc":
+                matched.sort(key=lambda m: (-product_price(m[0]), str(m[0].get("name", ""))))
+            elif sort == "trending":
+                matched.sort(key=lambda m: (not is_trending(m[0]), -m[1], str(m[0].get("name", ""))))
+            else:
+                matched.sort(key=lambda m: (-m[1], str(m[0].get("name", ""))))
+
+            page = [dict(product) for product, _ in matched[offset:offset + limit]]
+        return {
+            "query": q,
+            "total": len(matched),
+            "limit": limit,
+            "offset": offset,
+            "sort": sort,
+            "results": page,
+            "facets": facets,
+            "source": "index",
+        }
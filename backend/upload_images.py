@@ -1,8 +1,26 @@
+"""
+Moves product images that still point at local files (frontend/assets/...) to Cloudinary.
+
+    python upload_images.py                         # upload to Cloudinary with 8 threads
+    python upload_images.py --workers 16 --batch-size 200
+    python upload_images.py --uploader local --local-dir /tmp/images   # offline dry run of the whole pipeline
+
+Identical files (by SHA-256) are uploaded once. Progress is appended to a checkpoint
+file, so an interrupted run resumes where it stopped instead of starting over.
+"""
+import argparse
+import hashlib
+import json
 import os
-import cloudinary
-import cloudinary.uploader
-from pymongo import MongoClient
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
 from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import ConfigurationError
 
 load_dotenv()
 
@@ -12,63 +30,305 @@ load_dotenv()
 #  |- backend/
 #  |- frontend/
 FRONTEND_IMAGE_PATH_BASE = os.path.join(os.path.dirname(__file__), '..', 'frontend')
+CONNECTION_STRING = os.getenv("MONGO_URI_MAIN") or os.getenv("MONGO_URI")
+DB_NAME = "everaura_db"
+CLOUDINARY_FOLDER = "everaura_products"
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(__file__), "upload_images.checkpoint.ndjson")
 
-# Cloudinary and MongoDB Config
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET")
-)
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client.everaura_db
-products_collection = db.products
 
-def upload_and_update():
-    print("Starting image migration to Cloudinary...")
+def file_digest(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    for product in products_collection.find():
-        # The old field might be 'image' (string) or 'images' (array)
-        image_paths = product.get("images") or [product.get("image")]
 
-        if not image_paths or not image_paths[0] or "cloudinary" in image_paths[0]:
-            print(f"Skipping '{product['name']}' (already has cloud URL or no image path).")
-            continue
+def is_remote(path):
+    return str(path).startswith(("http://", "https://"))
+
+
+# --- Uploaders ---
+
+class CloudinaryUploader:
+    """Uploads to Cloudinary. The content hash is the public id, so re-uploads are no-ops."""
+
+    def __init__(self, folder=CLOUDINARY_FOLDER):
+        import cloudinary
+        import cloudinary.uploader
+        cloudinary.config(
+            cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+            api_key=os.getenv("CLOUDINARY_API_KEY"),
+            api_secret=os.getenv("CLOUDINARY_API_SECRET"),
+            secure=True,
+        )
+        self._uploader = cloudinary.uploader
+        self.folder = folder
+
+    def upload(self, path, digest):
+        result = self._uploader.upload(
+            path, folder=self.folder, public_id=digest[:32], overwrite=False, unique_filename=False
+        )
+        return result["secure_url"]
+
+
+class LocalUploader:
+    """Stand-in that copies files into a directory, for offline runs and testing."""
+
+    def __init__(self, target_dir, base_url=None):
+        self.target_dir = os.path.abspath(target_dir)
+        self.base_url = (base_url or f"file://{self.target_dir}").rstrip("/")
+        os.makedirs(self.target_dir, exist_ok=True)
+
+    def upload(self, path, digest):
+        name = digest[:32] + os.path.splitext(path)[1].lower()
+        shutil.copyfile(path, os.path.join(self.target_dir, name))
+        return f"{self.base_url}/{name}"
+
+
+# --- Checkpoint ---
+
+class Checkpoint:
+    """
+    Append-only NDJSON log of finished uploads ({"hash", "url"}) and updated products
+    ({"product"}). Reloaded on start, so a rerun skips work that already finished.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.urls = {}
+        self.done_products = set()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut short by a crash
+                    if "hash" in entry:
+                        self.urls[entry["hash"]] = entry["url"]
+                    elif "product" in entry:
+                        self.done_products.add(entry["product"])
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    def _append(self, entries):
+        if self._file is None:
+            return
+        with self._lock:
+            for entry in entries:
+                self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def record_upload(self, digest, url):
+        with self._lock:
+            self.urls[digest] = url
+        self._append([{"hash": digest, "url": url}])
+
+    def record_products(self, product_ids):
+        with self._lock:
+            self.done_products.update(product_ids)
+        self._append([{"product": product_id} for product_id in product_ids])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+# --- Migration ---
+
+class ImageMigration:
+    def __init__(self, collection, uploader, checkpoint, image_root=FRONTEND_IMAGE_PATH_BASE,
+                 workers=8, batch_size=100):
+        self.collection = collection
+        self.uploader = uploader
+        self.checkpoint = checkpoint
+        self.image_root = image_root
+        self.workers = max(int(workers), 1)
+        self.batch_size = max(int(batch_size), 1)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"products_seen": 0, "products_updated": 0, "products_skipped": 0,
+                      "products_failed": 0,
+                      "files_uploaded": 0, "files_deduplicated": 0, "files_missing": 0,
+                      "files_failed": 0, "bytes_uploaded": 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def upload_file(self, path):
+        """Uploads one file unless an identical one was already (or is being) uploaded."""
+        digest = file_digest(path)
+        with self._lock:
+            url = self.checkpoint.urls.get(digest)
+            pending = self._inflight.get(digest) if url is None else None
+            owner = url is None and pending is None
+            if owner:
+                pending = self._inflight[digest] = Future()
+        if url is not None:
+            self._count("files_deduplicated")
+            return url
+        if not owner:
+            self._count("files_deduplicated")
+            return pending.result()
+
+        try:
+            url = self.uploader.upload(path, digest)
+            # Recorded before leaving _inflight so no other thread can miss both.
+            self.checkpoint.record_upload(digest, url)
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(digest, None)
+        pending.set_result(url)
+        self._count("files_uploaded")
+        self._count("bytes_uploaded", os.path.getsize(path))
+        return url
+
+    def migrate_product(self, product):
+        """
+        Returns the product's new image list, or None when nothing needs to change or some
+        local image could not be uploaded. Such a product is left as it is and not
+        checkpointed, so the next run retries it (files that did upload are deduplicated).
+        """
+        # The old field might be 'image' (string) or 'images' (array)
+        image_paths = [p for p in (product.get("images") or [product.get("image")]) if p]
+        if not image_paths or all(is_remote(p) for p in image_paths):
+            return None
 
         new_image_urls = []
-        for local_path in image_paths:
-            # Construct the full local file path from the relative path
-            # e.g., "assets/images/products/ring1.jpg"
-            full_path = os.path.join(FRONTEND_IMAGE_PATH_BASE, local_path)
-
-            if os.path.exists(full_path):
-                try:
-                    print(f"Uploading {os.path.basename(full_path)} for '{product['name']}'...")
-                    # Upload to Cloudinary into a specific folder for organization
-                    upload_result = cloudinary.uploader.upload(full_path, folder="everaura_products")
-                    secure_url = upload_result.get("secure_url")
-
-                    if secure_url:
-                        new_image_urls.append(secure_url)
-
-                except Exception as e:
-                    print(f"  ❌ FAILED to upload {os.path.basename(full_path)}. Error: {e}")
-            else:
+        unresolved = []
+        for image_path in image_paths:
+            if is_remote(image_path):
+                new_image_urls.append(image_path)
+                continue
+            # e.g. "assets/images/products/ring1.jpg"
+            full_path = os.path.join(self.image_root, image_path)
+            if not os.path.exists(full_path):
                 print(f"  ⚠️ WARNING: Image file not found at path: {full_path}")
+                self._count("files_missing")
+                unresolved.append(image_path)
+                continue
+            try:
+                new_image_urls.append(self.upload_file(full_path))
+            except Exception as e:
+                print(f"  ❌ FAILED to upload {os.path.basename(full_path)} for '{product.get('name')}'. Error: {e}")
+                self._count("files_failed")
+                unresolved.append(image_path)
+        if unresolved:
+            print(f"  ⚠️ Leaving '{product.get('name')}' unchanged: {len(unresolved)} image(s) unresolved; rerun to retry.")
+            self._count("products_failed")
+            return None
+        return new_image_urls
 
-        if new_image_urls:
-            # Update the database record with the new array of Cloudinary URLs
-            products_collection.update_one(
+    def _flush(self, updates):
+        if not updates:
+            return
+        self.collection.bulk_write([operation for _, operation in updates], ordered=False)
+        self.checkpoint.record_products([product_id for product_id, _ in updates])
+        self._count("products_updated", len(updates))
+
+    def run(self):
+        started = time.monotonic()
+        projection = {"name": 1, "image": 1, "images": 1}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            batch = []
+            for product in self.collection.find({}, projection):
+                self.stats["products_seen"] += 1
+                if str(product["_id"]) in self.checkpoint.done_products:
+                    self.stats["products_skipped"] += 1
+                    continue
+                batch.append(product)
+                if len(batch) >= self.batch_size:
+                    self._process_batch(pool, batch, started)
+                    batch = []
+            self._process_batch(pool, batch, started)
+        return self.summary(started)
+
+    def _process_batch(self, pool, products, started):
+        if not products:
+            return
+        results = list(pool.map(self.migrate_product, products))
+        updates = [
+            (str(product["_id"]), UpdateOne(
                 {"_id": product["_id"]},
                 {
-                    "$set": {"images": new_image_urls}, # The field is now 'images'
-                    "$unset": {"image": ""} # Remove the old 'image' field if it exists
-                }
-            )
-            print(f"  ✅ Success! Updated '{product['name']}' with new cloud URL(s).")
+                    "$set": {"images": images},  # The field is now 'images'
+                    "$unset": {"image": ""}  # Remove the old 'image' field if it exists
+                },
+            ))
+            for product, images in zip(products, results) if images
+        ]
+        self._flush(updates)
+        print(f"  {self.stats['products_seen']} products scanned, {self.stats['products_updated']} updated, "
+              f"{self.stats['files_uploaded']} files uploaded "
+              f"({self.stats['files_uploaded'] / max(time.monotonic() - started, 1e-9):.1f} files/s)", flush=True)
+
+    def summary(self, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        return {
+            **self.stats,
+            "seconds": round(elapsed, 2),
+            "files_per_second": round(self.stats["files_uploaded"] / elapsed, 2),
+            "megabytes_per_second": round(self.stats["bytes_uploaded"] / elapsed / 1e6, 3),
+        }
+
+
+def select_database(client, name=None):
+    if name:
+        return client[name]
+    try:
+        return client.get_default_database()
+    except ConfigurationError:
+        return client[DB_NAME]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload local product images and point products at the new URLs.")
+    parser.add_argument("--uri", default=CONNECTION_STRING, help="MongoDB connection string (default: MONGO_URI_MAIN).")
+    parser.add_argument("--db", help=f"Database name (default: the URI's database, else {DB_NAME}).")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent uploads.")
+    parser.add_argument("--batch-size", type=int, default=100, help="Products per bulk update.")
+    parser.add_argument("--uploader", choices=("cloudinary", "local"), default="cloudinary")
+    parser.add_argument("--local-dir", default="uploaded_images", help="Target directory for --uploader local.")
+    parser.add_argument("--local-base-url", help="URL prefix stored for --uploader local (default: file:// path).")
+    parser.add_argument("--image-root", default=FRONTEND_IMAGE_PATH_BASE, help="Directory local image paths are relative to.")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Checkpoint file used to resume runs.")
+    parser.add_argument("--reset", action="store_true", help="Ignore and replace an existing checkpoint.")
+    args = parser.parse_args()
+
+    if not args.uri:
+        print("❌ ERROR: set MONGO_URI_MAIN (or pass --uri).")
+        sys.exit(1)
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    if args.uploader == "local":
+        uploader = LocalUploader(args.local_dir, args.local_base_url)
+    else:
+        uploader = CloudinaryUploader()
 
+    client = MongoClient(args.uri)
+    checkpoint = Checkpoint(args.checkpoint)
+    try:
+        print("Starting image migration...")
+        migration = ImageMigration(
+            select_database(client, args.db).products, uploader, checkpoint,
+            image_root=args.image_root, workers=args.workers, batch_size=args.batch_size,
+        )
+        stats = migration.run()
+        print("\nMigration process complete.")
+        print(json.dumps(stats, indent=2))
+        if stats["products_failed"]:
+            print(f"⚠️ {stats['products_failed']} product(s) still have unresolved local images; rerun to retry them.")
+            sys.exit(1)
+    finally:
+        checkpoint.close()
+        client.close()
 
-    print("\nMigration process complete.")
-    client.close()
 
 if __name__ == "__main__":
-    upload_and_update()
+    main()
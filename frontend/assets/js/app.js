@@ -35,6 +35,36 @@ function getUser() {
   }
 }
 
+// --- PRODUCT IMAGE HELPERS ---
+// The backend stores resized variants (thumb/card/detail, AVIF and WebP) next to each original.
+const IMAGE_VARIANT_WIDTHS = { thumb: 160, card: 480, detail: 1200 };
+
+function productImageUrl(product, size, fallback) {
+  const variants = product.image_variants && product.image_variants[0];
+  if (variants && variants[size]) {
+    return variants[size].webp || variants[size].avif || fallback;
+  }
+  return product.images && product.images.length > 0 ? product.images[0] : fallback;
+}
+
+// <picture> offering AVIF/WebP srcsets so the browser downloads the smallest variant that fits `sizes`.
+function productPictureHtml(product, sizes, fallback, imgAttributes = "") {
+  const src = product.images && product.images.length > 0 ? product.images[0] : fallback;
+  const variants = product.image_variants && product.image_variants[0];
+  const img = `<img src="${src}" alt="${product.name}" loading="lazy" decoding="async" ${imgAttributes}>`;
+  if (!variants) return img;
+  const sources = ["avif", "webp"]
+    .map((format) => {
+      const srcset = Object.entries(IMAGE_VARIANT_WIDTHS)
+        .filter(([size]) => variants[size] && variants[size][format])
+        .map(([size, width]) => `${variants[size][format]} ${width}w`)
+        .join(", ");
+      return srcset ? `<source type="image/${format}" srcset="${srcset}" sizes="${sizes}">` : "";
+    })
+    .join("");
+  return `<picture>${sources}${img}</picture>`;
+}
+
 function getAppliedCoupon() {
   try {
       return JSON.parse(sessionStorage.getItem("appliedCoupon"));
@@ -213,8 +243,13 @@ async function fetchProducts(category = "all", gender = null, type = null) {
 }
 
 // --- Product Loading Functions ---
+function getAvailableQuantity(product) {
+  // available_quantity excludes units held by other shoppers' pending orders.
+  return Number(product.available_quantity ?? product.quantity ?? 0);
+}
+
 function getProductStockState(product) {
-const quantity = Number(product.quantity || 0);
+const quantity = getAvailableQuantity(product);
 let isNew = false;
 
 if (product.created_at) {
@@ -312,10 +347,11 @@ finalProducts.forEach((product) => {
   const productElement = document.createElement(isTrending ? "div" : "div");
   if (isTrending) productElement.className = "swiper-slide";
 
-  const firstImage =
-    product.images && product.images.length > 0
-      ? product.images[0]
-      : "https://via.placeholder.com/400x550?text=No+Image";
+  const firstImage = productPictureHtml(
+    product,
+    "(max-width: 600px) 50vw, 300px",
+    "https://via.placeholder.com/400x550?text=No+Image"
+  );
 
   const stockState = getProductStockState(product);
 
@@ -324,7 +360,7 @@ finalProducts.forEach((product) => {
               <div class="product-card-inner">
                   <div class="product-card-front">
                       <div class="product-image">
-                          <img src="${firstImage}" alt="${product.name}">
+                          ${firstImage}
                           ${
                             stockState.badge
                               ? `<span class="product-stock-badge ${stockState.badgeClass}">${stockState.badge}</span>`
@@ -539,10 +575,7 @@ let o = `<div class="cart-modal-content"><button class="cart-modal-close" onclic
       '<div class="modal-header"><button class="modal-clear-btn" onclick="clearWishlist()">Clear Wishlist</button></div>'),
     (o += '<ul class="cart-items-list">'),
     t.forEach((e) => {
-      const t =
-        e.images && e.images.length > 0
-          ? e.images[0]
-          : "https://via.placeholder.com/60x60?text=No+Img";
+      const t = productImageUrl(e, "thumb", "https://via.placeholder.com/60x60?text=No+Img");
       o += `<li class="cart-item"><img src="${t}" alt="${
         e.name
       }" class="cart-item-image"><div class="cart-item-details"><span class="cart-item-name">${
@@ -609,7 +642,7 @@ try {
     return;
   }
 
-  const availableQuantity = Number(productToAdd.quantity || 0);
+  const availableQuantity = getAvailableQuantity(productToAdd);
 
   if (availableQuantity <= 0) {
     showToast("This piece is currently sold out.", "error");
@@ -627,10 +660,7 @@ try {
 
     existingItem.quantity++;
   } else {
-    const image =
-      productToAdd.images && productToAdd.images.length > 0
-        ? productToAdd.images[0]
-        : "https://via.placeholder.com/60x60?text=No+Img";
+    const image = productImageUrl(productToAdd, "thumb", "https://via.placeholder.com/60x60?text=No+Img");
 
     cart.push({
       _id: productToAdd._id,
@@ -710,7 +740,7 @@ try {
     return;
   }
 
-  const availableQuantity = Number(product.quantity || 0);
+  const availableQuantity = getAvailableQuantity(product);
   const cart = getCart();
   const index = cart.findIndex((item) => item._id === productId);
 
@@ -852,6 +882,54 @@ if (discountElem) discountElem.textContent = `-₹${discountAmount.toFixed(2)}`;
 if (totalElem) totalElem.textContent = `₹${total.toFixed(2)}`;
 if (shippingBaseElem) shippingBaseElem.innerHTML = `<s>₹${SHIPPING_FEE_BASE.toFixed(2)}</s>`;
 if (shippingEffectiveElem) shippingEffectiveElem.textContent = SHIPPING_FEE_APPLIED === 0 ? "Free" : `₹${SHIPPING_FEE_APPLIED.toFixed(2)}`;
+// The checkout summary is replaced by the server's quote (current prices, coupon and shipping rules).
+if (shippingBaseElem && cart.length) scheduleQuoteRefresh();
+}
+
+let quoteRefreshTimer = null;
+let quoteRequestId = 0;
+
+function scheduleQuoteRefresh() {
+clearTimeout(quoteRefreshTimer);
+quoteRefreshTimer = setTimeout(refreshCheckoutQuote, 250);
+}
+
+async function refreshCheckoutQuote() {
+const requestId = ++quoteRequestId;
+const appliedCoupon = getAppliedCoupon();
+try {
+  const res = await fetch(`${API_URL}/cart/quote`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({
+      items: getCart().map((item) => ({ _id: item._id, quantity: item.quantity })),
+      coupon_code: appliedCoupon ? appliedCoupon.code : null,
+    }),
+  });
+  const quote = await res.json();
+  // A newer cart or coupon change has already asked for a fresher quote.
+  if (requestId !== quoteRequestId) return;
+  if (!res.ok) {
+    setFormMessage(quote.error || "Could not price your cart.", "error");
+    return;
+  }
+  if (quote.coupon_error) {
+    sessionStorage.removeItem("appliedCoupon");
+    updateCouponUI(null);
+    showToast(quote.coupon_error);
+  }
+  const shippingFee = quote.shipping_fee_applied;
+  document.getElementById("cart-subtotal").textContent = `₹${quote.subtotal.toFixed(2)}`;
+  const discountElem = document.getElementById("cart-discount");
+  if (discountElem) discountElem.textContent = `-₹${quote.discount_amount.toFixed(2)}`;
+  document.getElementById("cart-total").textContent = `₹${quote.total_amount.toFixed(2)}`;
+  document.getElementById("shipping-base-display").innerHTML =
+    shippingFee < quote.shipping_fee_base ? `<s>₹${quote.shipping_fee_base.toFixed(2)}</s>` : "";
+  document.getElementById("shipping-effective-display").textContent =
+    shippingFee === 0 ? "Free" : `₹${shippingFee.toFixed(2)}`;
+} catch (err) {
+  console.error("Failed to refresh the checkout quote:", err);
+}
 }
 
 function proceedToCheckout() {
@@ -1111,14 +1189,8 @@ async function handlePlaceOrder() {
 
   try {
       const token = getToken();
-      const response = await fetch(`${API_URL}/orders/create`, {
-          method: 'POST',
-          headers: {
-              'Content-Type': 'application/json',
-              'Authorization': `Bearer ${token}`
-          },
-          body: JSON.stringify(orderData)
-      });
+      const body = JSON.stringify(orderData);
+      const response = await postOrder(body, checkoutIdempotencyKey(body), token);
       
       if (!response.ok) {
           let errorMsg = "An unknown error occurred.";
@@ -1134,9 +1206,17 @@ async function handlePlaceOrder() {
       const data = await response.json();
       clearCart();
       sessionStorage.removeItem("appliedCoupon");
+      sessionStorage.removeItem("checkoutAttempt");
+
+      // 202: the order is stored and the payment link is still being created.
+      let paymentUrl = data.payment_url;
+      if (!paymentUrl) {
+          setFormMessage("Order created! Preparing your payment...", "success");
+          paymentUrl = await waitForPaymentLink(data.order_id, token);
+      }
       setFormMessage("Order created! Redirecting to payment...", "success");
       
-      window.location.href = data.payment_url;
+      window.location.href = paymentUrl;
 
   } catch (error) {
       setFormMessage(error.message, "error");
@@ -1144,14 +1224,81 @@ async function handlePlaceOrder() {
   }
 }
 
+// One key per order body: retries and reloads of the same checkout replay the first
+// response instead of placing a second order, while a changed cart gets a fresh key.
+function checkoutIdempotencyKey(body) {
+  try {
+      const saved = JSON.parse(sessionStorage.getItem("checkoutAttempt"));
+      if (saved && saved.body === body) return saved.key;
+  } catch (e) {
+      sessionStorage.removeItem("checkoutAttempt");
+  }
+  const key = window.crypto && crypto.randomUUID
+      ? crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+  sessionStorage.setItem("checkoutAttempt", JSON.stringify({ key, body }));
+  return key;
+}
+
+// Retries dropped connections and "still processing" answers with the same key.
+async function postOrder(body, idempotencyKey, token, attempts = 3) {
+  for (let attempt = 1; ; attempt++) {
+      try {
+          const response = await fetch(`${API_URL}/orders/create`, {
+              method: 'POST',
+              headers: {
+                  'Content-Type': 'application/json',
+                  'Authorization': `Bearer ${token}`,
+                  'Idempotency-Key': idempotencyKey
+              },
+              body: body
+          });
+          if (response.status !== 409 || attempt >= attempts) return response;
+          const data = await response.clone().json().catch(() => ({}));
+          if (data.code !== "idempotency_in_progress") return response;
+      } catch (networkError) {
+          if (attempt >= attempts) throw networkError;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000 * attempt));
+  }
+}
+
+// Long-polls the payment link of an order placed while payment links are created in the background.
+async function waitForPaymentLink(orderId, token, timeoutMs = 60000) {
+  const deadline = Date.now() + timeoutMs;
+  while (Date.now() < deadline) {
+      const response = await fetch(`${API_URL}/orders/${encodeURIComponent(orderId)}/payment-link?wait=10`, {
+          headers: { 'Authorization': `Bearer ${token}` }
+      });
+      const data = await response.json().catch(() => ({}));
+      if (!response.ok) {
+          throw new Error(data.error || `Server error: ${response.status}`);
+      }
+      if (data.status === "failed") {
+          throw new Error(data.error);
+      }
+      if (data.payment_url) {
+          return data.payment_url;
+      }
+      const retryAfter = Number(response.headers.get("Retry-After")) || 1;
+      await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+  }
+  // Still not ready: the order is saved, so send the customer to it instead of failing checkout.
+  return `my-orders.html?order_id=${encodeURIComponent(orderId)}`;
+}
+
 // --- MY ORDERS PAGE ---
-async function loadMyOrders() {
+async function loadMyOrders(cursor = null) {
   const container = document.getElementById("orders-list-container");
-  container.innerHTML = "<p>Loading your orders...</p>";
+  const loadMoreButton = document.getElementById("load-more-my-orders");
+  if (loadMoreButton) loadMoreButton.remove();
+  if (!cursor) container.innerHTML = "<p>Loading your orders...</p>";
   
   try {
       const token = getToken();
-      const response = await fetch(`${API_URL}/orders/my-orders`, {
+      const url = new URL(`${API_URL}/orders/my-orders`);
+      if (cursor) url.searchParams.append("cursor", cursor);
+      const response = await fetch(url, {
           headers: { 'Authorization': `Bearer ${token}` }
       });
       if (response.status === 401) {
@@ -1161,12 +1308,13 @@ async function loadMyOrders() {
       if (!response.ok) throw new Error("Failed to fetch orders");
       
       const orders = await response.json();
-      if (orders.length === 0) {
+      const nextCursor = response.headers.get("X-Next-Cursor");
+      if (!cursor && orders.length === 0) {
           container.innerHTML = "<p>You have not placed any orders yet.</p>";
           return;
       }
 
-      container.innerHTML = "";
+      if (!cursor) container.innerHTML = "";
       orders.forEach(order => {
           const orderCard = document.createElement("div");
           orderCard.className = "order-card";
@@ -1225,6 +1373,15 @@ async function loadMyOrders() {
           container.appendChild(orderCard);
       });
 
+      if (nextCursor) {
+          const moreButton = document.createElement("button");
+          moreButton.id = "load-more-my-orders";
+          moreButton.className = "cta-button";
+          moreButton.textContent = "Load older orders";
+          moreButton.addEventListener("click", () => loadMyOrders(nextCursor));
+          container.appendChild(moreButton);
+      }
+
   } catch (error) {
       container.innerHTML = `<p class="form-message-error">Error: ${error.message}</p>`;
   }
@@ -1267,36 +1424,3 @@ function setFormMessage(message, type = "success") {
   msgEl.className = `form-message ${type === 'error' ? 'form-message-error' : 'form-message-success'}`;
   msgEl.style.display = message ? "block" : "none";
 }
-
-// --- ADMIN FUNCTIONS ---
-// Example: Fetch all orders for admin dashboard
-// Usage: Call this function where admin wants to view all orders
-async function loadAdminOrders() {
-  // Assumes there is a container with id "admin-orders-list"
-  const container = document.getElementById("admin-orders-list");
-  if (!container) return;
-  container.innerHTML = "<p>Loading all orders...</p>";
-  try {
-      const response = await adminFetch(`${API_URL}/admin/orders`);
-      if (!response.ok) throw new Error("Failed to fetch admin orders");
-      const orders = await response.json();
-      if (orders.length === 0) {
-          container.innerHTML = "<p>No orders found.</p>";
-          return;
-      }
-      container.innerHTML = "";
-      orders.forEach(order => {
-          const orderDiv = document.createElement("div");
-          orderDiv.className = "admin-order-card";
-          orderDiv.innerHTML = `
-              <h4>Order ID: ${order.order_id}</h4>
-              <p>Status: ${order.status}</p>
-              <p>Total: ₹${order.total_amount.toFixed(2)}</p>
-              <p>Placed on: ${new Date(order.created_at).toLocaleString()}</p>
-          `;
-          container.appendChild(orderDiv);
-      });
-  } catch (err) {
-      container.innerHTML = `<p class="form-message-error">Error: ${err.message}</p>`;
-  }
-}
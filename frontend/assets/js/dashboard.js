@@ -50,45 +50,28 @@ function logout() {
 }
 
 // === DASHBOARD OVERVIEW ===
+// Sales figures come from the server-side daily rollups, so a load costs one request
+// per panel regardless of how many orders the store has taken.
 async function loadDashboardOverview() {
+  const periodSelect = document.getElementById("analytics-period");
+  const days = periodSelect ? periodSelect.value : "30";
+
   try {
-    const [ordersResponse, productsResponse] = await Promise.all([
-      fetch(`${API_URL}/admin/orders`, {
-        headers: getAdminHeaders(),
-      }),
-      fetch(`${API_URL}/products`),
-    ]);
-
-    if (!ordersResponse.ok) {
-      throw new Error("Failed to fetch orders");
-    }
+    const [summary, revenue, topProducts, coupons, productsResponse] =
+      await Promise.all([
+        fetchAnalytics("summary", { days }),
+        fetchAnalytics("revenue", { days }),
+        fetchAnalytics("top-products", { days, limit: "10" }),
+        fetchAnalytics("coupons", { days }),
+        fetch(`${API_URL}/products`),
+      ]);
 
     if (!productsResponse.ok) {
       throw new Error("Failed to fetch products");
     }
 
-    const orders = await ordersResponse.json();
     const products = await productsResponse.json();
 
-    const paidOrders = orders.filter(
-      (order) => order.payment_status === "Paid"
-    );
-
-    const totalSales = paidOrders.reduce((total, order) => {
-      const itemsSold = (order.items || []).reduce(
-        (itemTotal, item) => itemTotal + Number(item.quantity || 0),
-        0
-      );
-
-      return total + itemsSold;
-    }, 0);
-
-    const totalRevenue = paidOrders.reduce(
-      (total, order) => total + Number(order.total_amount || 0),
-      0
-    );
-
-    const totalOrders = orders.length;
     const totalProducts = products.length;
 
     const lowStockProducts = products.filter((product) => {
@@ -100,24 +83,99 @@ async function loadDashboardOverview() {
       (product) => Number(product.quantity || 0) <= 0
     ).length;
 
-    setDashboardValue("total-sales", totalSales);
+    setDashboardValue("total-sales", summary.items_sold);
+    setDashboardValue("total-revenue", formatRupees(summary.revenue));
+    setDashboardValue("total-orders", summary.orders);
     setDashboardValue(
-      "total-revenue",
-      `₹${totalRevenue.toLocaleString("en-IN", {
-        minimumFractionDigits: 2,
-        maximumFractionDigits: 2,
-      })}`
+      "average-order-value",
+      formatRupees(summary.average_order_value)
     );
-    setDashboardValue("total-orders", totalOrders);
     setDashboardValue("total-products", totalProducts);
     setDashboardValue("low-stock-products", lowStockProducts);
     setDashboardValue("out-of-stock-products", outOfStockProducts);
+
+    renderRows(
+      "status-counts-body",
+      Object.entries(summary.orders_by_status),
+      ([status, count]) => [status, count],
+      2
+    );
+    renderRows(
+      "revenue-by-day-body",
+      revenue.days.slice().reverse(),
+      (day) => [
+        day.date,
+        day.orders,
+        day.paid_orders,
+        formatRupees(day.net_revenue),
+        formatRupees(day.average_order_value),
+      ],
+      5
+    );
+    renderRows(
+      "top-products-body",
+      topProducts.products,
+      (product) => [
+        product.name || product.product_id,
+        product.quantity,
+        formatRupees(product.revenue),
+      ],
+      3
+    );
+    renderRows(
+      "coupon-redemptions-body",
+      coupons.coupons,
+      (coupon) => [coupon.code, coupon.redemptions, formatRupees(coupon.discount)],
+      3
+    );
   } catch (error) {
     console.error("Failed to load dashboard overview:", error);
     showDashboardError();
   }
 }
 
+async function fetchAnalytics(report, params) {
+  const response = await fetch(
+    `${API_URL}/admin/analytics/${report}?${new URLSearchParams(params)}`,
+    { headers: getAdminHeaders() }
+  );
+
+  if (!response.ok) {
+    throw new Error(`Failed to fetch ${report} analytics`);
+  }
+
+  return response.json();
+}
+
+function formatRupees(amount) {
+  return `₹${Number(amount || 0).toLocaleString("en-IN", {
+    minimumFractionDigits: 2,
+    maximumFractionDigits: 2,
+  })}`;
+}
+
+function renderRows(tbodyId, rows, toCells, columns) {
+  const tbody = document.getElementById(tbodyId);
+  if (!tbody) return;
+
+  tbody.innerHTML = "";
+
+  if (!rows.length) {
+    tbody.innerHTML = `<tr><td colspan="${columns}">No data for this period.</td></tr>`;
+    return;
+  }
+
+  rows.forEach((row) => {
+    const tr = document.createElement("tr");
+    toCells(row).forEach((value) => {
+      const td = document.createElement("td");
+      td.textContent = value;
+      tr.appendChild(td);
+    });
+    tbody.appendChild(tr);
+  });
+}
+
 function setDashboardValue(id, value) {
   const element = document.getElementById(id);
   if (element) {
@@ -130,6 +188,7 @@ function showDashboardError() {
     "total-sales",
     "total-revenue",
     "total-orders",
+    "average-order-value",
     "total-products",
     "low-stock-products",
     "out-of-stock-products",
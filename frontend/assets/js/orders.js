@@ -6,6 +6,16 @@ const ADMIN_KEY = "admineveraura2025";
 
 const API_URL = "https://everaura-backend.vercel.app/api";
 
+// Mirrors backend/order_status.py. "Paid" is only set by payment confirmation.
+const ORDER_STATUS_TRANSITIONS = {
+  Pending: ["Cancelled"],
+  Paid: ["Packaging", "Cancelled"],
+  Packaging: ["Shipped", "Cancelled"],
+  Shipped: ["Delivered"],
+  Delivered: [],
+  Cancelled: [],
+};
+
 
 document.addEventListener("DOMContentLoaded", () => {
   checkAuth();
@@ -45,26 +55,40 @@ function logout() {
 // LOAD ORDERS
 // =====================================================
 
-async function loadAdminOrders() {
+async function loadAdminOrders(cursor = null) {
   const tbody =
     document.getElementById("order-table-body");
 
   if (!tbody) return;
 
 
-  tbody.innerHTML = `
-    <tr>
-      <td colspan="8">
-        Loading orders...
-      </td>
-    </tr>
-  `;
+  const loadMoreRow =
+    document.getElementById("load-more-orders");
+
+  if (loadMoreRow) {
+    loadMoreRow.remove();
+  }
+
+
+  if (!cursor) {
+    tbody.innerHTML = `
+      <tr>
+        <td colspan="9">
+          Loading orders...
+        </td>
+      </tr>
+    `;
+  }
 
 
   try {
 
+    const url = cursor
+      ? `${API_URL}/admin/orders?cursor=${encodeURIComponent(cursor)}`
+      : `${API_URL}/admin/orders`;
+
     const response = await fetch(
-      `${API_URL}/admin/orders`,
+      url,
       {
         headers: getAdminHeaders(),
       }
@@ -80,18 +104,24 @@ async function loadAdminOrders() {
 
     const orders = await response.json();
 
+    const nextCursor =
+      response.headers.get("X-Next-Cursor");
 
-    tbody.innerHTML = "";
+
+    if (!cursor) {
+      tbody.innerHTML = "";
+    }
 
 
     if (
-      !Array.isArray(orders) ||
-      orders.length === 0
+      !cursor &&
+      (!Array.isArray(orders) ||
+        orders.length === 0)
     ) {
 
       tbody.innerHTML = `
         <tr>
-          <td colspan="8">
+          <td colspan="9">
             No orders found.
           </td>
         </tr>
@@ -129,14 +159,12 @@ async function loadAdminOrders() {
       const customerPhone = address.phone || "N/A";
 
 
-      const statusOptions = [
-        "Pending",
-        "Paid",
-        "Packaging",
-        "Shipped",
-        "Delivered",
-        "Cancelled",
-      ]
+      const currentStatus = order.status || "Pending";
+
+      const nextStatuses =
+        ORDER_STATUS_TRANSITIONS[currentStatus] || [];
+
+      const statusOptions = [currentStatus, ...nextStatuses]
         .map(
           (status) => `
             <option
@@ -165,6 +193,15 @@ async function loadAdminOrders() {
       tbody.innerHTML += `
         <tr>
 
+          <td data-label="Select">
+            <input
+              type="checkbox"
+              class="order-select"
+              value="${order.order_id}"
+            >
+          </td>
+
+
           <td data-label="Order ID">
             ${order.order_id || "N/A"}
           </td>
@@ -207,6 +244,7 @@ async function loadAdminOrders() {
 
           <td data-label="Payment">
             ${order.payment_status || "N/A"} / ${order.status || "N/A"}
+            ${order.refund_status === "required" ? "<br><strong>Refund due</strong>" : ""}
           </td>
 
 
@@ -214,6 +252,7 @@ async function loadAdminOrders() {
 
             <select
               class="admin-select"
+              ${nextStatuses.length ? "" : "disabled"}
               onchange="
                 handleUpdateStatus(
                   '${order.order_id}',
@@ -256,6 +295,22 @@ async function loadAdminOrders() {
     });
 
 
+    if (nextCursor) {
+      tbody.innerHTML += `
+        <tr id="load-more-orders">
+          <td colspan="9">
+            <button
+              class="admin-button-small"
+              onclick="loadAdminOrders('${nextCursor}')"
+            >
+              Load more orders
+            </button>
+          </td>
+        </tr>
+      `;
+    }
+
+
   } catch (error) {
 
     console.error(
@@ -266,7 +321,7 @@ async function loadAdminOrders() {
 
     tbody.innerHTML = `
       <tr>
-        <td colspan="8">
+        <td colspan="9">
           Error loading orders: ${error.message}
         </td>
       </tr>
@@ -316,8 +371,11 @@ async function handleUpdateStatus(
 
     if (!response.ok) {
 
+      const error =
+        await response.json().catch(() => ({}));
+
       throw new Error(
-        "Failed to update status"
+        error.error || "Failed to update status"
       );
 
     }
@@ -340,7 +398,7 @@ async function handleUpdateStatus(
 
 
     alert(
-      "Failed to update status."
+      `Failed to update status: ${error.message}`
     );
 
 
@@ -424,3 +482,115 @@ async function handleAddTracking(orderId) {
 
   }
 }
+
+
+// =====================================================
+// BULK UPDATE
+// =====================================================
+
+function toggleAllOrders(checked) {
+  document
+    .querySelectorAll(".order-select")
+    .forEach((checkbox) => {
+      checkbox.checked = checked;
+    });
+}
+
+
+// Applies the chosen status, plus any tracking links typed into the
+// selected rows, to every selected order in a single request.
+async function handleBulkUpdate() {
+
+  const status =
+    document.getElementById("bulk-status").value;
+
+  const selected = Array.from(
+    document.querySelectorAll(".order-select:checked")
+  ).map((checkbox) => checkbox.value);
+
+
+  if (!selected.length) {
+    alert("Select at least one order first.");
+    return;
+  }
+
+
+  const updates = selected
+    .map((orderId) => {
+      const trackingInput =
+        document.getElementById(`tracking-${orderId}`);
+
+      const trackingLink =
+        trackingInput && trackingInput.value.trim() !== trackingInput.defaultValue
+          ? trackingInput.value.trim()
+          : "";
+
+      const update = { order_id: orderId };
+      if (status) update.status = status;
+      if (trackingLink) update.tracking_link = trackingLink;
+      return update;
+    })
+    .filter((update) => update.status || update.tracking_link);
+
+
+  if (!updates.length) {
+    alert("Choose a status or enter tracking links for the selected orders.");
+    return;
+  }
+
+
+  const confirmed = confirm(
+    `Update ${updates.length} order(s)${status ? ` to "${status}"` : ""}?`
+  );
+
+  if (!confirmed) return;
+
+
+  try {
+
+    const response = await fetch(
+      `${API_URL}/admin/orders/bulk-update`,
+      {
+        method: "POST",
+
+        headers: getAdminHeaders(),
+
+        body: JSON.stringify({ updates }),
+      }
+    );
+
+
+    const result = await response.json();
+
+    if (!response.ok) {
+      throw new Error(
+        result.error || "Failed to update orders"
+      );
+    }
+
+
+    const failures = result.failed
+      .map((failure) => `${failure.order_id}: ${failure.error}`)
+      .join("\n");
+
+    alert(
+      `${result.updated.length} order(s) updated. Customers will be notified.` +
+        (failures ? `\n\nNot updated:\n${failures}` : "")
+    );
+
+
+    loadAdminOrders();
+
+  } catch (error) {
+
+    console.error(
+      "Error applying bulk update:",
+      error
+    );
+
+    alert(
+      `Failed to update orders: ${error.message}`
+    );
+
+  }
+}
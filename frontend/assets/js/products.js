@@ -77,10 +77,16 @@ async function loadProductsIntoTable() {
         return 0;
       })
       .forEach((product) => {
-        const imageUrl =
-          product.images && product.images.length > 0
-            ? product.images[0]
-            : "";
+        const thumbnail =
+          product.image_variants &&
+          product.image_variants[0] &&
+          product.image_variants[0].thumb;
+
+        const imageUrl = thumbnail
+          ? thumbnail.webp || thumbnail.avif
+          : product.images && product.images.length > 0
+          ? product.images[0]
+          : "";
 
         const genderDisplay =
           product.gender === "0"
@@ -529,7 +535,7 @@ function createProductForm(product = {}) {
           <div class="form-group">
 
             <label for="product-image">
-              Product Image (Primary)
+              Product Images (first one is primary)
             </label>
 
             <input
@@ -537,6 +543,7 @@ function createProductForm(product = {}) {
               id="product-image"
               name="image"
               accept="image/*"
+              multiple
               required
             >
 
@@ -938,11 +945,12 @@ async function handleFormSubmit(editId) {
         : "n"
     );
 
-    body.append(
-      "images",
+    Array.from(
       document.getElementById(
         "product-image"
-      ).files[0]
+      ).files
+    ).forEach((file) =>
+      body.append("images", file)
     );
 
     body.append("rsn", rsn);
@@ -980,10 +988,13 @@ async function handleFormSubmit(editId) {
 
     closeProductModal();
 
+    // New products answer 202: images are resized in the background.
     alert(
-      `Product ${
-        isEdit ? "updated" : "added"
-      } successfully!`
+      response.status === 202
+        ? "Product added! Images are still processing and will appear shortly."
+        : `Product ${
+            isEdit ? "updated" : "added"
+          } successfully!`
     );
 
   } catch (error) {